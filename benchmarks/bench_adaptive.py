@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Compare adaptive quadtree refinement with a uniform fine lattice
+
+Evaluates the finest lattice of the quadtree uniformly with evaluate_lattice,
+then refines quadtrees at several thresholds, using a synthetic KNN model (or
+the fallback predictor with --fallback). Reports model evaluations and seconds
+against the uniform lattice, and the AQI error of the rasterized quadtree over
+the whole lattice and within --near-km of the cities. A quadtree refined to the
+finest level everywhere (min_level = --levels) is asserted to reproduce the
+uniform lattice to round-off.
+
+Run from the repository root:
+    python -m benchmarks.bench_adaptive --levels 5 --thresholds 5 10 20
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_knn_model
+from generate_world_heatmap import WORLD_BBOX, get_major_cities, predict_world_aqi
+from heatmap.adaptive import refine_quadtree
+from heatmap.lookup import evaluate_lattice
+from heatmap.sources import haversine_km
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base-deg', type=float, default=4.0)
+    parser.add_argument('--levels', type=int, default=4)
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[5, 10, 20])
+    parser.add_argument('--bbox', type=float, nargs=4, default=list(WORLD_BBOX),
+                        metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'))
+    parser.add_argument('--near-km', type=float, default=300,
+                        help='Radius around each city for the hotspot error')
+    parser.add_argument('--train', type=int, default=5000,
+                        help='Training points of the synthetic KNN model')
+    parser.add_argument('--fallback', action='store_true',
+                        help='Use the fallback predictor instead of a KNN model')
+    args = parser.parse_args()
+
+    model = None if args.fallback else synthetic_knn_model(n_train=args.train)
+    cities = get_major_cities()
+    bbox = tuple(args.bbox)
+
+    exact = refine_quadtree(model, predict_world_aqi, cities, bbox, args.base_deg, args.levels,
+                            min_level=args.levels)
+    lats, lons = exact.lattice_axes()
+    start = time.perf_counter()
+    uniform = evaluate_lattice(model, predict_world_aqi, lats, lons, cities)[0]
+    uniform_s = time.perf_counter() - start
+    exact_error = np.abs(exact.rasterize(lats, lons) - uniform).max()
+    assert exact_error < 1e-9, f"Fully refined quadtree differs by {exact_error:.2g} AQI"
+
+    city = np.array(list(cities.values()))
+    near = np.zeros(uniform.shape, dtype=bool)
+    for city_lat, city_lon, _ in city:
+        near |= haversine_km(lats[:, None], lons[None, :], city_lat, city_lon) <= args.near_km
+
+    print(f"{len(lons)}x{len(lats)} lattice at {lats[1] - lats[0]:g} deg, "
+          f"{'fallback predictor' if model is None else f'KNN on {args.train:,} points'}")
+    print(f"uniform: {uniform.size:,} evaluations, {uniform_s:.2f}s; "
+          f"fully refined quadtree differs from it by at most {exact_error:.2g} AQI")
+    print(f"{'threshold':>9} {'evaluations':>12} {'share':>7} {'seconds':>8} {'leaves':>8} "
+          f"{'mean |dAQI|':>12} {'p99 |dAQI|':>11} {'near-city mean':>15}")
+    for threshold in sorted(args.thresholds):
+        start = time.perf_counter()
+        tree = refine_quadtree(model, predict_world_aqi, cities, bbox, args.base_deg,
+                               args.levels, threshold)
+        elapsed = time.perf_counter() - start
+        error = np.abs(tree.rasterize(lats, lons) - uniform)
+        print(f"{threshold:>9g} {tree.evaluations:>12,} {tree.evaluations / uniform.size:>6.1%} "
+              f"{elapsed:>8.2f} {tree.n_leaves:>8,} {error.mean():>12.3f} "
+              f"{np.percentile(error, 99):>11.2f} {error[near].mean():>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Measure source catalogue loading, bbox filtering and marker rendering
+
+Writes a synthetic catalogue of --sources points clustered around the major
+cities as CSV and GeoJSON, then reports load time for each format, the bbox
+filter against a full-array mask, the city-influence time of a bbox window
+with the whole catalogue versus only the sources in reach (checked identical),
+and drawing markers with one scatter call versus one ax.plot per source.
+
+Run from the repository root:
+    python -m benchmarks.bench_catalogue --sources 400000
+"""
+
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_catalogue
+from generate_world_heatmap import get_major_cities, world_axes
+from heatmap.catalogue import SourceCatalogue
+from heatmap.rasters import bbox_window
+from heatmap.sources import DEFAULT_RADIUS_KM, source_influence
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def write_catalogue(records, tmp):
+    csv_path = os.path.join(tmp, 'sources.csv')
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'kind', 'lat', 'lon', 'level'])
+        writer.writerows(records.tolist())
+    geojson_path = os.path.join(tmp, 'sources.geojson')
+    features = [{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                 'properties': {'name': name, 'kind': kind, 'level': level}}
+                for name, kind, lat, lon, level in records.tolist()]
+    with open(geojson_path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+    return csv_path, geojson_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sources', type=int, default=100000)
+    parser.add_argument('--bbox', type=float, nargs=4, default=[25, 40, 110, 125],
+                        metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'))
+    parser.add_argument('--influence-sources', type=int, default=2000,
+                        help='Catalogue size for the influence comparison (every source is a loop step)')
+    parser.add_argument('--grid-size', type=int, default=720)
+    parser.add_argument('--markers', type=int, default=2000,
+                        help='Sources drawn in the marker comparison')
+    args = parser.parse_args()
+
+    cities = get_major_cities()
+    records = synthetic_catalogue(cities, args.sources)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, geojson_path = write_catalogue(records, tmp)
+        catalogue, csv_s = timed(lambda: SourceCatalogue.load(csv_path))
+        _, geojson_s = timed(lambda: SourceCatalogue.load(geojson_path))
+        print(f"{len(catalogue):,} sources: CSV load {csv_s:.2f}s "
+              f"({os.path.getsize(csv_path) / 1024**2:.1f} MB), GeoJSON load {geojson_s:.2f}s "
+              f"({os.path.getsize(geojson_path) / 1024**2:.1f} MB)")
+
+    lat_min, lat_max, lon_min, lon_max = args.bbox
+    repeat = 100
+    inside, within_s = timed(lambda: [catalogue.within(args.bbox) for _ in range(repeat)])
+    mask, mask_s = timed(lambda: [(catalogue.lats >= lat_min) & (catalogue.lats <= lat_max) &
+                                  (catalogue.lons >= lon_min) & (catalogue.lons <= lon_max)
+                                  for _ in range(repeat)])
+    same = np.array_equal(np.sort(inside[0].records['name']),
+                          np.sort(catalogue.records['name'][mask[0]]))
+    print(f"bbox {args.bbox}: {len(inside[0]):,} sources, within() {within_s / repeat * 1e3:.2f} ms "
+          f"vs full mask {mask_s / repeat * 1e3:.2f} ms, same sources: {same}")
+
+    small = SourceCatalogue(synthetic_catalogue(cities, args.influence_sources, seed=1))
+    lats, lons = world_axes(args.grid_size)
+    rows, cols = bbox_window(lats, lons, args.bbox)
+    reach = small.within(args.bbox, DEFAULT_RADIUS_KM)
+    full, full_s = timed(lambda: source_influence(lats[rows], lons[cols], small))
+    filtered, filtered_s = timed(lambda: source_influence(lats[rows], lons[cols], reach))
+    print(f"influence on the bbox window ({len(small):,} sources, {len(reach):,} in reach): "
+          f"{full_s:.2f}s -> {filtered_s:.2f}s, identical: {np.allclose(full, filtered)}")
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    shown = SourceCatalogue(records[:args.markers])
+    for label, draw in [('ax.plot per source', lambda ax: [ax.plot(lon, lat, 'ko', markersize=3)
+                                                          for lon, lat in zip(shown.lons,
+                                                                              shown.lats)]),
+                        ('one ax.scatter', lambda ax: ax.scatter(shown.lons, shown.lats, s=9,
+                                                                 c='k'))]:
+        fig, ax = plt.subplots(figsize=(10, 6))
+        start = time.perf_counter()
+        draw(ax)
+        fig.canvas.draw()
+        print(f"{len(shown):,} markers with {label}: {time.perf_counter() - start:.2f}s")
+        plt.close(fig)
+
+
+if __name__ == "__main__":
+    main()
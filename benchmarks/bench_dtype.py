@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Compare the float64 and float32 (--dtype) world pipelines
+
+Each mode runs in a fresh subprocess on a synthetic KNN model, so ru_maxrss
+reflects that mode alone. Reports peak memory, runtime and the grid size, and
+how far the compact mode's uint16 AQI grid is from the float64 one: absolute
+error and the share of cells that land in a different AQI category.
+
+Run from the repository root:
+    python -m benchmarks.bench_dtype --grid-size 720 --chunk-rows 64
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import save_model, synthetic_knn_model
+from heatmap.pipeline import DTYPES
+from heatmap.stats import category_index
+
+
+def run_mode(model_path, grid_size, chunk_rows, seed, dtype, out_path):
+    """Predict one world grid with `dtype`, save it, and print seconds and peak RSS"""
+    from generate_world_heatmap import load_model, predict_world_grid, world_axes
+
+    model = load_model(model_path)
+    lats, lons = world_axes(grid_size)
+    start = time.perf_counter()
+    grid = predict_world_grid(model, lats, lons, chunk_rows or None, seed, dtype=dtype)
+    elapsed = time.perf_counter() - start
+    np.save(out_path, grid)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"RESULT {elapsed:.3f} {peak_mb:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grid-size', type=int, default=720)
+    parser.add_argument('--chunk-rows', type=int, default=0,
+                        help='Stream in bands of this many rows (0: whole grid)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--child', nargs=3, metavar=('MODEL', 'DTYPE', 'OUT'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.child[0], args.grid_size, args.chunk_rows, args.seed, args.child[1],
+                 args.child[2])
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = save_model(synthetic_knn_model(), os.path.join(tmp, 'model.joblib'))
+        results = {}
+        for dtype in ('float64', 'float32'):
+            out_path = os.path.join(tmp, f"grid_{dtype}.npy")
+            proc = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_dtype',
+                 '--grid-size', str(args.grid_size), '--chunk-rows', str(args.chunk_rows),
+                 '--seed', str(args.seed), '--child', model_path, dtype, out_path],
+                capture_output=True, text=True, check=True)
+            line = [l for l in proc.stdout.splitlines() if l.startswith('RESULT')][-1]
+            elapsed, peak_mb = map(float, line.split()[1:])
+            results[dtype] = (elapsed, peak_mb, np.load(out_path))
+
+    reference = results['float64'][2]
+    mode = f"bands of {args.chunk_rows} rows" if args.chunk_rows else 'whole grid'
+    print(f"grid {reference.shape[1]}x{reference.shape[0]} ({reference.size:,} cells, {mode})")
+    print(f"{'dtype':>8} {'grid':>14} {'seconds':>9} {'peak MB':>9} {'grid MB':>8}")
+    for dtype, (elapsed, peak_mb, grid) in results.items():
+        feature_dtype, grid_dtype = DTYPES[dtype]
+        label = f"{np.dtype(feature_dtype).name}/{np.dtype(grid_dtype).name}"
+        print(f"{dtype:>8} {label:>14} {elapsed:>9.2f} {peak_mb:>9.1f} "
+              f"{grid.nbytes / 1024**2:>8.1f}")
+
+    compact = results['float32'][2]
+    error = np.abs(compact.astype(np.float64) - reference)
+    changed = np.count_nonzero(category_index(compact) != category_index(reference))
+    print(f"\nfloat32 vs float64: max |dAQI| {error.max():.3f}, mean |dAQI| {error.mean():.3f}, "
+          f"category changes {changed:,} cells ({changed / reference.size:.4%})")
+    base_s, base_mb = results['float64'][:2]
+    print(f"runtime {results['float32'][0] / base_s - 1:+.1%}, "
+          f"peak RSS {results['float32'][1] - base_mb:+.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
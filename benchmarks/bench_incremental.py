@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Time simulator-style source edits through WorldGridState against full rebuilds
+
+Every edit is checked to be bit-identical to building the grid from scratch with
+the edited source table.
+
+Run from the repository root:
+    python -m benchmarks.bench_incremental --grid-size 1800 --radius-km 1000
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from generate_world_heatmap import get_major_cities, predict_world_aqi, world_axes
+from heatmap.incremental import WorldGridState
+from heatmap.sources import DEFAULT_RADIUS_KM
+
+EDITS = [
+    ('add factory near Dallas', 'Dallas Plant', (32.78, -96.80, 160)),
+    ('raise Beijing intensity', 'Beijing', (39.9042, 116.4074, 250)),
+    ('move Lagos inland', 'Lagos', (7.5, 4.5, 120)),
+    ('remove Delhi', 'Delhi', None),
+    ('add source on the antimeridian', 'Fiji Smelter', (-17.7, 179.9, 140)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grid-size', type=int, default=1800)
+    parser.add_argument('--radius-km', type=float, default=DEFAULT_RADIUS_KM)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    lats, lons = world_axes(args.grid_size)
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    with quiet:
+        start = time.perf_counter()
+        state = WorldGridState(None, predict_world_aqi, lats, lons, get_major_cities(),
+                               seed=args.seed, radius_km=args.radius_km)
+        full_s = time.perf_counter() - start
+    print(f"grid {len(lons)}x{len(lats)}, radius {args.radius_km:.0f} km, "
+          f"full build {full_s * 1000:.0f} ms")
+    print(f"{'edit':<32} {'cells':>10} {'update ms':>10} {'rebuild ms':>11} {'identical':>10}")
+
+    for label, name, source in EDITS:
+        with quiet:
+            start = time.perf_counter()
+            windows = state.update_source(name, source)
+            update_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            rebuilt = WorldGridState(None, predict_world_aqi, lats, lons, state.sources,
+                                     seed=args.seed, radius_km=args.radius_km)
+            rebuild_s = time.perf_counter() - start
+
+        cells = sum((rows.stop - rows.start) * (cols.stop - cols.start) for rows, cols in windows)
+        identical = np.array_equal(state.aqi, rebuilt.aqi)
+        print(f"{label:<32} {cells:>10,} {update_s * 1000:>10.1f} {rebuild_s * 1000:>11.0f} "
+              f"{str(identical):>10}")
+        if not identical:
+            raise SystemExit(f"Incremental update diverged from a full rebuild after: {label}")
+
+
+if __name__ == "__main__":
+    main()
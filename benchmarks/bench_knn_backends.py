@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Compare the heatmap.knn backends with the exact KNN model
+
+Runs two synthetic KNeighborsRegressors over the same world grid: a haversine
+station model queried at the cell coordinates, like the geographic model, and a
+model on the 8 world feature columns (or a fitted --model). Reports, per
+backend, build and query time, throughput, recall of the exact k neighbours,
+and the AQI error and category changes of its predictions. The grid backend
+only serves haversine models, so it runs on the station model alone, where its
+recall is asserted against --min-recall.
+
+Run from the repository root:
+    python -m benchmarks.bench_knn_backends --grid-size 720 --train 50000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_knn_model, synthetic_station_model, world_features
+from generate_world_heatmap import get_major_cities, world_axes
+from heatmap.knn import BallTreeBackend, GridBucketBackend
+from heatmap.stats import category_index
+
+
+def recall(indices, reference):
+    """Share of the reference neighbour ids found, row by row"""
+    hits = sum(np.count_nonzero((indices[:, [j]] == reference).any(axis=1))
+               for j in range(indices.shape[1]))
+    return hits / reference.size
+
+
+def compare(model, queries, grid_options, min_recall=0.0):
+    """
+    Print one table row per backend for `model` queried at `queries`, failing
+    if a grid backend finds fewer than `min_recall` of the exact neighbours
+    """
+    n_points = len(queries)
+    start = time.perf_counter()
+    _, reference_ids = model.kneighbors(queries)
+    reference = model.predict(queries)
+    exact_s = time.perf_counter() - start
+    reference_categories = category_index(reference)
+    print(f"{n_points:,} query points, {len(model._fit_X):,} training points, "
+          f"k={model.n_neighbors}, {model.effective_metric_} metric, "
+          f"sklearn algorithm {model._fit_method!r}")
+    print(f"{'backend':>16} {'build s':>8} {'query s':>8} {'points/s':>11} {'speedup':>8} "
+          f"{'recall':>7} {'max |dAQI|':>11} {'mean |dAQI|':>12} {'cat. changes':>13}")
+    print(f"{'exact':>16} {'-':>8} {exact_s:>8.2f} {n_points / exact_s:>11,.0f} {1.0:>7.2f}x "
+          f"{1.0:>7.3f} {0.0:>11.2f} {0.0:>12.3f} {0:>12.2%}")
+
+    backends = [('balltree', lambda: BallTreeBackend(model))]
+    backends += [(f"grid/{n}/ring{ring}",
+                  lambda n=n, ring=ring: GridBucketBackend(model, points_per_bucket=n,
+                                                           max_ring=ring))
+                 for n, ring in grid_options]
+    for label, build in backends:
+        start = time.perf_counter()
+        backend = build()
+        build_s = time.perf_counter() - start
+
+        # Both passes are timed, matching the exact kneighbors + predict above
+        start = time.perf_counter()
+        _, ids = backend.kneighbors(queries)
+        predictions = backend.predict(queries)
+        query_s = time.perf_counter() - start
+
+        error = np.abs(predictions - reference)
+        changed = np.count_nonzero(category_index(predictions) != reference_categories)
+        print(f"{label:>16} {build_s:>8.2f} {query_s:>8.2f} {n_points / query_s:>11,.0f} "
+              f"{exact_s / query_s:>7.2f}x {recall(ids, reference_ids):>7.3f} "
+              f"{error.max():>11.2f} {error.mean():>12.3f} {changed / n_points:>12.2%}")
+        if label.startswith('grid'):
+            assert recall(ids, reference_ids) >= min_recall, \
+                f"{label} recall below {min_recall}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grid-size', type=int, default=720)
+    parser.add_argument('--train', type=int, default=20000,
+                        help='Training points of the synthetic models')
+    parser.add_argument('--model', default=None,
+                        help='Fitted joblib KNeighborsRegressor on world features')
+    parser.add_argument('--grid', type=int, nargs=2, action='append', metavar=('PER_BUCKET', 'RING'),
+                        help='Grid backend settings to try (default: 16 1, 32 2, 64 4)')
+    parser.add_argument('--min-recall', type=float, default=0.9,
+                        help='Smallest grid backend recall accepted on the station model')
+    args = parser.parse_args()
+    grid_options = args.grid or [(16, 1), (32, 2), (64, 4)]
+
+    cities = get_major_cities()
+    lats, lons = world_axes(args.grid_size)
+    lon_grid, lat_grid = np.broadcast_arrays(lons[None, :], lats[:, None])
+
+    print("== Station model: haversine KNN on (lat, lon), queried at grid cells ==")
+    stations = synthetic_station_model(cities, n_stations=args.train)
+    compare(stations, np.radians(np.column_stack([lat_grid.ravel(), lon_grid.ravel()])),
+            grid_options, args.min_recall)
+
+    print("\n== Feature model: euclidean KNN on the 8 world feature columns ==")
+    if args.model:
+        import joblib
+        model = joblib.load(args.model)
+    else:
+        model = synthetic_knn_model(n_train=args.train)
+    compare(model, world_features(args.grid_size, cities), grid_options=[])
+
+
+if __name__ == "__main__":
+    main()
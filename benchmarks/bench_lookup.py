@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Measure the accuracy and query speed of compiled AQI lookups
+
+Compiles a synthetic KNN model into lookups at several lattice spacings, then
+compares them with the model evaluated directly on an off-lattice world grid
+(same expected-noise features). Reports the lookup size, the AQI error and
+category changes, scalar point() latency, vectorized query() throughput, and
+the model's own cost per point. A fresh interpreter checks that loading and
+querying a lookup does not import sklearn, and a coarse lookup compiled with
+unsorted weather levels must answer like one compiled with them sorted.
+
+Run from the repository root:
+    python -m benchmarks.bench_lookup --resolutions 1 0.5 0.25
+"""
+
+import argparse
+import functools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_knn_model
+from generate_world_heatmap import get_major_cities, predict_world_aqi, world_axes
+from heatmap.lookup import compile_lookup, evaluate_lattice, lattice_axes
+from heatmap.stats import category_index
+
+SKLEARN_CHECK = """
+import sys
+from heatmap.lookup import AQILookup
+lookup = AQILookup.load(sys.argv[1])
+lookup.point(32.7767, -96.7970)
+lookup.area((32.5, 33.0, -97.2, -96.5))
+print('sklearn' in sys.modules or 'joblib' in sys.modules)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--resolutions', type=float, nargs='+', default=[1, 0.5, 0.25])
+    parser.add_argument('--grid-size', type=int, default=720,
+                        help='World grid the lookups are checked against')
+    parser.add_argument('--points', type=int, default=20000,
+                        help='Random points for the latency measurements')
+    args = parser.parse_args()
+
+    model = synthetic_knn_model()
+    predict = functools.partial(predict_world_aqi, predictor=None)
+    cities = get_major_cities()
+
+    # Offset the check grid by a fraction of a cell so it falls between lattice nodes
+    lats, lons = world_axes(args.grid_size)
+    lats = np.clip(lats + 0.37 * (lats[1] - lats[0]), -90, 90)
+    lons = np.clip(lons + 0.37 * (lons[1] - lons[0]), -180, 180)
+    start = time.perf_counter()
+    reference = evaluate_lattice(model, predict, lats, lons, cities)[0]
+    model_us = (time.perf_counter() - start) / reference.size * 1e6
+    categories = category_index(reference)
+
+    rng = np.random.default_rng(0)
+    point_lats = rng.uniform(-90, 90, args.points)
+    point_lons = rng.uniform(-180, 180, args.points)
+
+    print(f"check grid {len(lons)}x{len(lats)}; model (features + KNN): {model_us:.2f} us/point")
+    print(f"{'spacing':>8} {'lattice':>11} {'compile s':>10} {'MB':>6} {'max |dAQI|':>11} "
+          f"{'mean |dAQI|':>12} {'cat. changes':>13} {'point us':>9} {'query pts/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for resolution in args.resolutions:
+            lattice_lats, lattice_lons = lattice_axes(resolution)
+            start = time.perf_counter()
+            lookup = compile_lookup(model, predict, lattice_lats, lattice_lons, cities)
+            compile_s = time.perf_counter() - start
+            path = lookup.save(os.path.join(tmp, f"lookup_{resolution:g}.npz"))
+
+            grid = lookup.grid(lats, lons)
+            error = np.abs(grid - reference)
+            changed = np.count_nonzero(category_index(grid) != categories)
+
+            start = time.perf_counter()
+            for lat, lon in zip(point_lats.tolist(), point_lons.tolist()):
+                lookup.point(lat, lon)
+            point_us = (time.perf_counter() - start) / args.points * 1e6
+            start = time.perf_counter()
+            lookup.query(point_lats, point_lons)
+            query_rate = args.points / (time.perf_counter() - start)
+
+            print(f"{resolution:>7g}° {lookup.n_lons:>5}x{lookup.n_lats:<5} {compile_s:>10.2f} "
+                  f"{os.path.getsize(path) / 1024**2:>6.1f} {error.max():>11.2f} "
+                  f"{error.mean():>12.3f} {changed / reference.size:>12.2%} {point_us:>9.2f} "
+                  f"{query_rate:>12,.0f}")
+
+        proc = subprocess.run([sys.executable, '-c', SKLEARN_CHECK, path],
+                              capture_output=True, text=True, check=True)
+        print(f"\nsklearn/joblib imported by a lookup-only process: {proc.stdout.strip()}")
+
+    lattice_lats, lattice_lons = lattice_axes(5)
+    ascending, shuffled = (compile_lookup(model, predict, lattice_lats, lattice_lons, cities,
+                                          levels)
+                           for levels in ([-10.0, 0.0, 10.0], [10.0, -10.0, 0.0]))
+    same = all(np.array_equal(ascending.query(point_lats, point_lons, weather),
+                              shuffled.query(point_lats, point_lons, weather))
+               for weather in (-12.0, -4.0, 0.0, 3.5, 12.0))
+    print(f"unsorted weather levels answer like sorted ones: {same}")
+
+
+if __name__ == "__main__":
+    main()
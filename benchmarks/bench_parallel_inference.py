@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Measure KNN inference throughput on the process pool at several worker counts
+
+Uses a synthetic KNeighborsRegressor unless --model points at a fitted one.
+
+Run from the repository root:
+    python -m benchmarks.bench_parallel_inference --grid-size 720
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import save_model, synthetic_knn_model, world_features
+from generate_world_heatmap import get_major_cities
+from heatmap.parallel import ParallelPredictor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grid-size', type=int, default=720)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--model', default=None, help='Fitted joblib model to benchmark')
+    parser.add_argument('--tile-rows', type=int, default=4096)
+    args = parser.parse_args()
+
+    features = world_features(args.grid_size, get_major_cities())
+    n_points = len(features)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.model:
+            import joblib
+            model_path, model = args.model, joblib.load(args.model)
+        else:
+            model = synthetic_knn_model()
+            model_path = save_model(model, os.path.join(tmp, 'model.joblib'))
+
+        start = time.perf_counter()
+        reference = model.predict(features)
+        serial_s = time.perf_counter() - start
+        print(f"{n_points:,} query points, {os.cpu_count()} CPUs available")
+        print(f"{'workers':>8} {'seconds':>9} {'points/s':>12} {'speedup':>8}")
+        print(f"{'serial':>8} {serial_s:>9.2f} {n_points / serial_s:>12,.0f} {1.0:>7.2f}x")
+
+        for workers in args.workers:
+            with ParallelPredictor(model_path, workers, n_points, features.shape[1],
+                                   tile_rows=args.tile_rows) as predictor:
+                # Warm the pool so worker start-up and model loading are not timed
+                predictor.predict(features[:workers])
+                start = time.perf_counter()
+                predictions = predictor.predict(features)
+                elapsed = time.perf_counter() - start
+            if not np.allclose(predictions, reference):
+                raise SystemExit(f"Parallel predictions differ from serial at {workers} workers")
+            print(f"{workers:>8} {elapsed:>9.2f} {n_points / elapsed:>12,.0f} "
+                  f"{serial_s / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Measure regional figure throughput and memory for a batch of maps
+
+Compares the original pattern (a fresh pyplot figure per region, never closed)
+with the reusable Agg figure template, serially and on worker processes.
+
+Run from the repository root:
+    python -m benchmarks.bench_render --regions 500
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from generate_heatmap_fixed import create_aqi_colormap
+from heatmap.render import render_regions, summary_text, use_agg
+
+
+def rss_mb():
+    """Current resident set size of this process"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def synthetic_regions(count, grid_size, seed=0):
+    """(aqi_grid, bbox, label) for `count` random metro-sized regions"""
+    rng = np.random.default_rng(seed)
+    regions = []
+    for i in range(count):
+        lat, lon = rng.uniform(-50, 60), rng.uniform(-170, 170)
+        bbox = (lat, lat + 0.5, lon, lon + 0.7)
+        aqi_grid = np.clip(rng.gamma(4, 18, (grid_size, grid_size)), 0, 400)
+        regions.append((aqi_grid, bbox, f"Region {i:03d}"))
+    return regions
+
+
+def legacy_render(regions, out_dir, dpi):
+    """One new pyplot figure per region, left open like the original script"""
+    import matplotlib.pyplot as plt
+
+    cmap, norm, _ = create_aqi_colormap()
+    for aqi_grid, (lat_min, lat_max, lon_min, lon_max), label in regions:
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
+        im = ax1.imshow(aqi_grid, extent=[lon_min, lon_max, lat_min, lat_max], cmap=cmap,
+                        norm=norm, origin='lower', aspect='auto')
+        ax1.set_title(f"Air Quality Index (AQI) Heatmap\n{label}", fontsize=14,
+                      fontweight='bold')
+        plt.colorbar(im, ax=ax1, shrink=0.8)
+        ax2.axis('off')
+        ax2.text(0.1, 0.35, summary_text(aqi_grid, label), fontsize=10, va='top')
+        plt.tight_layout()
+        plt.savefig(os.path.join(out_dir, f"{label}.png"), dpi=dpi)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--regions', type=int, default=500)
+    parser.add_argument('--grid-size', type=int, default=50)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--legacy-regions', type=int, default=100,
+                        help='Regions to run the unclosed-pyplot baseline on')
+    args = parser.parse_args()
+
+    use_agg()
+    regions = synthetic_regions(args.regions, args.grid_size)
+    cmap, norm, aqi_ranges = create_aqi_colormap()
+    print(f"{args.regions} regions of {args.grid_size}x{args.grid_size}, dpi {args.dpi}, "
+          f"{os.cpu_count()} CPUs available")
+    print(f"{'mode':>16} {'figures':>8} {'seconds':>9} {'figs/s':>8} {'RSS MB':>8} {'RSS +MB':>8}")
+
+    def report(mode, count, seconds, before):
+        after = rss_mb()
+        print(f"{mode:>16} {count:>8} {seconds:>9.2f} {count / seconds:>8.1f} "
+              f"{after:>8.0f} {after - before:>8.0f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = rss_mb()
+        start = time.perf_counter()
+        legacy_render(regions[:args.legacy_regions], tmp, args.dpi)
+        report('pyplot, unclosed', args.legacy_regions, time.perf_counter() - start, before)
+        import matplotlib.pyplot as plt
+        plt.close('all')
+
+        jobs = [('heatmap', grid, bbox, label, os.path.join(tmp, f"{label}.png"))
+                for grid, bbox, label in regions]
+        before = rss_mb()
+        start = time.perf_counter()
+        render_regions(jobs, cmap, norm, aqi_ranges, dpi=args.dpi)
+        report('template', len(jobs), time.perf_counter() - start, before)
+
+        for workers in args.workers:
+            before = rss_mb()
+            start = time.perf_counter()
+            render_regions(jobs, cmap, norm, aqi_ranges, dpi=args.dpi, workers=workers)
+            report(f"template x{workers}", len(jobs), time.perf_counter() - start, before)
+
+    children_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"Peak RSS of any worker process: {children_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
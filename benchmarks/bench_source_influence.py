@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark the indexed source-influence engine against all-pairs accumulation
+
+The all-pairs reference evaluates every source over the full grid (great-circle
+distance with the same cut-off), so both produce the same grid; it is only run
+up to --all-pairs-max sources and extrapolated beyond that.
+
+Run from the repository root:
+    python -m benchmarks.bench_source_influence --grid-size 1800
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from heatmap.sources import (DEFAULT_RADIUS_KM, DEFAULT_SCALE_KM, SourceIndex,
+                             accumulate_influence, haversine_km)
+
+
+def all_pairs_influence(lats, lons, sources, radius_km, scale_km):
+    """Evaluate every source over every cell"""
+    out = np.zeros((len(lats), len(lons)))
+    for lat, lon, intensity in zip(sources.lats, sources.lons, sources.intensities):
+        dist = haversine_km(lats[:, None], lons[None, :], lat, lon)
+        kernel = intensity * np.exp(-dist / scale_km)
+        kernel[dist > radius_km] = 0
+        out += kernel
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grid-size', type=int, default=1800)
+    parser.add_argument('--sources', type=int, nargs='+', default=[35, 500, 5000])
+    parser.add_argument('--radius-km', type=float, nargs='+',
+                        default=[DEFAULT_RADIUS_KM, 1000.0, 250.0])
+    parser.add_argument('--all-pairs-max', type=int, default=100)
+    args = parser.parse_args()
+
+    lats = np.linspace(-90, 90, args.grid_size // 2)
+    lons = np.linspace(-180, 180, args.grid_size)
+    n_cells = len(lats) * len(lons)
+    rng = np.random.default_rng(0)
+    print(f"grid {len(lons)}x{len(lats)} ({n_cells:,} cells)")
+    print(f"{'sources':>8} {'radius km':>10} {'all-pairs s':>12} {'indexed s':>10} "
+          f"{'cells touched':>14} {'speedup':>8}")
+
+    for n_sources in args.sources:
+        sources = SourceIndex(rng.uniform(-60, 70, n_sources), rng.uniform(-180, 180, n_sources),
+                              rng.uniform(50, 200, n_sources))
+        for radius_km in args.radius_km:
+            out = np.zeros((len(lats), len(lons)))
+            start = time.perf_counter()
+            touched = accumulate_influence(out, lats, lons, sources, radius_km, DEFAULT_SCALE_KM)
+            indexed_s = time.perf_counter() - start
+
+            sample = min(n_sources, args.all_pairs_max)
+            subset = SourceIndex(sources.lats[:sample], sources.lons[:sample],
+                                 sources.intensities[:sample])
+            start = time.perf_counter()
+            reference = all_pairs_influence(lats, lons, subset, radius_km, DEFAULT_SCALE_KM)
+            all_pairs_s = (time.perf_counter() - start) * n_sources / sample
+            if sample == n_sources and not np.allclose(reference, out):
+                raise SystemExit(f"Indexed influence differs from all-pairs at {n_sources} sources")
+
+            estimated = '' if sample == n_sources else '~'
+            print(f"{n_sources:>8} {radius_km:>10.0f} {estimated + format(all_pairs_s, '.2f'):>12} "
+                  f"{indexed_s:>10.2f} {touched:>14,} {all_pairs_s / indexed_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
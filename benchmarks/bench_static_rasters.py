@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Compare computing the static world layers with reading baked rasters
+
+Bakes rasters into a temporary directory, then times feature building with the
+layers computed, copied from the full memory-mapped raster, and copied from a
+bbox window of it.
+
+Run from the repository root:
+    python -m benchmarks.bench_static_rasters --sizes 720 3600
+"""
+
+import argparse
+import tempfile
+
+import numpy as np
+
+from benchmarks.bench_world_features import time_call
+from generate_world_heatmap import get_major_cities, world_axes
+from heatmap.features import NoiseStreams, build_world_features
+from heatmap.rasters import StaticRasterStore, bbox_window
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[180, 720, 3600])
+    parser.add_argument('--bbox', type=float, nargs=4, default=[25, 50, -125, -65],
+                        help='Window for the bbox case (default: contiguous US)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    cities = get_major_cities()
+    print(f"{'grid':>12} {'compute s':>10} {'mmap s':>10} {'bbox cells':>11} {'bbox s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = StaticRasterStore(tmp)
+        for size in args.sizes:
+            lats, lons = world_axes(size)
+            store.bake(lats, lons, cities)
+            static = store.load(lats, lons, cities)
+            rows, cols = bbox_window(lats, lons, args.bbox)
+
+            compute_s = time_call(
+                lambda: build_world_features(lats, lons, cities, NoiseStreams(0)), args.repeat)
+            mmap_s = time_call(
+                lambda: build_world_features(lats, lons, cities, NoiseStreams(0),
+                                             static=store.load(lats, lons, cities)),
+                args.repeat)
+            bbox_s = time_call(
+                lambda: build_world_features(lats[rows], lons[cols], cities, NoiseStreams(0),
+                                             static=store.load(lats, lons, cities)[rows, cols]),
+                args.repeat)
+
+            computed, _ = build_world_features(lats, lons, cities, NoiseStreams(0))
+            loaded, _ = build_world_features(lats, lons, cities, NoiseStreams(0), static=static)
+            if not np.array_equal(computed, loaded):
+                raise SystemExit(f"Raster features differ from computed ones at size {size}")
+
+            n_bbox = (rows.stop - rows.start) * (cols.stop - cols.start)
+            print(f"{size:>5}x{size // 2:<6} {compute_s:>10.4f} {mmap_s:>10.4f} "
+                  f"{n_bbox:>11,} {bbox_s:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Compare peak memory of whole-grid and streamed world predictions
+
+Each mode runs in a fresh subprocess so ru_maxrss reflects that mode alone, and
+the streamed grids are checked to be bit-identical to the whole-grid result.
+
+Run from the repository root:
+    python -m benchmarks.bench_streaming --grid-size 3600
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def run_mode(grid_size, chunk_rows, seed, out_path):
+    """Build and predict one grid, save it, and print seconds and peak RSS"""
+    from generate_world_heatmap import (generate_world_data, get_major_cities,
+                                        load_model, predict_world_aqi, world_axes)
+    from heatmap.features import NoiseStreams
+    from heatmap.pipeline import allocate_grid, predict_grid_streaming
+
+    model = load_model()
+    start = time.perf_counter()
+    if chunk_rows:
+        lats, lons = world_axes(grid_size)
+        grid = allocate_grid((len(lats), len(lons)), out_path)
+        predict_grid_streaming(model, predict_world_aqi, lats, lons, get_major_cities(),
+                               chunk_rows, seed=seed, out=grid)
+    else:
+        noise = NoiseStreams(seed)
+        features, lat_grid, lon_grid, _ = generate_world_data(grid_size, noise=noise)
+        predictions = predict_world_aqi(model, features, lat_grid, lon_grid,
+                                        noise=noise.predict_noise(0, *lat_grid.shape))
+        grid = predictions.reshape(lat_grid.shape)
+        np.save(out_path, grid)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"RESULT {elapsed:.3f} {peak_mb:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grid-size', type=int, default=1800)
+    parser.add_argument('--chunk-rows', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--child', nargs=2, metavar=('CHUNK_ROWS', 'OUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.grid_size, int(args.child[0]), args.seed, args.child[1])
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for chunk_rows in [0] + args.chunk_rows:
+            out_path = os.path.join(tmp, f"grid_{chunk_rows}.npy")
+            proc = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_streaming',
+                 '--grid-size', str(args.grid_size), '--seed', str(args.seed),
+                 '--child', str(chunk_rows), out_path],
+                capture_output=True, text=True, check=True)
+            line = [l for l in proc.stdout.splitlines() if l.startswith('RESULT')][-1]
+            elapsed, peak_mb = map(float, line.split()[1:])
+            results[chunk_rows] = (elapsed, peak_mb, np.load(out_path))
+
+        reference = results[0][2]
+        print(f"grid {reference.shape[1]}x{reference.shape[0]} ({reference.size:,} cells)")
+        print(f"{'mode':>12} {'seconds':>9} {'peak MB':>9} {'identical':>10}")
+        for chunk_rows, (elapsed, peak_mb, grid) in results.items():
+            label = 'whole grid' if chunk_rows == 0 else f"{chunk_rows} rows"
+            identical = np.array_equal(grid, reference)
+            print(f"{label:>12} {elapsed:>9.2f} {peak_mb:>9.1f} {str(identical):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of time-series frames against a single world snapshot
+
+Predicts one snapshot of the world grid with predict_grid_streaming, then
+--frames hourly frames with predict_timeseries at several keyframe spacings,
+using a synthetic KNN model (or the fallback predictor with --fallback).
+Reports seconds, cost relative to the snapshot, and the AQI error of the
+interpolated frames against predicting every frame. Keyframes are checked to
+be identical to the fully predicted frames, and the frames to be independent
+of the band height.
+
+Run from the repository root:
+    python -m benchmarks.bench_timeseries --grid-size 720 --frames 168 --keyframes 1 6 12
+"""
+
+import argparse
+import functools
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_knn_model
+from generate_world_heatmap import get_major_cities, predict_world_aqi, world_axes
+from heatmap.pipeline import predict_grid_streaming
+from heatmap.timeseries import keyframe_weights, predict_timeseries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grid-size', type=int, default=360)
+    parser.add_argument('--frames', type=int, default=24)
+    parser.add_argument('--keyframes', type=int, nargs='+', default=[1, 3, 6],
+                        help='Keyframe spacings to compare (1 predicts every frame)')
+    parser.add_argument('--chunk-rows', type=int, default=16)
+    parser.add_argument('--train', type=int, default=20000,
+                        help='Training points of the synthetic KNN model')
+    parser.add_argument('--fallback', action='store_true',
+                        help='Use the fallback predictor instead of a KNN model')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    model = None if args.fallback else synthetic_knn_model(n_train=args.train)
+    predict = functools.partial(predict_world_aqi, predictor=None)
+    cities = get_major_cities()
+    lats, lons = world_axes(args.grid_size)
+    hours = np.arange(args.frames, dtype=np.float64)
+
+    start = time.perf_counter()
+    predict_grid_streaming(model, predict, lats, lons, cities, args.chunk_rows, seed=args.seed)
+    snapshot_s = time.perf_counter() - start
+    print(f"grid {len(lons)}x{len(lats)}, {args.frames} frames, "
+          f"{'fallback predictor' if model is None else f'KNN on {args.train:,} points'}")
+    print(f"snapshot: {snapshot_s:.2f}s")
+    print(f"{'keyframes':>10} {'predicted':>10} {'seconds':>8} {'x snapshot':>11} "
+          f"{'max |dAQI|':>11} {'mean |dAQI|':>12} {'keys exact':>11}")
+
+    reference = None
+    for keyframe_every in sorted(args.keyframes):
+        start = time.perf_counter()
+        frames = predict_timeseries(model, predict, lats, lons, cities, hours, args.chunk_rows,
+                                    args.seed, keyframe_every=keyframe_every)
+        elapsed = time.perf_counter() - start
+        keys = keyframe_weights(args.frames, keyframe_every)[0]
+        if reference is None:
+            reference = frames
+        error = np.abs(frames - reference)
+        exact = np.array_equal(frames[keys], reference[keys])
+        print(f"{'every ' + str(keyframe_every):>10} {len(keys):>10} {elapsed:>8.2f} "
+              f"{elapsed / snapshot_s:>10.1f}x {error.max():>11.2f} {error.mean():>12.3f} "
+              f"{str(exact):>11}")
+
+    banded = [predict_timeseries(model, predict, lats, lons, cities, hours[:4], chunk_rows,
+                                 args.seed)
+              for chunk_rows in (args.chunk_rows, args.chunk_rows * 2 + 1)]
+    print(f"\nframes independent of the band height: {np.array_equal(*banded)}")
+
+
+if __name__ == "__main__":
+    main()
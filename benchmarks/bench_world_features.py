@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vectorized world feature builder against the original per-cell loop
+
+Run from the repository root:
+    python -m benchmarks.bench_world_features
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from generate_world_heatmap import get_major_cities
+from heatmap.features import NoiseStreams, build_world_features, city_influence
+
+
+def legacy_world_features(lats, lons, cities):
+    """The original nested-loop feature builder, kept as the benchmark reference"""
+    lon_grid, lat_grid = np.meshgrid(lons, lats)
+    base_pollution = city_influence(lats, lons, cities)
+
+    features = []
+    for i in range(len(lats)):
+        for j in range(len(lons)):
+            lat, lon = lat_grid[i, j], lon_grid[i, j]
+            city_pollution = base_pollution[i, j]
+
+            industrial_factor = 0
+            if 20 <= lat <= 60 and 100 <= lon <= 140:
+                industrial_factor = 40
+            elif 40 <= lat <= 60 and -10 <= lon <= 40:
+                industrial_factor = 25
+            elif 25 <= lat <= 50 and -125 <= lon <= -70:
+                industrial_factor = 20
+
+            desert_factor = 0
+            if 15 <= lat <= 35 and -20 <= lon <= 60:
+                desert_factor = 30
+            elif 20 <= lat <= 40 and 70 <= lon <= 120:
+                desert_factor = 25
+
+            ocean_factor = 0
+            if abs(lat) < 60:
+                if (-180 <= lon <= -120 and 0 <= lat <= 60) or \
+                   (-60 <= lon <= 20 and -60 <= lat <= 0) or \
+                   (120 <= lon <= 180 and -40 <= lat <= 40):
+                    ocean_factor = -20
+
+            polar_factor = 0
+            if abs(lat) > 60:
+                polar_factor = -15
+
+            forest_factor = 0
+            if -10 <= lat <= 10 and -80 <= lon <= -40:
+                forest_factor = -10
+            elif -10 <= lat <= 10 and 10 <= lon <= 40:
+                forest_factor = -8
+            elif -10 <= lat <= 10 and 95 <= lon <= 140:
+                forest_factor = -5
+
+            pop_factor = np.random.exponential(0.2) * 10
+            weather_factor = np.random.normal(0, 5)
+
+            features.append([
+                city_pollution / 100,
+                industrial_factor / 50,
+                desert_factor / 40,
+                abs(ocean_factor) / 30,
+                abs(polar_factor) / 20,
+                abs(forest_factor) / 15,
+                pop_factor / 20,
+                weather_factor / 10
+            ])
+    return np.array(features)
+
+
+def time_call(func, repeat):
+    """Best-of-N wall time for func()"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[180, 360, 720, 1800, 3600],
+                        help='Longitude cell counts to benchmark (latitude is half)')
+    parser.add_argument('--legacy-max', type=int, default=720,
+                        help='Largest size to run the slow per-cell loop at')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    cities = get_major_cities()
+    print(f"{'grid':>12} {'cells':>10} {'legacy s':>10} {'vector s':>10} {'speedup':>8}")
+
+    for size in args.sizes:
+        lats = np.linspace(-90, 90, size // 2)
+        lons = np.linspace(-180, 180, size)
+        n_cells = len(lats) * len(lons)
+        out = np.empty((n_cells, 8), dtype=np.float32)
+
+        vector_s = time_call(
+            lambda: build_world_features(lats, lons, cities, NoiseStreams(42), out=out),
+            args.repeat)
+
+        if size <= args.legacy_max:
+            legacy = None
+
+            def run_legacy():
+                nonlocal legacy
+                legacy = legacy_world_features(lats, lons, cities)
+
+            legacy_s = time_call(run_legacy, 1)
+            # Deterministic columns (everything except the two noise terms) must agree
+            if not np.allclose(legacy[:, :6], out[:, :6], rtol=1e-6, atol=1e-6):
+                raise SystemExit(f"Feature mismatch against legacy loop at size {size}")
+            print(f"{size:>5}x{size // 2:<6} {n_cells:>10,} {legacy_s:>10.3f} "
+                  f"{vector_s:>10.4f} {legacy_s / vector_s:>7.0f}x")
+        else:
+            print(f"{size:>5}x{size // 2:<6} {n_cells:>10,} {'-':>10} {vector_s:>10.4f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Check that tiles, PNG maps and the statistics agree on AQI categories
+
+Values on and around every AQI bound, the ends of the scale and uint16-stored
+values are categorized by heatmap.stats.category_index, coloured by the
+create_aqi_colormap BoundaryNorm of both scripts (the colours imshow draws in
+the PNG maps) and coloured by the tile renderer's palette lookup. A value on a
+bound must take the lower category (50 is Good) in all of them.
+Exits non-zero if any check fails.
+
+Run from the repository root:
+    python -m benchmarks.check_categories
+"""
+
+import sys
+
+import numpy as np
+
+import generate_heatmap_fixed
+import generate_world_heatmap
+from benchmarks.check_reproducibility import report
+from heatmap.stats import AQI_BOUNDS, category_index
+from heatmap.tiles import categorize, color_lookup
+
+
+def probe_values():
+    """Every bound, one float step either side of it, category midpoints and the ends"""
+    bounds = np.asarray(AQI_BOUNDS, dtype=np.float64)
+    values = np.concatenate([bounds, np.nextafter(bounds, -np.inf), np.nextafter(bounds, np.inf),
+                             bounds + 0.5, bounds + 1, (bounds[:-1] + bounds[1:]) / 2,
+                             [-10.0, 800.0]])
+    return np.sort(values)
+
+
+def main():
+    values = probe_values()
+    expected = category_index(values)
+    results = [report("a value on a bound is in the lower category",
+                      (category_index(np.asarray(AQI_BOUNDS[1:-1])) ==
+                       np.arange(len(AQI_BOUNDS) - 2)).all())]
+
+    for script in (generate_world_heatmap, generate_heatmap_fixed):
+        cmap, norm, _ = script.create_aqi_colormap()
+        boundaries, palette = color_lookup(cmap, norm)
+        tile_categories = categorize(values, boundaries, len(palette) - 1)
+        results.append(report(f"{script.__name__} tile categories == category_index",
+                              (tile_categories == expected).all()))
+
+        # The RGBA imshow draws for each value against the tile palette entry
+        map_colors = np.round(cmap(norm(values)) * 255).astype(np.uint8)
+        results.append(report(f"{script.__name__} PNG map colors == tile colors",
+                              (map_colors == palette[tile_categories]).all()))
+
+        stored = values[(values >= 0) & (values <= np.iinfo(np.uint16).max)].astype(np.uint16)
+        results.append(report(f"{script.__name__} uint16 grids: tiles == PNG maps == category_index",
+                              (categorize(stored, boundaries, len(palette) - 1) ==
+                               category_index(stored)).all() and
+                              (np.round(cmap(norm(stored)) * 255).astype(np.uint8) ==
+                               palette[category_index(stored)]).all()))
+
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
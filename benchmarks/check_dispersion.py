@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Check the FFT plume dispersion against direct sums over the sources
+
+On small grids (a regional window, a window across the antimeridian and a
+coarse world grid) and several winds, PlumeDispersion.influence must match a
+direct sum of the same kernel over every spread source to round-off, and stay
+within EXACT_TOLERANCE of a direct sum that uses each cell's own latitude and
+the exact source positions, both as a mean relative error and relative to the
+peak. It also checks that the plume mass does not change
+with the wind, that world grids streamed in latitude bands (each convolved with
+a halo of the kernel reach) match the whole grid, and times the FFT and the
+exact direct sum as sources are added.
+Exits non-zero if any check fails.
+
+Run from the repository root:
+    python -m benchmarks.check_dispersion
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from benchmarks.check_reproducibility import report
+from benchmarks.fixtures import synthetic_catalogue
+from generate_world_heatmap import get_major_cities, predict_world_grid, world_axes
+from heatmap.catalogue import SourceCatalogue
+from heatmap.dispersion import PlumeDispersion
+from heatmap.sources import KM_PER_DEGREE
+
+WINDS = [(0, 0), (270, 5), (45, 12), (180, 20)]
+
+# Largest accepted mean and peak relative error against direct_exact
+EXACT_TOLERANCE = 0.05
+
+# Band heights of the streamed grids, down to a single row
+STREAM_CHUNK_ROWS = [1, 7, 64]
+
+
+def direct_lattice(dispersion, lats, lons, sources):
+    """
+    The kernel summed source by source, on the same bands and spread sources
+    as the FFT, with the negative cubic-weight tails clipped the same way
+    """
+    src_rows, src_cols, intensities = dispersion.spread_sources(lats, lons, sources)
+    rows_index = np.arange(len(lats))[:, None]
+    cols_index = np.arange(len(lons))[None, :]
+    out = np.zeros((len(lats), len(lons)))
+    for rows, dx_km, dy_km, reach_rows, reach_cols in dispersion.bands(lats, lons):
+        band = rows_index[rows]
+        for row, col, intensity in zip(src_rows, src_cols, intensities):
+            dr, dc = band - row, cols_index - col
+            weights = dispersion.kernel(dc * dx_km, dr * dy_km)
+            weights[(np.abs(dr) > reach_rows) | (np.abs(dc) > reach_cols)] = 0
+            out[rows] += intensity * weights
+    np.maximum(out, 0, out=out)
+    return out
+
+
+def direct_exact(dispersion, lats, lons, sources):
+    """The kernel on each cell's local east/north plane, from the unsnapped sources"""
+    out = np.zeros((len(lats), len(lons)))
+    lat_grid, lon_grid = lats[:, None], lons[None, :]
+    for _, (lat, lon, intensity) in sources.items():
+        dlon = (lon_grid - lon + 180) % 360 - 180
+        dx_km = dlon * KM_PER_DEGREE * np.cos(np.radians((lat_grid + lat) / 2))
+        dy_km = (lat_grid - lat) * KM_PER_DEGREE
+        out += intensity * dispersion.kernel(dx_km, dy_km)
+    return out
+
+
+def grids():
+    """(name, lats, lons, sources) of the small test grids"""
+    cities = get_major_cities()
+    catalogue = SourceCatalogue(synthetic_catalogue(cities, 40, seed=3))
+    world_lats, world_lons = world_axes(72)
+    pacific = dict(cities)
+    pacific.update({'Dateline East': (-10.0, 179.0, 120.0), 'Dateline West': (5.0, -178.5, 90.0)})
+    return [
+        ('east asia 41x31', np.linspace(20, 50, 31), np.linspace(100, 140, 41), catalogue),
+        # Longitudes past 180 keep the window ascending across the antimeridian
+        ('antimeridian 60x25', np.linspace(-30, 18, 25), np.linspace(150, 209, 60), pacific),
+        ('world 72x36', world_lats, world_lons, cities),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--timing-grid', type=int, default=720,
+                        help='World grid size for the source-count timing')
+    parser.add_argument('--timing-sources', type=int, nargs='+', default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    ok = True
+    for name, lats, lons, sources in grids():
+        for wind in WINDS:
+            dispersion = PlumeDispersion(*wind)
+            fft = dispersion.influence(lats, lons, sources)
+            direct = direct_lattice(dispersion, lats, lons, sources)
+            scale = max(np.abs(direct).max(), 1e-12)
+            error = np.abs(fft - direct).max() / scale
+            ok &= report(f"{name}, wind from {wind[0]} at {wind[1]} m/s: FFT = direct sum "
+                         f"(max rel. error {error:.1e})", error < 1e-9)
+            exact = direct_exact(dispersion, lats, lons, sources)
+            mean_gap = np.abs(fft - exact).mean() / max(np.abs(exact).mean(), 1e-12)
+            peak_gap = np.abs(fft - exact).max() / max(np.abs(exact).max(), 1e-12)
+            ok &= report(f"{name}, wind from {wind[0]} at {wind[1]} m/s: FFT ~ exact geometry "
+                         f"(mean rel. error {mean_gap:.1%}, max {peak_gap:.1%} of the peak)",
+                         max(mean_gap, peak_gap) < EXACT_TOLERANCE)
+
+    # A kernel sampled finely on the plane keeps its mass whatever the wind
+    masses = []
+    for wind in WINDS:
+        dispersion = PlumeDispersion(*wind)
+        offsets = np.arange(-dispersion.reach_km, dispersion.reach_km + 10, 10.0)
+        masses.append(dispersion.kernel(offsets[None, :], offsets[:, None]).sum() * 100)
+    spread = max(masses) / min(masses) - 1
+    ok &= report(f"plume mass independent of the wind (spread {spread:.1e})", spread < 1e-3)
+
+    lats, lons = world_axes(180)
+    dispersion = PlumeDispersion(45, 12)
+    with contextlib.redirect_stdout(io.StringIO()):
+        whole = predict_world_grid(None, lats, lons, seed=0, dispersion=dispersion)
+    for chunk_rows in STREAM_CHUNK_ROWS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            streamed = predict_world_grid(None, lats, lons, chunk_rows, seed=0,
+                                          dispersion=dispersion)
+        error = np.abs(streamed - whole).max()
+        ok &= report(f"180x90 world streamed in {chunk_rows}-row bands == whole grid "
+                     f"(max |dAQI| {error:.1e})", error < 1e-9)
+
+    lats, lons = world_axes(args.timing_grid)
+    dispersion = PlumeDispersion(270, 8)
+    cities = get_major_cities()
+    print(f"\n{len(lons)}x{len(lats)} world grid, {dispersion.describe()}")
+    print(f"{'sources':>8} {'FFT s':>8} {'direct s':>9}")
+    for n_sources in args.timing_sources:
+        sources = SourceCatalogue(synthetic_catalogue(cities, n_sources, seed=1))
+        start = time.perf_counter()
+        dispersion.influence(lats, lons, sources)
+        fft_s = time.perf_counter() - start
+        start = time.perf_counter()
+        direct_exact(dispersion, lats, lons, sources)
+        direct_s = time.perf_counter() - start
+        print(f"{n_sources:>8,} {fft_s:>8.2f} {direct_s:>9.2f}")
+
+    if not ok:
+        raise SystemExit("Dispersion checks failed")
+
+
+if __name__ == "__main__":
+    main()
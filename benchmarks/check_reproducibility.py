@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Check that seeded runs are reproducible however the grid is produced
+
+Every noise term is drawn from per-row streams of one seed, so a world or
+regional grid should be bit-identical whether it is built whole, streamed in
+bands, rebuilt one tile at a time, cut to a bbox, predicted by worker
+processes, read back from the grid cache or recomputed in a fresh interpreter. Each check prints
+PASS or FAIL; the script exits non-zero if any fails.
+
+Run from the repository root:
+    python -m benchmarks.check_reproducibility --grid-size 360 --workers 2
+"""
+
+import argparse
+import contextlib
+import functools
+import hashlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.fixtures import save_model, synthetic_knn_model
+from generate_heatmap_fixed import generate_sample_data
+from generate_world_heatmap import (generate_world_data, get_major_cities, predict_world_aqi,
+                                    world_aqi_grid, world_axes)
+from heatmap.cache import GridCache, grid_cache_key
+from heatmap.features import NoiseStreams, build_world_features
+from heatmap.parallel import ParallelPredictor
+from heatmap.pipeline import predict_grid_streaming
+from heatmap.rasters import bbox_window
+from heatmap.regions import batch_features, make_region
+
+FRESH_PROCESS = """
+import hashlib, sys
+from benchmarks.check_reproducibility import whole_grid
+print(hashlib.sha256(whole_grid(int(sys.argv[1]), int(sys.argv[2])).tobytes()).hexdigest())
+"""
+
+# Fallback predictor, so the per-cell prediction noise is part of every grid
+fallback = functools.partial(predict_world_aqi, predictor=None)
+
+
+def whole_grid(grid_size, seed):
+    """World AQI grid built and predicted in one pass with the fallback predictor"""
+    noise = NoiseStreams(seed)
+    features, lat_grid, lon_grid, _ = generate_world_data(grid_size, noise=noise)
+    predictions = fallback(None, features, lat_grid, lon_grid,
+                           noise=noise.predict_noise(0, *lat_grid.shape))
+    return predictions.reshape(lat_grid.shape)
+
+
+def report(name, ok):
+    print(f"{'PASS' if ok else 'FAIL'}  {name}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grid-size', type=int, default=360)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-rows', type=int, nargs='+', default=[1, 7, 64])
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    cities = get_major_cities()
+    lats, lons = world_axes(args.grid_size)
+    reference = whole_grid(args.grid_size, args.seed)
+    results = []
+
+    for chunk_rows in args.chunk_rows:
+        streamed = predict_grid_streaming(None, fallback, lats, lons, cities, chunk_rows,
+                                          seed=args.seed)
+        results.append(report(f"streamed in {chunk_rows}-row bands == whole grid",
+                              np.array_equal(streamed, reference)))
+
+    full_features, _ = build_world_features(lats, lons, cities, NoiseStreams(args.seed))
+    rows = slice(len(lats) // 3, len(lats) // 3 + 5)
+    tile, _ = build_world_features(lats[rows], lons, cities, NoiseStreams(args.seed),
+                                   row_offset=rows.start)
+    same_rows = full_features.reshape(len(lats), len(lons), -1)[rows].reshape(tile.shape)
+    results.append(report(f"rows {rows.start}-{rows.stop} rebuilt alone == same rows of the grid",
+                          np.array_equal(tile, same_rows)))
+
+    cols = slice(len(lons) // 4, len(lons) // 2)
+    window = NoiseStreams(args.seed, window=(rows.start, cols.start, len(lons)))
+    tile, _ = build_world_features(lats[rows], lons[cols], cities, window)
+    same_cells = full_features.reshape(len(lats), len(lons), -1)[rows, cols].reshape(tile.shape)
+    results.append(report(f"tile of rows {rows.start}-{rows.stop}, cols {cols.start}-{cols.stop} "
+                          f"rebuilt alone == same cells of the grid",
+                          np.array_equal(tile, same_cells)))
+
+    bbox = (10, 55, -20, 75)
+    rows, cols = bbox_window(lats, lons, bbox)
+    for chunk_rows in (None, args.chunk_rows[0]):
+        with contextlib.redirect_stdout(io.StringIO()):
+            window_grid = world_aqi_grid(args.grid_size, chunk_rows, args.seed, bbox=bbox)[0]
+        mode = f"streamed in {chunk_rows}-row bands" if chunk_rows else "whole"
+        results.append(report(f"bbox {bbox} {mode} == same cells of the world grid",
+                              np.array_equal(window_grid, reference[rows, cols])))
+
+    results.append(report("different seeds give different grids",
+                          not np.array_equal(whole_grid(args.grid_size, args.seed + 1),
+                                             reference)))
+
+    proc = subprocess.run([sys.executable, '-c', FRESH_PROCESS, str(args.grid_size),
+                           str(args.seed)], capture_output=True, text=True, check=True)
+    digest = hashlib.sha256(reference.tobytes()).hexdigest()
+    results.append(report("fresh interpreter reproduces the grid",
+                          proc.stdout.split()[-1] == digest))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = synthetic_knn_model(n_train=5000)
+        model_path = save_model(model, os.path.join(tmp, 'model.joblib'))
+        serial = model.predict(full_features)
+        with ParallelPredictor(model_path, args.workers, len(full_features),
+                               full_features.shape[1], tile_rows=1000,
+                               dtype=full_features.dtype) as predictor:
+            parallel = predictor.predict(full_features)
+        results.append(report(f"{args.workers} worker processes == serial KNN prediction",
+                              np.array_equal(parallel, serial)))
+
+        cache = GridCache(os.path.join(tmp, 'grids'))
+        key = grid_cache_key('world', model_path, (-90, 90, -180, 180), reference.shape,
+                             args.seed, cities)
+        cache.store(key, reference)
+        results.append(report("cached grid == freshly computed grid",
+                              np.array_equal(cache.load(key), whole_grid(args.grid_size,
+                                                                         args.seed))))
+
+    first = generate_sample_data()
+    np.random.seed(0)
+    np.random.random(1000)  # Global state must not leak into seeded runs
+    second = generate_sample_data()
+    results.append(report("regional sample data is the same on every call",
+                          all(np.array_equal(a, b) for a, b in zip(first, second))))
+
+    dallas = make_region('Dallas', (32.5, 33.0, -97.2, -96.5), 40)
+    delhi = make_region('Delhi', (28.4, 28.9, 76.8, 77.4), 30)
+    alone, _, alone_noise = batch_features([dallas], args.seed)
+    mixed, offsets, mixed_noise = batch_features([delhi, dallas], args.seed)
+    results.append(report("a region's batch features do not depend on the manifest",
+                          np.array_equal(alone, mixed[offsets[1]:offsets[2]]) and
+                          np.array_equal(alone_noise, mixed_noise[offsets[1]:offsets[2]])))
+
+    failed = results.count(False)
+    print(f"\n{len(results) - failed}/{len(results)} checks passed")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
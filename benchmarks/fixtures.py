@@ -0,0 +1,82 @@
+"""
+Shared fixtures for the benchmark scripts
+"""
+
+import numpy as np
+
+from heatmap.features import N_FEATURES, NoiseStreams, build_world_features
+
+
+def synthetic_knn_model(n_train=20000, n_neighbors=5, seed=0, n_features=N_FEATURES):
+    """
+    Fit a small KNeighborsRegressor on world features with a known AQI response.
+
+    `n_features` < N_FEATURES fits on the leading columns only, e.g. 5 for the
+    regional feature matrix.
+    """
+    from sklearn.neighbors import KNeighborsRegressor
+
+    rng = np.random.default_rng(seed)
+    features = rng.random((n_train, n_features), dtype=np.float32)
+    weights = np.array([120, 80, 60, -30, -20, -15, 40, 10])[:n_features]
+    targets = np.clip(features @ weights + 30 + rng.normal(0, 8, n_train), 5, 400)
+    return KNeighborsRegressor(n_neighbors=n_neighbors).fit(features, targets)
+
+
+def synthetic_station_model(cities, n_stations=20000, n_neighbors=5, seed=0):
+    """
+    Fit a haversine KNeighborsRegressor on monitoring stations, like the geographic model.
+
+    Half the stations cluster around the `cities` sources and half are spread
+    over the inhabited latitudes; inputs are (lat, lon) in radians.
+    """
+    from sklearn.neighbors import KNeighborsRegressor
+
+    rng = np.random.default_rng(seed)
+    sources = np.array(list(cities.values()), dtype=np.float64)
+    n_near = n_stations // 2
+    home = rng.integers(len(sources), size=n_near)
+    near = sources[home, :2] + rng.normal(0, 2, (n_near, 2))
+    spread = np.column_stack([rng.uniform(-60, 70, n_stations - n_near),
+                              rng.uniform(-180, 180, n_stations - n_near)])
+    stations = np.vstack([near, spread])
+    stations[:, 0] = np.clip(stations[:, 0], -89.9, 89.9)
+    stations[:, 1] = (stations[:, 1] + 180) % 360 - 180
+
+    levels = np.full(n_stations, 30.0)
+    levels[:n_near] += sources[home, 2] * np.exp(-np.hypot(*(near - sources[home, :2]).T) / 2)
+    targets = np.clip(levels + rng.normal(0, 8, n_stations), 5, 400)
+    return KNeighborsRegressor(n_neighbors=n_neighbors, weights='distance',
+                               metric='haversine').fit(np.radians(stations), targets)
+
+
+def save_model(model, path):
+    """Dump a model the same way the training pipeline does"""
+    import joblib
+
+    joblib.dump(model, path)
+    return path
+
+
+def world_features(grid_size, cities, seed=0):
+    """Feature matrix for a grid_size x grid_size/2 world grid"""
+    lats = np.linspace(-90, 90, grid_size // 2)
+    lons = np.linspace(-180, 180, grid_size)
+    features, _ = build_world_features(lats, lons, cities, noise=NoiseStreams(seed))
+    return features
+
+
+def synthetic_catalogue(cities, n_sources=100000, seed=0):
+    """SOURCE_DTYPE records of point sources clustered around the `cities` sources"""
+    from heatmap.catalogue import SOURCE_DTYPE
+
+    rng = np.random.default_rng(seed)
+    centres = np.array(list(cities.values()), dtype=np.float64)
+    home = rng.integers(len(centres), size=n_sources)
+    records = np.zeros(n_sources, dtype=SOURCE_DTYPE)
+    records['name'] = [f"source-{k}" for k in range(n_sources)]
+    records['kind'] = rng.choice(['industrial', 'urban', 'fuel', 'mining'], n_sources)
+    records['lat'] = np.clip(centres[home, 0] + rng.normal(0, 3, n_sources), -89.9, 89.9)
+    records['lon'] = (centres[home, 1] + rng.normal(0, 3, n_sources) + 180) % 360 - 180
+    records['level'] = rng.gamma(2, 20, n_sources)
+    return records
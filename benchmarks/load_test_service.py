@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Load-test the local AQI query service at a fixed concurrency
+
+Starts an in-process service (from --lookup, or the model path with the
+fallback predictor) on a free port unless --url points at a running one, then
+keeps --concurrency clients busy with point, bbox and batch requests drawn from
+a few metro areas. Reports throughput and p50/p99 latency per endpoint, plus
+the tile LRU counters showing cache hits and coalesced tile computations.
+
+Run from the repository root:
+    python -m benchmarks.load_test_service --requests 2000 --concurrency 16
+"""
+
+import argparse
+import functools
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+import numpy as np
+
+# (lat, lon) centres that requests cluster around, like real traffic
+HOTSPOTS = [(32.78, -96.80), (28.70, 77.10), (51.51, -0.13), (35.68, 139.69), (-23.55, -46.63)]
+
+
+def make_requests(count, batch_points, seed=0):
+    """(endpoint, method, path, body) tuples mixing point, bbox and batch queries"""
+    rng = np.random.default_rng(seed)
+    requests = []
+    for _ in range(count):
+        lat, lon = HOTSPOTS[rng.integers(len(HOTSPOTS))]
+        lat, lon = lat + rng.normal(0, 1.5), lon + rng.normal(0, 1.5)
+        kind = rng.choice(['point', 'bbox', 'batch'], p=[0.8, 0.1, 0.1])
+        if kind == 'point':
+            requests.append(('point', 'GET', '/aqi?' + urlencode({'lat': lat, 'lon': lon}), None))
+        elif kind == 'bbox':
+            query = urlencode({'lat_min': lat - 0.5, 'lat_max': lat + 0.5,
+                               'lon_min': lon - 0.5, 'lon_max': lon + 0.5})
+            requests.append(('bbox', 'GET', '/aqi/bbox?' + query, None))
+        else:
+            points = np.column_stack([lat + rng.normal(0, 0.5, batch_points),
+                                      lon + rng.normal(0, 0.5, batch_points)])
+            body = json.dumps({'points': np.round(points, 4).tolist()})
+            requests.append(('batch', 'POST', '/aqi/batch', body))
+    return requests
+
+
+def run_load(host, port, requests, concurrency):
+    """Send the requests from `concurrency` keep-alive clients; returns {endpoint: [seconds]}"""
+    latencies = {}
+    errors = []
+    lock = threading.Lock()
+    cursor = iter(requests)
+
+    def client():
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        while True:
+            with lock:
+                request = next(cursor, None)
+            if request is None:
+                break
+            endpoint, method, path, body = request
+            headers = {'Content-Type': 'application/json'} if body else {}
+            start = time.perf_counter()
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.setdefault(endpoint, []).append(elapsed)
+                if response.status != 200:
+                    errors.append((response.status, payload[:200]))
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def fetch_health(host, port):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request('GET', '/health')
+    health = json.loads(conn.getresponse().read())
+    conn.close()
+    return health
+
+
+def start_local_service(lookup_path):
+    """Serve on a free localhost port from a background thread"""
+    from heatmap.service import AQIServer, AQIService
+
+    if lookup_path:
+        from heatmap.lookup import AQILookup
+
+        service = AQIService(lookup=AQILookup.load(lookup_path))
+    else:
+        from generate_world_heatmap import get_major_cities, load_model, predict_world_aqi
+
+        service = AQIService(load_model(), functools.partial(predict_world_aqi, predictor=None),
+                             get_major_cities())
+    server = AQIServer(('127.0.0.1', 0), service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default=None, help='Running service, e.g. http://127.0.0.1:8765')
+    parser.add_argument('--lookup', default=None,
+                        help='Compiled lookup for the in-process service')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--batch-points', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=0,
+                        help='Requests sent first and left out of the report')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        target = urlparse(args.url)
+        host, port = target.hostname, target.port
+    else:
+        server = start_local_service(args.lookup)
+        host, port = server.server_address[:2]
+
+    try:
+        if args.warmup:
+            run_load(host, port, make_requests(args.warmup, args.batch_points, seed=1),
+                     args.concurrency)
+        start = time.perf_counter()
+        latencies, errors = run_load(host, port, make_requests(args.requests, args.batch_points),
+                                     args.concurrency)
+        elapsed = time.perf_counter() - start
+        health = fetch_health(host, port)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    print(f"{args.requests:,} requests at concurrency {args.concurrency} in {elapsed:.2f}s "
+          f"({args.requests / elapsed:,.0f} req/s), source: {health['source']}")
+    print(f"{'endpoint':>9} {'count':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint in ('point', 'bbox', 'batch'):
+        if endpoint not in latencies:
+            continue
+        ms = np.array(latencies[endpoint]) * 1000
+        print(f"{endpoint:>9} {len(ms):>7,} {np.percentile(ms, 50):>8.2f} "
+              f"{np.percentile(ms, 99):>8.2f} {ms.max():>8.2f}")
+    print(f"tile LRU: {health['lru']}")
+    if errors:
+        raise SystemExit(f"{len(errors)} requests failed, first: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for feature building, inference and rendering, with baselines
+
+Runs each stage (features, predict, render) at each grid size against a small
+synthetic KNN model: the 50x50 regional sample grid (generate_sample_data,
+predict_aqi_with_fallback, render_heatmaps) and 180x90, 720x360 and 3600x1800
+world grids (generate_world_data, predict_world_aqi, render_world_map). Every
+case runs in its own process, so its peak RSS is its own; it reports the best
+of --repeat timed runs as cells/s, and the process's peak RSS.
+
+--save writes the results to the JSON baseline; otherwise they are compared
+with it, and the suite exits non-zero when a case's throughput drops or its
+peak memory grows by more than the thresholds. Baselines are per machine and
+not committed: the first run on a machine, with no baseline yet, records one.
+
+Run from the repository root:
+    python -m benchmarks.suite                              # record, then compare
+    python -m benchmarks.suite --save                       # re-record the baseline
+    python -m benchmarks.suite --sizes 50x50 180x90 --stages features predict
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from heatmap.timings import peak_rss_mb
+
+STAGES = ('features', 'predict', 'render')
+
+# Size label -> (generator, grid_size)
+SIZES = {
+    '50x50': ('regional', 50),
+    '180x90': ('world', 180),
+    '720x360': ('world', 720),
+    '3600x1800': ('world', 3600),
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Stop repeating a case once its timed runs have taken this long
+REPEAT_BUDGET_S = 10.0
+
+
+def world_case(stage, grid_size, model, seed):
+    """(cells, run) for a world-grid stage; the inputs of `run` are built up front"""
+    from generate_world_heatmap import (generate_world_data, get_major_cities,
+                                        predict_world_aqi, render_world_map, world_axes)
+    from heatmap.features import NoiseStreams
+
+    lats, lons = world_axes(grid_size)
+    cities = get_major_cities()
+    cells = len(lats) * len(lons)
+    if stage == 'features':
+        return cells, lambda: generate_world_data(noise=NoiseStreams(seed), axes=(lats, lons),
+                                                  cities=cities)
+
+    noise = NoiseStreams(seed)
+    features, lat_grid, lon_grid, _ = generate_world_data(noise=noise, axes=(lats, lons),
+                                                          cities=cities)
+    cell_noise = noise.predict_noise(0, len(lats), len(lons))
+    if stage == 'predict':
+        return cells, lambda: predict_world_aqi(model, features, lat_grid, lon_grid,
+                                                noise=cell_noise)
+
+    # Render the fallback grid: drawing cost does not depend on the values' origin
+    aqi_grid = predict_world_aqi(None, features, lat_grid, lon_grid,
+                                 noise=cell_noise).reshape(lat_grid.shape)
+    del features
+    return cells, lambda: render_world_map(aqi_grid, lats, lons, cities)
+
+
+def regional_case(stage, grid_size, model, seed):
+    """(cells, run) for a stage of the regional sample grid"""
+    from generate_heatmap_fixed import (generate_sample_data, predict_aqi_with_fallback,
+                                        render_heatmaps)
+
+    cells = grid_size**2
+    if stage == 'features':
+        return cells, lambda: generate_sample_data(grid_size)
+
+    features, lat_grid, lon_grid, noise = generate_sample_data(grid_size)
+    if stage == 'predict':
+        return cells, lambda: predict_aqi_with_fallback(model, features, noise=noise)
+
+    aqi_grid = predict_aqi_with_fallback(None, features, noise=noise).reshape(lat_grid.shape)
+    return cells, lambda: render_heatmaps(aqi_grid, lat_grid, lon_grid)
+
+
+def run_case(stage, size, train, repeat, seed):
+    """Measure one case in this process and return its result dict"""
+    from benchmarks.fixtures import synthetic_knn_model
+    from heatmap.features import N_FEATURES
+    from heatmap.regions import N_REGIONAL_FEATURES
+
+    generator, grid_size = SIZES[size]
+    model = None
+    if stage == 'predict':
+        n_features = N_FEATURES if generator == 'world' else N_REGIONAL_FEATURES
+        model = synthetic_knn_model(n_train=train, n_features=n_features, seed=seed)
+    case = world_case if generator == 'world' else regional_case
+
+    if stage == 'render':
+        import matplotlib
+        matplotlib.use('Agg')
+
+    times = []
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        # Figures are written to the working directory
+        os.chdir(tmp)
+        cells, run = case(stage, grid_size, model, seed)
+        while len(times) < repeat and sum(times) < REPEAT_BUDGET_S:
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    seconds = min(times)
+    return {'stage': stage, 'size': size, 'cells': cells, 'runs': len(times),
+            'seconds': seconds, 'cells_per_s': cells / seconds, 'peak_rss_mb': peak_rss_mb()}
+
+
+def measure(stage, size, args):
+    """Run one case in a fresh interpreter, so peak RSS is not shared between cases"""
+    command = [sys.executable, '-m', 'benchmarks.suite', '--case', stage, size,
+               '--train', str(args.train), '--repeat', str(args.repeat), '--seed', str(args.seed)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    done = subprocess.run(command, cwd=root, capture_output=True, text=True)
+    if done.returncode != 0:
+        raise RuntimeError(f"{stage} {size} failed:\n{done.stderr}")
+    return json.loads(done.stdout.splitlines()[-1])
+
+
+def compare(result, baseline, throughput_threshold, memory_threshold):
+    """Regression messages for a result against its baseline entry"""
+    problems = []
+    if result['cells_per_s'] < baseline['cells_per_s'] * (1 - throughput_threshold):
+        problems.append(f"throughput {result['cells_per_s'] / baseline['cells_per_s'] - 1:+.0%}")
+    if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + memory_threshold):
+        problems.append(f"peak RSS {result['peak_rss_mb'] / baseline['peak_rss_mb'] - 1:+.0%}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES))
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--train', type=int, default=5000,
+                        help='Training points of the synthetic KNN model')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help=f'Timed runs per case, best kept (fewer once they pass '
+                             f'{REPEAT_BUDGET_S:.0f}s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='JSON baseline to compare with, or to write with --save')
+    parser.add_argument('--save', action='store_true',
+                        help='Record these results as the baseline instead of comparing')
+    parser.add_argument('--throughput-threshold', type=float, default=0.2,
+                        help='Allowed relative drop in cells/s')
+    parser.add_argument('--memory-threshold', type=float, default=0.2,
+                        help='Allowed relative growth in peak RSS')
+    parser.add_argument('--case', nargs=2, metavar=('STAGE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        stage, size = args.case
+        print(json.dumps(run_case(stage, size, args.train, args.repeat, args.seed)))
+        return
+
+    baseline = {}
+    if not args.save and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; recording this run as the baseline\n")
+        args.save = True
+    if not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['cases']
+
+    print(f"{'case':<20} {'seconds':>9} {'cells/s':>13} {'peak MB':>8}   vs baseline")
+    results, regressions = {}, 0
+    for size in args.sizes:
+        for stage in args.stages:
+            key = f"{stage}/{size}"
+            result = results[key] = measure(stage, size, args)
+            status = ''
+            if key in baseline:
+                problems = compare(result, baseline[key], args.throughput_threshold,
+                                   args.memory_threshold)
+                regressions += bool(problems)
+                change = result['cells_per_s'] / baseline[key]['cells_per_s'] - 1
+                status = f"{change:+.0%} cells/s" + (f"  ⚠️ {', '.join(problems)}"
+                                                      if problems else '')
+            elif baseline:
+                status = 'no baseline'
+            print(f"{key:<20} {result['seconds']:>9.3f} {result['cells_per_s']:>13,.0f} "
+                  f"{result['peak_rss_mb']:>8.0f}   {status}")
+
+    if args.save:
+        document = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'train': args.train,
+            'cases': results,
+        }
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                document['cases'] = dict(json.load(f)['cases'], **results)
+        with open(args.baseline, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        raise SystemExit(f"{regressions} case(s) regressed past the thresholds "
+                         f"(throughput {args.throughput_threshold:.0%}, "
+                         f"memory {args.memory_threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark AirQualityFetcher against a local stub of the OpenWeatherMap API
+
+The stub answers /current with a canned air_pollution payload after a fixed
+latency and returns 429 or 503 for a fraction of requests, so the retry path
+is exercised too.
+
+    python bench_fetch.py --requests 500 --latency-ms 50
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from fetch_air_quality import AirQualityFetcher
+
+
+def make_stub_handler(latency, error_rate):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            if random.random() < error_rate:
+                self.send_response(random.choice([429, 503]))
+                self.send_header('Retry-After', '0')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            query = parse_qs(urlparse(self.path).query)
+            body = json.dumps({
+                'coord': {'lon': float(query['lon'][0]), 'lat': float(query['lat'][0])},
+                'list': [{
+                    'main': {'aqi': random.randint(1, 5)},
+                    'components': {'co': 201.94, 'no': 0.02, 'no2': 0.77, 'o3': 68.66,
+                                   'so2': 0.64, 'pm2_5': 0.5, 'pm10': 0.54, 'nh3': 0.12},
+                    'dt': int(time.time()),
+                }],
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--rate', type=float, default=1000, help='Token bucket requests/second')
+    parser.add_argument('--serial-sample', type=int, default=50)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                 make_stub_handler(args.latency_ms / 1000, args.error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    rng = random.Random(0)
+    coords = [(rng.uniform(32.5, 33.0), rng.uniform(-97.2, -96.5)) for _ in range(args.requests)]
+    fetcher = AirQualityFetcher(api_key='stub', base_url=base_url)
+
+    # Serial baseline: one blocking call per coordinate, failures not retried
+    start = time.perf_counter()
+    for lat, lon in coords[:args.serial_sample]:
+        try:
+            fetcher.fetch_current_data(lat, lon)
+        except Exception:
+            pass
+    serial_rps = args.serial_sample / (time.perf_counter() - start)
+    print(f"{args.requests} coordinates, {args.latency_ms:.0f} ms latency, "
+          f"{args.error_rate:.0%} 429/503 responses")
+    print(f"{'mode':>16} {'req/s':>9} {'failed':>7}")
+    print(f"{'serial':>16} {serial_rps:>9.1f} {'-':>7}")
+
+    for concurrency in args.concurrency:
+        start = time.perf_counter()
+        results = fetcher.fetch_bulk(coords, concurrency=concurrency, rate=args.rate)
+        elapsed = time.perf_counter() - start
+        failed = sum(isinstance(r, Exception) for r in results)
+        print(f"{f'bulk x{concurrency}':>16} {args.requests / elapsed:>9.1f} {failed:>7}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
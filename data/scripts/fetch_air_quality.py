@@ -1,29 +1,147 @@
+import asyncio
+import numpy as np
+import random
 import requests
 import json
 import os
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from observation_store import ObservationStore, observations_from_response
+
+# Status codes worth retrying: rate limited or a transient server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Asyncio token bucket: `rate` requests per second with bursts of up to `capacity`"""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
 
 class AirQualityFetcher:
-    def __init__(self):
-        self.api_key = os.getenv('OPENWEATHER_API_KEY')
-        self.base_url = 'http://api.openweathermap.org/data/2.5/air_pollution'
-    
+    def __init__(self, api_key=None, base_url=None, timeout=10, max_retries=3, pool_size=32):
+        self.api_key = api_key or os.getenv('OPENWEATHER_API_KEY')
+        self.base_url = base_url or 'http://api.openweathermap.org/data/2.5/air_pollution'
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        # One pooled session so repeated calls reuse keep-alive connections
+        self.pool_size = pool_size
+        self.session = self._pooled_session(pool_size)
+
+    def _pooled_session(self, pool_size):
+        """A session keeping up to pool_size connections per host alive"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
     def fetch_current_data(self, lat, lon):
         url = f"{self.base_url}/current"
         params = {'lat': lat, 'lon': lon, 'appid': self.api_key}
-        
-        response = requests.get(url, params=params)
+
+        response = self.session.get(url, params=params, timeout=self.timeout)
         if response.status_code == 200:
             return response.json()
         else:
             raise Exception(f"API request failed: {response.status_code}")
-    
+
+    async def _fetch_with_retry(self, loop, executor, get, semaphore, bucket, lat, lon):
+        """Fetch one coordinate, backing off exponentially on 429/5xx and connection errors"""
+        url = f"{self.base_url}/current"
+        params = {'lat': float(lat), 'lon': float(lon), 'appid': self.api_key}
+
+        for attempt in range(self.max_retries + 1):
+            delay = min(30.0, 0.5 * 2**attempt) * (0.5 + random.random())
+            # Hold a slot only while the request runs, so backing off frees it for others
+            async with semaphore:
+                await bucket.acquire()
+                try:
+                    response = await loop.run_in_executor(executor, get, url, params)
+                except requests.RequestException as e:
+                    if attempt == self.max_retries:
+                        raise Exception(f"API request failed: {e}") from e
+                    response = None
+            if response is not None:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise Exception(f"API request failed: {response.status_code}")
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    async def fetch_bulk_async(self, coords, concurrency=16, rate=50, burst=None):
+        """
+        Fetch current air quality for many (lat, lon) pairs concurrently.
+
+        asyncio only schedules the work: each request is a blocking `requests`
+        call on a thread of a pool of exactly `concurrency` threads. Each thread
+        keeps its own session with one keep-alive connection, created before
+        its first request, so no session is shared across threads or changed
+        while requests run. At most `concurrency` requests are in flight and
+        at most `rate` are started per second; a
+        request backing off after a 429/5xx does not hold a slot. Results come
+        back in input order; a coordinate that still fails after retrying is
+        returned as its Exception instead of a response dict.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        bucket = TokenBucket(rate, burst)
+        local, sessions = threading.local(), []
+
+        def start_thread():
+            local.session = self._pooled_session(1)
+            sessions.append(local.session)
+
+        def get(url, params):
+            return local.session.get(url, params=params, timeout=self.timeout)
+
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, initializer=start_thread) as executor:
+                tasks = [self._fetch_with_retry(loop, executor, get, semaphore, bucket, lat, lon)
+                         for lat, lon in coords]
+                return await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for session in sessions:
+                session.close()
+
+    def fetch_bulk(self, coords, concurrency=16, rate=50, burst=None):
+        """Blocking wrapper around fetch_bulk_async"""
+        return asyncio.run(self.fetch_bulk_async(coords, concurrency, rate, burst))
+
     def save_data(self, data, filename):
         with open(f"../raw/{filename}", 'w') as f:
             json.dump(data, f, indent=2)
 
+    def store_data(self, data, store):
+        """Append a response (or list of responses) to a columnar ObservationStore"""
+        responses = data if isinstance(data, list) else [data]
+        rows = [observations_from_response(r) for r in responses if isinstance(r, dict)]
+        if not rows:
+            return 0
+        return store.append(np.concatenate(rows))
+
 if __name__ == "__main__":
     fetcher = AirQualityFetcher()
+    store = ObservationStore('../raw/observations')
     # Example: Dallas, TX coordinates
     data = fetcher.fetch_current_data(32.7767, -96.7970)
-    fetcher.save_data(data, f"air_quality_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
\ No newline at end of file
+    fetcher.store_data(data, store)
\ No newline at end of file
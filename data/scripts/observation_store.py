@@ -0,0 +1,228 @@
+"""
+Append-only columnar store for fetched air-quality observations
+
+Observations are NumPy structured arrays partitioned on disk by UTC date and
+geohash prefix:
+
+    <root>/date=2025-07-08/geohash=9v/part-<ns>-<id>.npy   (appended batches)
+    <root>/date=2025-07-08/geohash=9v/data-<ns>-<id>.npy   (after compaction)
+
+A compacted file is named after the last part it merged and replaces every
+part up to that name, so queries skip those parts even if a compaction stopped
+before deleting them. Compaction should not run while another process appends
+to the same partition. Queries prune partitions by directory name before
+opening any file, so a time-range or bounding-box read only touches the
+partitions it overlaps.
+"""
+
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+
+OBSERVATION_DTYPE = np.dtype([
+    ('time', 'i8'),     # Unix seconds (OpenWeatherMap 'dt')
+    ('lat', 'f4'),
+    ('lon', 'f4'),
+    ('aqi', 'u1'),      # OpenWeatherMap 1-5 index
+    ('co', 'f4'),
+    ('no', 'f4'),
+    ('no2', 'f4'),
+    ('o3', 'f4'),
+    ('so2', 'f4'),
+    ('pm2_5', 'f4'),
+    ('pm10', 'f4'),
+    ('nh3', 'f4'),
+])
+COMPONENTS = ('co', 'no', 'no2', 'o3', 'so2', 'pm2_5', 'pm10', 'nh3')
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+PART_PREFIX = 'part-'
+COMPACTED_PREFIX = 'data-'
+
+
+def geohash_encode(lats, lons, precision):
+    """Vectorized geohash of arrays of coordinates"""
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+    n_bits = precision * 5
+    lat_bits, lon_bits = n_bits // 2, n_bits - n_bits // 2
+
+    # Quantize each axis, then interleave bits starting with longitude
+    lat_q = np.clip(((lats + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    lon_q = np.clip(((lons + 180) / 360 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    code = np.zeros(len(lats), dtype=np.int64)
+    for bit in range(n_bits):
+        if bit % 2 == 0:
+            value = (lon_q >> (lon_bits - 1 - bit // 2)) & 1
+        else:
+            value = (lat_q >> (lat_bits - 1 - bit // 2)) & 1
+        code = (code << 1) | value
+
+    chars = np.empty((len(lats), precision), dtype='<U1')
+    for i in range(precision):
+        shift = 5 * (precision - 1 - i)
+        chars[:, i] = np.array(list(GEOHASH_ALPHABET))[(code >> shift) & 31]
+    return np.array([''.join(row) for row in chars])
+
+
+def geohash_bbox(geohash):
+    """(lat_min, lat_max, lon_min, lon_max) of a geohash cell"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if (bits >> shift) & 1:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def observations_from_response(data):
+    """Convert an OpenWeatherMap air_pollution response into observation rows"""
+    entries = data.get('list', [])
+    rows = np.zeros(len(entries), dtype=OBSERVATION_DTYPE)
+    rows['lat'] = data['coord']['lat']
+    rows['lon'] = data['coord']['lon']
+    for i, entry in enumerate(entries):
+        rows[i]['time'] = entry['dt']
+        rows[i]['aqi'] = entry['main']['aqi']
+        for name in COMPONENTS:
+            rows[i][name] = entry['components'].get(name, np.nan)
+    return rows
+
+
+def _utc_date(seconds):
+    return datetime.fromtimestamp(int(seconds), tz=timezone.utc).date()
+
+
+def _file_key(name):
+    """(ns, id) order key of a part or compacted file name"""
+    ns, file_id = name[:-len('.npy')].split('-')[1:]
+    return int(ns), file_id
+
+
+def live_files(names):
+    """
+    The files of a partition that hold its rows: the newest compacted file and
+    the parts appended after it. Older compacted files and the parts they
+    replaced are left over from compactions and are skipped.
+    """
+    names = [n for n in names if n.endswith('.npy')]
+    compacted = [n for n in names if n.startswith(COMPACTED_PREFIX)]
+    parts = sorted((n for n in names if n.startswith(PART_PREFIX)), key=_file_key)
+    if not compacted:
+        return parts
+    newest = max(compacted, key=_file_key)
+    return [newest] + [n for n in parts if _file_key(n) > _file_key(newest)]
+
+
+class ObservationStore:
+    """Date/geohash partitioned .npy part files with compaction and pruned queries"""
+
+    def __init__(self, root, geohash_precision=2):
+        self.root = root
+        self.geohash_precision = geohash_precision
+
+    def _partition_dir(self, date, geohash):
+        return os.path.join(self.root, f"date={date.isoformat()}", f"geohash={geohash}")
+
+    def append(self, observations):
+        """Write a batch of observations as one new part file per partition it spans"""
+        observations = np.asarray(observations, dtype=OBSERVATION_DTYPE)
+        if len(observations) == 0:
+            return 0
+
+        days = observations['time'] // 86400
+        geohashes = geohash_encode(observations['lat'], observations['lon'], self.geohash_precision)
+        keys = np.char.add(days.astype(str), np.char.add(':', geohashes))
+        for key in np.unique(keys):
+            day, geohash = key.split(':')
+            part = observations[keys == key]
+            directory = self._partition_dir(_utc_date(int(day) * 86400), geohash)
+            os.makedirs(directory, exist_ok=True)
+            name = f"{PART_PREFIX}{time.time_ns()}-{uuid.uuid4().hex[:8]}.npy"
+            self._write_atomic(os.path.join(directory, name), part)
+        return len(observations)
+
+    def _write_atomic(self, path, array):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    def partitions(self, start=None, end=None, bbox=None):
+        """Partition directories overlapping [start, end) Unix seconds and a (lat_min, lat_max, lon_min, lon_max) bbox"""
+        if not os.path.isdir(self.root):
+            return []
+        first_day = _utc_date(start) if start is not None else None
+        last_day = _utc_date(end - 1) if end is not None else None
+
+        selected = []
+        for date_entry in sorted(os.scandir(self.root), key=lambda e: e.name):
+            if not date_entry.name.startswith('date='):
+                continue
+            day = datetime.strptime(date_entry.name[5:], '%Y-%m-%d').date()
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            for geo_entry in sorted(os.scandir(date_entry.path), key=lambda e: e.name):
+                if not geo_entry.name.startswith('geohash='):
+                    continue
+                if bbox is not None:
+                    cell_lat_min, cell_lat_max, cell_lon_min, cell_lon_max = geohash_bbox(geo_entry.name[8:])
+                    lat_min, lat_max, lon_min, lon_max = bbox
+                    if (cell_lat_max < lat_min or cell_lat_min > lat_max or
+                            cell_lon_max < lon_min or cell_lon_min > lon_max):
+                        continue
+                selected.append(geo_entry.path)
+        return selected
+
+    def query(self, start=None, end=None, bbox=None):
+        """Observations with start <= time < end inside bbox, sorted by time"""
+        chunks = []
+        for directory in self.partitions(start, end, bbox):
+            for name in live_files(os.listdir(directory)):
+                rows = np.load(os.path.join(directory, name), mmap_mode='r')
+                mask = np.ones(len(rows), dtype=bool)
+                if start is not None:
+                    mask &= rows['time'] >= start
+                if end is not None:
+                    mask &= rows['time'] < end
+                if bbox is not None:
+                    lat_min, lat_max, lon_min, lon_max = bbox
+                    mask &= ((rows['lat'] >= lat_min) & (rows['lat'] <= lat_max) &
+                             (rows['lon'] >= lon_min) & (rows['lon'] <= lon_max))
+                chunks.append(np.array(rows[mask]))
+
+        if not chunks:
+            return np.zeros(0, dtype=OBSERVATION_DTYPE)
+        result = np.concatenate(chunks)
+        return result[np.argsort(result['time'], kind='stable')]
+
+    def compact(self, start=None, end=None):
+        """Merge each partition's live files into one time-sorted compacted file"""
+        merged = 0
+        for directory in self.partitions(start, end):
+            names = [n for n in os.listdir(directory) if n.endswith('.npy')]
+            live = live_files(names)
+            if len(live) < 2:
+                continue
+            rows = np.concatenate([np.load(os.path.join(directory, n)) for n in live])
+            rows = rows[np.argsort(rows['time'], kind='stable')]
+            # Named after the newest file it merges, so it supersedes every part up
+            # to there as soon as it exists; removing them afterwards is cleanup
+            last = max(live, key=_file_key)
+            compacted = COMPACTED_PREFIX + last[last.index('-') + 1:]
+            self._write_atomic(os.path.join(directory, compacted), rows)
+            for name in names:
+                if name != compacted:
+                    os.unlink(os.path.join(directory, name))
+            merged += 1
+        return merged
@@ -4,20 +4,34 @@ Generate AQI Heatmap from ML Model
 This script loads the KNN model and generates a color-coded heatmap based on AQI predictions
 """
 
-import joblib
+import argparse
+import json
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
-from matplotlib.patches import Rectangle
-import seaborn as sns
-from sklearn.neighbors import KNeighborsRegressor
+import os
+import time
 import warnings
+from heatmap.cache import DEFAULT_CACHE_DIR, GridCache, grid_cache_key, predictor_name
+from heatmap.knn import BACKENDS, knn_backend
+from heatmap.parallel import ParallelPredictor
+from heatmap.pipeline import DTYPES, store_aqi
+from heatmap.lookup import AQILookup
+from heatmap.regions import (FALLBACK_NOISE_STD, batch_features, load_region_manifest,
+                             make_region, region_axes, region_noise, region_slug,
+                             regional_features, regional_predict_noise)
+from heatmap.render import render_regions
+from heatmap.stats import category_counts, norm_bounds
+from heatmap.timings import add_instrumentation_arguments, count_cells, instrumented, phase
 warnings.filterwarnings('ignore')
 
-def load_model():
+MODEL_PATH = 'ml/geographic_air_quality_knn_model.joblib'
+
+def load_model(path=MODEL_PATH):
     """Load the KNN model from the pickle file"""
     try:
-        model = joblib.load('ml/geographic_air_quality_knn_model.joblib')
+        with phase('import'):
+            import joblib
+        with phase('model-load'):
+            model = joblib.load(path)
         print(f"Model loaded successfully: {type(model)}")
         return model
     except Exception as e:
@@ -26,6 +40,8 @@ def load_model():
 
 def create_aqi_colormap():
     """Create AQI color mapping based on EPA standards"""
+    import matplotlib.colors as colors
+    
     # AQI ranges and corresponding colors
     aqi_ranges = [
         (0, 50, '#00E400', 'Good'),           # Green
@@ -38,68 +54,67 @@ def create_aqi_colormap():
     
     # Create discrete colormap
     colors_list = [color for _, _, color, _ in aqi_ranges]
-    bounds = [0, 50, 100, 150, 200, 300, 500]
+    bounds = norm_bounds()
     
     cmap = colors.ListedColormap(colors_list)
     norm = colors.BoundaryNorm(bounds, len(colors_list))
     
     return cmap, norm, aqi_ranges
 
-def generate_sample_data(grid_size=50):
-    """Generate sample geographic data for demonstration"""
-    # Create a grid representing geographic coordinates
-    # Using Dallas, TX area as example (32.7767, -96.7970)
-    lat_min, lat_max = 32.5, 33.0
-    lon_min, lon_max = -97.2, -96.5
+# Using Dallas, TX area as example (32.7767, -96.7970)
+SAMPLE_BBOX = (32.5, 33.0, -97.2, -96.5)
+SAMPLE_CENTER = {'Dallas': (32.7767, -96.7970)}
+SAMPLE_SEED = 42
+SAMPLE_AREA = 'Dallas-Fort Worth Area'
+
+def sample_grid(grid_size=50):
+    """Latitude and longitude meshgrids covering the sample area"""
+    lat_min, lat_max, lon_min, lon_max = SAMPLE_BBOX
     
     lats = np.linspace(lat_min, lat_max, grid_size)
     lons = np.linspace(lon_min, lon_max, grid_size)
     
     # Create meshgrid
     lon_grid, lat_grid = np.meshgrid(lons, lats)
-    
-    # Generate sample features (you would replace this with actual features)
-    # Features might include: population density, industrial activity, traffic, etc.
-    np.random.seed(42)  # For reproducible results
-    
-    # Simulate some realistic patterns
-    # Higher pollution near city center and industrial areas
-    center_lat, center_lon = 32.7767, -96.7970
-    
-    # Distance from city center
-    dist_from_center = np.sqrt((lat_grid - center_lat)**2 + (lon_grid - center_lon)**2)
-    
-    # Create features that might influence air quality
-    features = []
-    for i in range(grid_size):
-        for j in range(grid_size):
-            lat, lon = lat_grid[i, j], lon_grid[i, j]
-            
-            # Feature 1: Distance from city center (inverse relationship)
-            urban_factor = 1 / (1 + dist_from_center[i, j] * 100)
-            
-            # Feature 2: Simulated industrial activity
-            industrial_factor = np.random.exponential(0.3)
-            
-            # Feature 3: Simulated traffic density
-            traffic_factor = np.random.gamma(2, 0.5)
-            
-            # Feature 4: Weather factor (wind, humidity simulation)
-            weather_factor = np.random.normal(0.5, 0.2)
-            
-            # Feature 5: Elevation/topography effect
-            topo_factor = np.sin(lat * 10) * np.cos(lon * 10) * 0.1 + 0.5
-            
-            features.append([urban_factor, industrial_factor, traffic_factor, 
-                           weather_factor, topo_factor])
-    
-    return np.array(features), lat_grid, lon_grid
+    return lat_grid, lon_grid
 
-def predict_aqi_with_fallback(model, features):
-    """Predict AQI values with fallback if model fails"""
+def sample_region(grid_size=50):
+    """The sample area as a manifest region, so it shares the batch feature code"""
+    return make_region(SAMPLE_AREA, SAMPLE_BBOX, grid_size, SAMPLE_CENTER['Dallas'])
+
+def generate_sample_data(grid_size=50, dtype=np.float64):
+    """
+    Generate sample geographic data for demonstration, as a `dtype` feature matrix.
+
+    Returns the features, the lat/lon meshgrids and the per-cell noise of the
+    fallback prediction. Every random column is drawn from per-row streams of
+    SAMPLE_SEED (see heatmap.regions.region_noise), so the same seed always
+    gives the same data, whatever else the process has drawn.
+    """
+    # Create a grid representing geographic coordinates
+    lat_grid, lon_grid = sample_grid(grid_size)
+    region = sample_region(grid_size)
+    noise = region_noise(region, SAMPLE_SEED)
+    
+    # Urban factor (distance from the city centre), simulated industrial
+    # activity, traffic density and weather, and a topography effect
+    features = regional_features(region, noise, dtype=dtype)
+    return features, lat_grid, lon_grid, regional_predict_noise(region, noise)
+
+def predict_aqi_with_fallback(model, features, predictor=None, noise=None, rng=None):
+    """
+    Predict AQI values with fallback if model fails.
+
+    The fallback adds `noise` (one value per row) when given, otherwise normal
+    noise drawn from `rng`, a numpy Generator (a fresh unseeded one if None).
+    """
     try:
         if model and hasattr(model, 'predict'):
-            predictions = model.predict(features)
+            if predictor is not None:
+                # Shard across the worker pool
+                predictions = predictor.predict(features)
+            else:
+                predictions = model.predict(features)
         else:
             # Fallback: create realistic AQI predictions based on features
             print("Using fallback prediction method")
@@ -110,156 +125,298 @@ def predict_aqi_with_fallback(model, features):
                        features[:, 4] * 20)        # Topography factor
             
             # Add some noise and ensure realistic AQI range
-            noise = np.random.normal(0, 10, len(base_aqi))
+            if noise is None:
+                rng = rng if rng is not None else np.random.default_rng()
+                noise = rng.normal(0, FALLBACK_NOISE_STD, len(base_aqi))
             predictions = np.clip(base_aqi + noise, 0, 300)
             
         return predictions
     except Exception as e:
         print(f"Prediction error: {e}")
         # Ultimate fallback: generate sample AQI data
-        return np.random.uniform(20, 150, len(features))
+        rng = rng if rng is not None else np.random.default_rng()
+        return rng.uniform(20, 150, len(features))
 
-def create_heatmap():
-    """Create and save the AQI heatmap"""
-    print("Loading ML model...")
-    model = load_model()
+def predict_sample_grid(model, grid_size=50, workers=1, dtype='float64', knn='exact'):
+    """Predict AQI over the sample area with the loaded model"""
+    feature_dtype, grid_dtype = DTYPES[dtype]
     
     print("Generating geographic data...")
-    features, lat_grid, lon_grid = generate_sample_data(grid_size=50)
+    with phase('features'):
+        count_cells(grid_size**2)
+        features, lat_grid, lon_grid, noise = generate_sample_data(grid_size, feature_dtype)
     
     print("Making AQI predictions...")
-    aqi_predictions = predict_aqi_with_fallback(model, features)
+    with phase('predict'):
+        count_cells(len(features))
+        if workers > 1 and model and hasattr(model, 'predict'):
+            print(f"Running inference on {workers} worker processes...")
+            with ParallelPredictor(MODEL_PATH, workers, len(features), features.shape[1],
+                                   dtype=features.dtype, backend=knn) as predictor:
+                aqi_predictions = predict_aqi_with_fallback(model, features, predictor)
+        else:
+            aqi_predictions = predict_aqi_with_fallback(model, features, noise=noise)
     
     # Reshape predictions to match grid
-    aqi_grid = aqi_predictions.reshape(lat_grid.shape)
-    
-    print("Creating visualization...")
-    # Create the plot
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
-    
-    # Get AQI colormap
-    cmap, norm, aqi_ranges = create_aqi_colormap()
-    
-    # Main heatmap
-    im = ax1.imshow(aqi_grid, extent=[lon_grid.min(), lon_grid.max(), 
-                                     lat_grid.min(), lat_grid.max()],
-                   cmap=cmap, norm=norm, origin='lower', aspect='auto')
+    return store_aqi(aqi_predictions.reshape(lat_grid.shape),
+                     np.empty(lat_grid.shape, dtype=grid_dtype))
+
+def sample_aqi_grid(workers=1, cache=None, grid_size=50, dtype='float64', knn='exact'):
+    """Return the sample-area AQI grid and its meshgrids, from the cache when possible"""
+    lat_grid, lon_grid = sample_grid(grid_size)
     
-    ax1.set_title('Air Quality Index (AQI) Heatmap\nDallas-Fort Worth Area', 
-                  fontsize=14, fontweight='bold')
-    ax1.set_xlabel('Longitude', fontsize=12)
-    ax1.set_ylabel('Latitude', fontsize=12)
+    # Whether the model or the fallback predicts is part of the cache key
+    print("Loading ML model...")
+    model = knn_backend(load_model(), knn)
+    
+    # The sample data is always seeded, so its grid can be reused across runs
+    aqi_grid, cache_key = None, None
+    if cache is not None:
+        cache_key = grid_cache_key('regional', MODEL_PATH, SAMPLE_BBOX, lat_grid.shape,
+                                   SAMPLE_SEED, SAMPLE_CENTER, dtype, knn,
+                                   predictor=predictor_name(model))
+        with phase('cache'):
+            aqi_grid = cache.load(cache_key)
+        if aqi_grid is not None:
+            print(f"Using cached AQI grid {cache_key}")
+    
+    if aqi_grid is None:
+        aqi_grid = predict_sample_grid(model, grid_size, workers, dtype, knn)
+        if cache_key is not None:
+            cache.store(cache_key, aqi_grid)
+    
+    return aqi_grid, lat_grid, lon_grid
+
+def create_heatmap(workers=1, cache=None, grid_size=50, dtype='float64', knn='exact',
+                   render_workers=1):
+    """Create and save the AQI heatmap"""
+    aqi_grid, lat_grid, lon_grid = sample_aqi_grid(workers, cache, grid_size, dtype, knn)
     
-    # Add colorbar with custom ticks
-    cbar = plt.colorbar(im, ax=ax1, shrink=0.8)
-    cbar.set_label('AQI Value', fontsize=12)
-    cbar.set_ticks([25, 75, 125, 175, 250, 400])
-    cbar.set_ticklabels(['25', '75', '125', '175', '250', '400'])
+    print("Creating visualization...")
+    with phase('render'):
+        count_cells(aqi_grid.size)
+        output_file, contour_file = render_heatmaps(aqi_grid, lat_grid, lon_grid,
+                                                    render_workers)
     
-    # Add AQI category legend
-    ax2.axis('off')
-    ax2.set_title('AQI Categories', fontsize=14, fontweight='bold')
+    return aqi_grid, output_file, contour_file
+
+def render_heatmaps(aqi_grid, lat_grid, lon_grid, render_workers=1):
+    """Draw and save the heatmap and contour figures"""
+    with phase('import'):
+        cmap, norm, aqi_ranges = create_aqi_colormap()
+    
+    bbox = (lat_grid.min(), lat_grid.max(), lon_grid.min(), lon_grid.max())
+    aqi_grid = np.asarray(aqi_grid)
+    (output_file, _), (contour_file, _) = render_regions(
+        [('heatmap', aqi_grid, bbox, SAMPLE_AREA, 'aqi_heatmap.png'),
+         ('contour', aqi_grid, bbox, SAMPLE_AREA, 'aqi_contour_map.png')],
+        cmap, norm, aqi_ranges, dpi=300, workers=render_workers)
+    print(f"Heatmap saved as: {output_file}")
+    print(f"Contour map saved as: {contour_file}")
     
-    y_pos = 0.9
-    for start, end, color, label in aqi_ranges:
-        # Create colored rectangle
-        rect = Rectangle((0.1, y_pos-0.05), 0.1, 0.08, 
-                        facecolor=color, edgecolor='black', linewidth=1)
-        ax2.add_patch(rect)
+    return output_file, contour_file
+
+def create_region_batch(manifest, out_dir='regional_maps', workers=1, render_workers=1,
+                        contours=False, dpi=300, seed=SAMPLE_SEED, dtype='float64',
+                        knn='exact', lookup=None):
+    """
+    Map every region of a manifest with one model load and one prediction pass.
+
+    All regions' features are stacked into a single matrix and predicted
+    together, then the maps are rendered across render_workers processes. A
+    JSON report with per-region and total timings is written to out_dir. With
+    a compiled heatmap.lookup.AQILookup the grids are interpolated from it and
+    the model is never loaded.
+    """
+    total_start = time.perf_counter()
+    feature_dtype, grid_dtype = DTYPES[dtype]
+    regions = load_region_manifest(manifest)
+    print(f"Loaded {len(regions)} regions from {manifest}")
+    
+    if lookup is not None:
+        print(f"Interpolating AQI from the compiled lookup ({lookup.describe()})")
+        offsets = np.cumsum([0] + [region.resolution**2 for region in regions])
+        features_s = 0.0
+        start = time.perf_counter()
+        with phase('predict'):
+            count_cells(offsets[-1])
+            predictions = np.concatenate([lookup.grid(*region_axes(region)).ravel()
+                                          for region in regions])
+        predict_s = time.perf_counter() - start
+    else:
+        print("Loading ML model...")
+        model = knn_backend(load_model(), knn)
         
-        # Add text
-        ax2.text(0.25, y_pos, f"{label}", fontsize=11, va='center')
-        ax2.text(0.25, y_pos-0.03, f"AQI: {start}-{end}", fontsize=9, va='center', 
-                style='italic', color='gray')
+        print("Generating geographic data...")
+        start = time.perf_counter()
+        with phase('features'):
+            count_cells(sum(region.resolution**2 for region in regions))
+            features, offsets, noise = batch_features(regions, seed, feature_dtype)
+        features_s = time.perf_counter() - start
         
-        y_pos -= 0.15
-    
-    ax2.set_xlim(0, 1)
-    ax2.set_ylim(0, 1)
-    
-    # Add statistics
-    stats_text = f"""Statistics:
-Min AQI: {aqi_grid.min():.1f}
-Max AQI: {aqi_grid.max():.1f}
-Mean AQI: {aqi_grid.mean():.1f}
-Std Dev: {aqi_grid.std():.1f}
+        print(f"Making AQI predictions for {len(features):,} points...")
+        start = time.perf_counter()
+        with phase('predict'):
+            count_cells(len(features))
+            if workers > 1 and model and hasattr(model, 'predict'):
+                with ParallelPredictor(MODEL_PATH, workers, len(features), features.shape[1],
+                                       dtype=features.dtype, backend=knn) as predictor:
+                    predictions = predict_aqi_with_fallback(model, features, predictor)
+            else:
+                predictions = predict_aqi_with_fallback(model, features, noise=noise)
+        predict_s = time.perf_counter() - start
+    
+    shapes = [(region.resolution, region.resolution) for region in regions]
+    grids = [store_aqi(predictions[a:b].reshape(shape), np.empty(shape, dtype=grid_dtype))
+             for shape, a, b in zip(shapes, offsets[:-1], offsets[1:])]
+    kinds = ['heatmap', 'contour'] if contours else ['heatmap']
+    jobs = [(kind, grid, region.bbox, region.label,
+             os.path.join(out_dir, f"{region_slug(region.label)}_{kind}.png"))
+            for region, grid in zip(regions, grids) for kind in kinds]
+    
+    print(f"Rendering {len(jobs)} maps to {out_dir}...")
+    start = time.perf_counter()
+    with phase('render'):
+        count_cells(offsets[-1])
+        cmap, norm, aqi_ranges = create_aqi_colormap()
+        rendered = render_regions(jobs, cmap, norm, aqi_ranges, dpi=dpi, workers=render_workers)
+    render_s = time.perf_counter() - start
+    
+    # Features and predictions are produced in one pass, so their time is
+    # apportioned to regions by cell count
+    n_cells = int(offsets[-1])
+    per_region = []
+    for i, (region, grid) in enumerate(zip(regions, grids)):
+        outputs = rendered[i * len(kinds):(i + 1) * len(kinds)]
+        share = grid.size / n_cells
+        per_region.append({
+            'label': region.label,
+            'bbox': list(region.bbox),
+            'resolution': region.resolution,
+            'aqi': {'min': float(grid.min()), 'mean': float(grid.mean()),
+                    'max': float(grid.max())},
+            'categories': category_counts(grid).tolist(),
+            'seconds': {'features': features_s * share, 'predict': predict_s * share,
+                        'render': sum(seconds for _, seconds in outputs)},
+            'outputs': [path for path, _ in outputs],
+        })
+    
+    report = {
+        'manifest': manifest,
+        'regions': len(regions),
+        'cells': int(n_cells),
+        'dtype': dtype,
+        'knn': knn,
+        'lookup': lookup is not None,
+        'maps': len(jobs),
+        'seconds': {'features': features_s, 'predict': predict_s, 'render': render_s,
+                    'total': time.perf_counter() - total_start},
+        'per_region': per_region,
+    }
+    report_file = os.path.join(out_dir, 'batch_report.json')
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    return report, report_file
 
-Grid Size: {aqi_grid.shape[0]}×{aqi_grid.shape[1]}
-Total Points: {aqi_grid.size}
+def print_batch_summary(report, report_file):
+    """Print per-region results and total timings of a batch run"""
+    print(f"\n{'region':<28} {'cells':>7} {'mean AQI':>9} {'render s':>9}")
+    for entry in report['per_region']:
+        print(f"{entry['label'][:28]:<28} {entry['resolution']**2:>7,} "
+              f"{entry['aqi']['mean']:>9.1f} {entry['seconds']['render']:>9.2f}")
+    
+    seconds = report['seconds']
+    print(f"\n✅ {report['maps']} maps for {report['regions']} regions "
+          f"({report['cells']:,} points) in {seconds['total']:.1f}s")
+    print(f"   features {seconds['features']:.2f}s, predict {seconds['predict']:.2f}s, "
+          f"render {seconds['render']:.2f}s")
+    print(f"   📄 Report: {report_file}")
 
-Model: KNN Geographic Air Quality
-Area: Dallas-Fort Worth, TX"""
-    
-    ax2.text(0.1, 0.35, stats_text, fontsize=10, va='top', 
-            bbox=dict(boxstyle="round,pad=0.3", facecolor="lightgray", alpha=0.7))
-    
-    plt.tight_layout()
-    
-    # Save the plot
-    output_file = 'aqi_heatmap.png'
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
-    print(f"Heatmap saved as: {output_file}")
-    
-    # Also create a contour version
-    fig2, ax3 = plt.subplots(1, 1, figsize=(12, 8))
-    
-    # Create contour plot with more levels for smoother appearance
-    levels = np.linspace(aqi_grid.min(), aqi_grid.max(), 20)
-    contour = ax3.contourf(lon_grid, lat_grid, aqi_grid, levels=levels, 
-                          cmap=cmap, norm=norm, alpha=0.8)
-    
-    # Add contour lines
-    contour_lines = ax3.contour(lon_grid, lat_grid, aqi_grid, levels=8, 
-                               colors='black', alpha=0.4, linewidths=0.5)
-    ax3.clabel(contour_lines, inline=True, fontsize=8, fmt='%1.0f')
-    
-    ax3.set_title('Air Quality Index (AQI) Contour Map\nDallas-Fort Worth Area', 
-                  fontsize=14, fontweight='bold')
-    ax3.set_xlabel('Longitude', fontsize=12)
-    ax3.set_ylabel('Latitude', fontsize=12)
-    
-    # Add colorbar
-    cbar2 = plt.colorbar(contour, ax=ax3, shrink=0.8)
-    cbar2.set_label('AQI Value', fontsize=12)
-    
-    plt.tight_layout()
-    
-    # Save contour plot
-    contour_file = 'aqi_contour_map.png'
-    plt.savefig(contour_file, dpi=300, bbox_inches='tight')
-    print(f"Contour map saved as: {contour_file}")
-    
-    return aqi_grid, output_file, contour_file
+def print_summary(aqi_data):
+    """Print the AQI range, average and category distribution"""
+    print(f"\nAQI Data Summary:")
+    print(f"   Range: {aqi_data.min():.1f} - {aqi_data.max():.1f}")
+    print(f"   Average: {aqi_data.mean():.1f}")
+    
+    # Categorize AQI values in one pass
+    good, moderate, unhealthy_sensitive, unhealthy, very_unhealthy, hazardous = category_counts(aqi_data)
+    
+    total_points = aqi_data.size
+    print(f"\nAQI Distribution:")
+    print(f"   🟢 Good (0-50): {good} points ({good/total_points*100:.1f}%)")
+    print(f"   🟡 Moderate (51-100): {moderate} points ({moderate/total_points*100:.1f}%)")
+    print(f"   🟠 Unhealthy for Sensitive (101-150): {unhealthy_sensitive} points ({unhealthy_sensitive/total_points*100:.1f}%)")
+    print(f"   🔴 Unhealthy (151-200): {unhealthy} points ({unhealthy/total_points*100:.1f}%)")
+    print(f"   🟣 Very Unhealthy (201-300): {very_unhealthy} points ({very_unhealthy/total_points*100:.1f}%)")
+    print(f"   🟤 Hazardous (301+): {hazardous} points ({hazardous/total_points*100:.1f}%)")
+
+def add_arguments(parser):
+    """Register the regional heatmap options on an argparse parser"""
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Run model inference on this many worker processes')
+    parser.add_argument('--render-workers', type=int, default=1,
+                        help='Render the heatmap and contour map on separate processes')
+    parser.add_argument('--manifest', default=None,
+                        help='JSON or CSV list of regions to map in one batch run')
+    parser.add_argument('--out-dir', default='regional_maps',
+                        help='Output directory for --manifest runs')
+    parser.add_argument('--contours', action='store_true',
+                        help='Also draw a contour map per region in --manifest runs')
+    parser.add_argument('--dpi', type=int, default=300,
+                        help='Resolution of the maps written by --manifest runs')
+    parser.add_argument('--dtype', choices=sorted(DTYPES), default='float64',
+                        help='float32 builds float32 features and stores AQI grids as uint16')
+    parser.add_argument('--knn', choices=BACKENDS, default='exact',
+                        help='Nearest-neighbour backend for the KNN model (grid is approximate and '
+                             'only serves haversine lat/lon models)')
+    parser.add_argument('--lookup', default=None,
+                        help='Interpolate --manifest regions from a `python -m heatmap compile` lookup')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='Directory of cached AQI grids')
+    parser.add_argument('--cache-max-mb', type=int, default=2048,
+                        help='Evict least recently used grids beyond this size')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always recompute the grid')
+    return parser
+
+def grid_options(args):
+    """Keyword arguments for sample_aqi_grid/create_heatmap from parsed options"""
+    return dict(
+        workers=args.workers,
+        dtype=args.dtype,
+        knn=args.knn,
+        cache=None if args.no_cache else GridCache(args.cache_dir, args.cache_max_mb * 1024**2))
+
+def batch_options(args):
+    """Keyword arguments for create_region_batch from parsed options"""
+    return dict(manifest=args.manifest, out_dir=args.out_dir, workers=args.workers,
+                render_workers=args.render_workers, contours=args.contours, dpi=args.dpi,
+                dtype=args.dtype, knn=args.knn,
+                lookup=AQILookup.load(args.lookup) if args.lookup else None)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Generate the regional AQI heatmap")
+    add_instrumentation_arguments(parser)
+    return add_arguments(parser).parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args()
     print("=== AQI Heatmap Generator ===")
     print("Generating heatmap from ML model predictions...")
     
     try:
-        aqi_data, heatmap_file, contour_file = create_heatmap()
-        print(f"\n✅ Success! Generated visualizations:")
-        print(f"   📊 Heatmap: {heatmap_file}")
-        print(f"   🗺️  Contour Map: {contour_file}")
-        print(f"\nAQI Data Summary:")
-        print(f"   Range: {aqi_data.min():.1f} - {aqi_data.max():.1f}")
-        print(f"   Average: {aqi_data.mean():.1f}")
-        
-        # Categorize AQI values
-        good = np.sum(aqi_data <= 50)
-        moderate = np.sum((aqi_data > 50) & (aqi_data <= 100))
-        unhealthy_sensitive = np.sum((aqi_data > 100) & (aqi_data <= 150))
-        unhealthy = np.sum((aqi_data > 150) & (aqi_data <= 200))
-        very_unhealthy = np.sum((aqi_data > 200) & (aqi_data <= 300))
-        hazardous = np.sum(aqi_data > 300)
-        
-        total_points = aqi_data.size
-        print(f"\nAQI Distribution:")
-        print(f"   🟢 Good (0-50): {good} points ({good/total_points*100:.1f}%)")
-        print(f"   🟡 Moderate (51-100): {moderate} points ({moderate/total_points*100:.1f}%)")
-        print(f"   🟠 Unhealthy for Sensitive (101-150): {unhealthy_sensitive} points ({unhealthy_sensitive/total_points*100:.1f}%)")
-        print(f"   🔴 Unhealthy (151-200): {unhealthy} points ({unhealthy/total_points*100:.1f}%)")
-        print(f"   🟣 Very Unhealthy (201-300): {very_unhealthy} points ({very_unhealthy/total_points*100:.1f}%)")
-        print(f"   🟤 Hazardous (301+): {hazardous} points ({hazardous/total_points*100:.1f}%)")
+        with instrumented('regional', args):
+            if args.manifest:
+                print_batch_summary(*create_region_batch(**batch_options(args)))
+            else:
+                aqi_data, heatmap_file, contour_file = create_heatmap(
+                    **grid_options(args), render_workers=args.render_workers)
+                print(f"\n✅ Success! Generated visualizations:")
+                print(f"   📊 Heatmap: {heatmap_file}")
+                print(f"   🗺️  Contour Map: {contour_file}")
+                print_summary(aqi_data)
         
     except Exception as e:
         print(f"❌ Error generating heatmap: {e}")
@@ -4,20 +4,42 @@ Generate World-Scale AQI Heatmap from ML Model
 This script creates a global air quality visualization with realistic pollution patterns
 """
 
-import joblib
+import argparse
+import functools
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
-from matplotlib.patches import Rectangle
-import seaborn as sns
-from sklearn.neighbors import KNeighborsRegressor
 import warnings
+from heatmap.adaptive import DEFAULT_BASE_DEG, DEFAULT_MAX_LEVEL, DEFAULT_THRESHOLD, refine_quadtree
+from heatmap.cache import DEFAULT_CACHE_DIR, GridCache, grid_cache_key, predictor_name
+from heatmap.catalogue import SourceCatalogue, as_catalogue, sources_in_reach
+from heatmap.dispersion import PlumeDispersion
+from heatmap.features import FALLBACK_NOISE_STD, N_FEATURES, NoiseStreams, build_world_features
+from heatmap.parallel import ParallelPredictor
+from heatmap.knn import BACKENDS, knn_backend
+from heatmap.lookup import AQILookup
+from heatmap.pipeline import DTYPES, allocate_grid, predict_grid_streaming, store_aqi
+from heatmap.rasters import DEFAULT_RASTER_DIR, StaticRasterStore, bbox_window
+from heatmap.render import close_figure, render_concurrently
+from heatmap.stats import grid_statistics, norm_bounds
+from heatmap.timings import add_instrumentation_arguments, count_cells, instrumented, phase
 warnings.filterwarnings('ignore')
 
-def load_model():
+# matplotlib and joblib are imported inside the functions that use them so that
+# grid-only runs (cached grids, stats) start without paying for them
+
+MODEL_PATH = 'ml/geographic_air_quality_knn_model.joblib'
+
+# Sources labelled on the world map, and the source count beyond which markers
+# shrink to rasterized dots
+LABELLED_CITIES = ['Beijing', 'Delhi', 'New York', 'London', 'São Paulo', 'Cairo', 'Sydney']
+MARKER_DETAIL_LIMIT = 1000
+
+def load_model(path=MODEL_PATH):
     """Load the KNN model from the pickle file"""
     try:
-        model = joblib.load('ml/geographic_air_quality_knn_model.joblib')
+        with phase('import'):
+            import joblib
+        with phase('model-load'):
+            model = joblib.load(path)
         print(f"Model loaded successfully: {type(model)}")
         return model
     except Exception as e:
@@ -26,6 +48,8 @@ def load_model():
 
 def create_aqi_colormap():
     """Create AQI color mapping based on EPA standards"""
+    import matplotlib.colors as colors
+    
     aqi_ranges = [
         (0, 50, '#00E400', 'Good'),           # Green
         (51, 100, '#FFFF00', 'Moderate'),     # Yellow  
@@ -36,7 +60,7 @@ def create_aqi_colormap():
     ]
     
     colors_list = [color for _, _, color, _ in aqi_ranges]
-    bounds = [0, 50, 100, 150, 200, 300, 500]
+    bounds = norm_bounds()
     
     cmap = colors.ListedColormap(colors_list)
     norm = colors.BoundaryNorm(bounds, len(colors_list))
@@ -96,115 +120,73 @@ def get_major_cities():
         'Melbourne': (-37.8136, 144.9631, 65),
     }
 
-def generate_world_data(grid_size=180):
-    """Generate world-scale geographic data"""
-    print(f"Generating world grid with {grid_size}x{grid_size//2} resolution...")
-    
-    # World coordinates
-    lat_min, lat_max = -90, 90
-    lon_min, lon_max = -180, 180
+# World coordinates
+WORLD_BBOX = (-90, 90, -180, 180)
+
+def world_axes(grid_size=180):
+    """Latitude and longitude axes of the world grid"""
+    lat_min, lat_max, lon_min, lon_max = WORLD_BBOX
     
     # Create grid (higher resolution for longitude)
     lats = np.linspace(lat_min, lat_max, grid_size//2)  # 90 points
     lons = np.linspace(lon_min, lon_max, grid_size)     # 180 points
-    
-    lon_grid, lat_grid = np.meshgrid(lons, lats)
+    return lats, lons
+
+def load_sources(path=None):
+    """The source table: a CSV/GeoJSON catalogue when a path is given, else the major cities"""
+    if path is None:
+        return get_major_cities()
+    with phase('load'):
+        catalogue = SourceCatalogue.load(path)
+    print(f"Loaded {len(catalogue):,} sources from {path}")
+    return catalogue
+
+def generate_world_data(grid_size=180, seed=None, noise=None, axes=None, static=None,
+                        dtype=np.float64, cities=None, dispersion=None):
+    """
+    Generate world-scale geographic data
+    
+    `axes` overrides the (lats, lons) of the grid, e.g. for a bbox window, and
+    `static` supplies its precomputed static-feature raster. Features are written
+    straight into one preallocated `dtype` buffer. `cities` is the source table
+    (a get_major_cities dict or a heatmap.catalogue.SourceCatalogue), and
+    `dispersion` an optional heatmap.dispersion.PlumeDispersion for its plumes.
+    """
+    lats, lons = world_axes(grid_size) if axes is None else axes
+    print(f"Generating world grid with {len(lons)}x{len(lats)} resolution...")
+    # Broadcast views rather than meshgrid copies: full-size grids without the memory
+    lon_grid, lat_grid = np.broadcast_arrays(lons[None, :], lats[:, None])
     
     # Get major cities data
-    cities = get_major_cities()
+    if cities is None:
+        cities = get_major_cities()
     
     print("Calculating pollution patterns based on geographic factors...")
     
-    # Initialize base pollution levels
-    features = []
-    base_pollution = np.zeros_like(lat_grid)
-    
-    # Add city pollution influence
-    for city_name, (city_lat, city_lon, pollution_level) in cities.items():
-        # Calculate distance from each city
-        dist = np.sqrt((lat_grid - city_lat)**2 + (lon_grid - city_lon)**2)
-        # Add pollution influence (decreases with distance)
-        influence = pollution_level * np.exp(-dist / 5.0)  # 5-degree influence radius
-        base_pollution += influence
-    
-    # Add regional patterns
-    for i in range(len(lats)):
-        for j in range(len(lons)):
-            lat, lon = lat_grid[i, j], lon_grid[i, j]
-            
-            # Base pollution from cities
-            city_pollution = base_pollution[i, j]
-            
-            # Regional factors
-            # 1. Industrial regions (higher pollution)
-            industrial_factor = 0
-            if 20 <= lat <= 60 and 100 <= lon <= 140:  # East Asia industrial belt
-                industrial_factor = 40
-            elif 40 <= lat <= 60 and -10 <= lon <= 40:  # European industrial
-                industrial_factor = 25
-            elif 25 <= lat <= 50 and -125 <= lon <= -70:  # North American industrial
-                industrial_factor = 20
-            
-            # 2. Desert regions (dust pollution)
-            desert_factor = 0
-            if 15 <= lat <= 35 and -20 <= lon <= 60:  # Sahara/Middle East
-                desert_factor = 30
-            elif 20 <= lat <= 40 and 70 <= lon <= 120:  # Central Asia deserts
-                desert_factor = 25
-            
-            # 3. Ocean areas (clean air)
-            ocean_factor = 0
-            if abs(lat) < 60:  # Not polar regions
-                # Simplified ocean detection (areas far from major landmasses)
-                if (-180 <= lon <= -120 and 0 <= lat <= 60) or \
-                   (-60 <= lon <= 20 and -60 <= lat <= 0) or \
-                   (120 <= lon <= 180 and -40 <= lat <= 40):
-                    ocean_factor = -20  # Negative = cleaner air
-            
-            # 4. Polar regions (generally cleaner)
-            polar_factor = 0
-            if abs(lat) > 60:
-                polar_factor = -15
-            
-            # 5. Rainforest regions (cleaner air)
-            forest_factor = 0
-            if -10 <= lat <= 10 and -80 <= lon <= -40:  # Amazon
-                forest_factor = -10
-            elif -10 <= lat <= 10 and 10 <= lon <= 40:  # Central Africa
-                forest_factor = -8
-            elif -10 <= lat <= 10 and 95 <= lon <= 140:  # Southeast Asia
-                forest_factor = -5
-            
-            # 6. Population density factor
-            pop_factor = np.random.exponential(0.2) * 10
-            
-            # 7. Weather/seasonal variation
-            weather_factor = np.random.normal(0, 5)
-            
-            # Combine all factors
-            total_pollution = max(0, city_pollution + industrial_factor + 
-                                desert_factor + ocean_factor + polar_factor + 
-                                forest_factor + pop_factor + weather_factor)
-            
-            # Create feature vector
-            features.append([
-                city_pollution / 100,      # Normalized city influence
-                industrial_factor / 50,    # Industrial factor
-                desert_factor / 40,        # Desert factor
-                abs(ocean_factor) / 30,    # Ocean proximity
-                abs(polar_factor) / 20,    # Polar factor
-                abs(forest_factor) / 15,   # Forest factor
-                pop_factor / 20,           # Population factor
-                weather_factor / 10        # Weather factor
-            ])
-    
-    return np.array(features), lat_grid, lon_grid, cities
+    # City influence, regional masks and batched noise in one vectorized pass
+    if noise is None:
+        noise = NoiseStreams(seed)
+    features, _ = build_world_features(lats, lons, cities, noise=noise, static=static,
+                                       dtype=dtype, dispersion=dispersion)
+    
+    return features, lat_grid, lon_grid, cities
 
-def predict_world_aqi(model, features, lat_grid, lon_grid):
-    """Predict AQI values for the world grid"""
+def predict_world_aqi(model, features, lat_grid, lon_grid, rng=None, predictor=None, noise=None):
+    """
+    Predict AQI values for the world grid
+    
+    `noise` optionally supplies the fallback's per-cell noise instead of drawing it
+    from `rng`, so a subset of cells can be re-predicted with the values they had.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
     try:
         if model and hasattr(model, 'predict'):
-            predictions = model.predict(features)
+            if predictor is not None:
+                # Shard across the worker pool
+                predictions = predictor.predict(features)
+            else:
+                predictions = model.predict(features)
         else:
             print("Using enhanced fallback prediction method for world data...")
             # Enhanced fallback based on multiple factors
@@ -220,32 +202,224 @@ def predict_world_aqi(model, features, lat_grid, lon_grid):
             )
             
             # Add realistic noise and constraints
-            noise = np.random.normal(0, 8, len(base_aqi))
+            if noise is None:
+                noise = rng.normal(0, FALLBACK_NOISE_STD, len(base_aqi))
             predictions = np.clip(base_aqi + noise + 30, 5, 400)  # Base level + variation
             
         return predictions
     except Exception as e:
         print(f"Prediction error: {e}")
         # Ultimate fallback
-        return np.random.uniform(20, 150, len(features))
+        return rng.uniform(20, 150, len(features))
 
-def create_world_heatmap():
-    """Create and save the world AQI heatmap"""
-    print("=== World AQI Heatmap Generator ===")
+def predict_world_grid(model, lats, lons, chunk_rows=None, seed=None, grid_file=None,
+                       predictor=None, static=None, dtype='float64', cities=None,
+                       dispersion=None, window=None):
+    """
+    Predict the AQI grid, either in one pass or streamed in latitude bands
+    
+    `dtype` is a heatmap.pipeline.DTYPES mode; 'float32' builds float32 features
+    and returns the AQI grid as uint16. A PlumeDispersion is convolved per band
+    when streaming. `window` is the grid's (row_offset, col_offset, row_width)
+    in the world grid, so a bbox gets the world grid's noise (see NoiseStreams).
+    """
+    feature_dtype, grid_dtype = DTYPES[dtype]
+    predict = functools.partial(predict_world_aqi, predictor=predictor)
+    if chunk_rows:
+        # Stream latitude bands so memory is bounded by chunk_rows, not grid size
+        print(f"Streaming global AQI predictions in bands of {chunk_rows} rows...")
+        if cities is None:
+            cities = get_major_cities()
+        aqi_grid = allocate_grid((len(lats), len(lons)), grid_file, dtype=grid_dtype)
+        predict_grid_streaming(model, predict, lats, lons, cities, chunk_rows, seed=seed,
+                               out=aqi_grid, static=static, dtype=dtype,
+                               dispersion=dispersion, window=window)
+    else:
+        print("Generating world geographic data...")
+        noise = NoiseStreams(seed, window=window)
+        with phase('features'):
+            count_cells(len(lats) * len(lons))
+            features, lat_grid, lon_grid, cities = generate_world_data(
+                noise=noise, axes=(lats, lons), static=static, dtype=feature_dtype,
+                cities=cities, dispersion=dispersion)
+        
+        print("Making global AQI predictions...")
+        with phase('predict'):
+            count_cells(len(features))
+            aqi_predictions = predict(model, features, lat_grid, lon_grid,
+                                      noise=noise.predict_noise(0, len(lats), len(lons)))
+        
+        # Reshape predictions to match grid
+        aqi_grid = aqi_predictions.reshape(lat_grid.shape)
+        if aqi_grid.dtype != grid_dtype:
+            aqi_grid = store_aqi(aqi_grid, np.empty(aqi_grid.shape, dtype=grid_dtype))
+        if grid_file:
+            np.save(grid_file, aqi_grid)
+    
+    return aqi_grid
+
+def run_world_prediction(model, lats, lons, chunk_rows=None, seed=None, grid_file=None,
+                         workers=1, static=None, dtype='float64', knn='exact', cities=None,
+                         dispersion=None, window=None):
+    """
+    Predict the world grid with the loaded model, optionally on a worker pool
+    
+    `knn` is the heatmap.knn backend the model was wrapped in; the workers
+    load the model again and wrap it the same way.
+    """
+    predictor = None
+    if workers > 1 and model and hasattr(model, 'predict'):
+        print(f"Starting {workers} inference workers...")
+        max_rows = (chunk_rows or len(lats)) * len(lons)
+        predictor = ParallelPredictor(MODEL_PATH, workers, max_rows, N_FEATURES,
+                                      dtype=DTYPES[dtype][0], backend=knn)
     
-    print("Loading ML model...")
-    model = load_model()
+    try:
+        aqi_grid = predict_world_grid(model, lats, lons, chunk_rows, seed, grid_file, predictor,
+                                      static, dtype, cities, dispersion, window)
+    finally:
+        if predictor is not None:
+            predictor.close()
+    return aqi_grid
+
+def world_aqi_grid(grid_size=180, chunk_rows=None, seed=None, grid_file=None,
+                   workers=1, cache=None, bbox=None, rasters=None, dtype='float64',
+                   knn='exact', lookup=None, sources=None, adaptive=None, dispersion=None):
+    """
+    Return the world AQI grid and its axes, from the cache when possible
+    
+    `bbox` restricts the grid to the cells of the grid_size world grid inside it.
+    `rasters` is a StaticRasterStore; when it holds a baked raster for this
+    resolution only the bbox window of it is read instead of recomputing the
+    static layers. With a compiled heatmap.lookup.AQILookup the grid is
+    interpolated from it instead of running the model. `sources` replaces the
+    get_major_cities table, e.g. with a heatmap.catalogue.SourceCatalogue; with a
+    bbox only the catalogue sources that can reach it are used. `adaptive` holds
+    heatmap.adaptive.refine_quadtree options; the grid is then rasterized from a
+    quadtree refined only where the AQI varies. A heatmap.dispersion.PlumeDispersion
+    spreads the sources along its wind instead of the isotropic city influence.
+    """
+    lats, lons = world_axes(grid_size)
+    cities = get_major_cities() if sources is None else sources
+    if dispersion is not None and (lookup is not None or adaptive is not None):
+        raise ValueError("Wind dispersion runs the model on the grid itself; it cannot be "
+                         "combined with --lookup or --adaptive")
+    
+    if lookup is not None:
+        lookup.check_sources(cities)
+        if bbox is not None:
+            rows, cols = bbox_window(lats, lons, bbox)
+            lats, lons = lats[rows], lons[cols]
+        print(f"Interpolating AQI from the compiled lookup ({lookup.describe()})")
+        with phase('predict'):
+            count_cells(len(lats) * len(lons))
+            aqi_grid = store_aqi(lookup.grid(lats, lons),
+                                 allocate_grid((len(lats), len(lons)), grid_file,
+                                               dtype=DTYPES[dtype][1]))
+        return aqi_grid, lats, lons, cities
+    
+    if adaptive is not None:
+        if bbox is not None:
+            rows, cols = bbox_window(lats, lons, bbox)
+            lats, lons = lats[rows], lons[cols]
+            cities = sources_in_reach(cities, bbox)
+        print("Loading ML model...")
+        model = knn_backend(load_model(), knn)
+        print("Refining the adaptive quadtree...")
+        tree = refine_quadtree(model, predict_world_aqi, cities, bbox or WORLD_BBOX, **adaptive)
+        print(f"Quadtree: {tree.describe()}")
+        with phase('rasterize'):
+            count_cells(len(lats) * len(lons))
+            aqi_grid = store_aqi(tree.rasterize(lats, lons),
+                                 allocate_grid((len(lats), len(lons)), grid_file,
+                                               dtype=DTYPES[dtype][1]))
+        return aqi_grid, lats, lons, cities
+    
+    static, window = None, None
+    if rasters is not None and dispersion is None:
+        with phase('cache'):
+            static = rasters.load(lats, lons, cities, dtype=DTYPES[dtype][0])
+        if static is None:
+            print("No precomputed static rasters for this grid; computing layers "
+                  "(run `python -m heatmap rasters` to bake them)")
+    if bbox is not None:
+        rows, cols = bbox_window(lats, lons, bbox)
+        # The window keeps the world grid's noise for its cells
+        window = (rows.start, cols.start, len(lons))
+        lats, lons = lats[rows], lons[cols]
+        if static is not None:
+            static = static[rows, cols]
+        # Drop catalogue sources too far away to touch the window
+        if dispersion is None:
+            cities = sources_in_reach(cities, bbox)
+        else:
+            cities = sources_in_reach(cities, bbox, dispersion.reach_km)
     
-    print("Generating world geographic data...")
-    features, lat_grid, lon_grid, cities = generate_world_data(grid_size=180)
+    if dispersion is not None:
+        print(f"Dispersing sources with {dispersion.describe()}")
+    
+    # The model is loaded before the cache lookup: whether it or the fallback
+    # predicts is part of the key
+    print("Loading ML model...")
+    model = knn_backend(load_model(), knn)
+    
+    # Only seeded grids are reproducible, so only those can be cached
+    aqi_grid, cache_key = None, None
+    if cache is not None and seed is not None:
+        cache_key = grid_cache_key('world', MODEL_PATH, bbox or WORLD_BBOX,
+                                   (len(lats), len(lons)), seed, cities, dtype, knn,
+                                   dispersion, predictor_name(model))
+        with phase('cache'):
+            aqi_grid = cache.load(cache_key)
+        if aqi_grid is not None:
+            print(f"Using cached AQI grid {cache_key}")
+            if grid_file:
+                np.save(grid_file, aqi_grid)
+    
+    if aqi_grid is None:
+        aqi_grid = run_world_prediction(model, lats, lons, chunk_rows, seed, grid_file, workers,
+                                        static, dtype, knn, cities, dispersion, window)
+        if cache_key is not None:
+            cache.store(cache_key, aqi_grid)
+    
+    return aqi_grid, lats, lons, cities
+
+def create_world_heatmap(grid_size=180, chunk_rows=None, seed=None, grid_file=None,
+                         workers=1, cache=None, bbox=None, rasters=None, dtype='float64',
+                         knn='exact', lookup=None, render_workers=1, sources=None,
+                         adaptive=None, dispersion=None):
+    """Create and save the world AQI heatmap"""
+    print("=== World AQI Heatmap Generator ===")
     
-    print("Making global AQI predictions...")
-    aqi_predictions = predict_world_aqi(model, features, lat_grid, lon_grid)
+    aqi_grid, lats, lons, cities = world_aqi_grid(grid_size, chunk_rows, seed, grid_file,
+                                                  workers, cache, bbox, rasters, dtype, knn,
+                                                  lookup, sources, adaptive, dispersion)
     
-    # Reshape predictions to match grid
-    aqi_grid = aqi_predictions.reshape(lat_grid.shape)
+    with phase('stats'):
+        count_cells(aqi_grid.size)
+        stats = grid_statistics(aqi_grid, lats, lons, chunk_rows)
     
     print("Creating world visualization...")
+    with phase('render'):
+        count_cells(aqi_grid.size)
+        world_file, stats_file = render_world_figures(aqi_grid, lats, lons, cities, stats,
+                                                      render_workers)
+    
+    return aqi_grid, world_file, stats_file, cities, stats
+
+def render_world_figures(aqi_grid, lats, lons, cities, stats=None, workers=1):
+    """Draw and save the world heatmap and the statistics figure, concurrently when workers > 1"""
+    if stats is None:
+        stats = grid_statistics(aqi_grid, lats, lons)
+    world_file, stats_file = render_concurrently(
+        [(render_world_map, (np.asarray(aqi_grid), lats, lons, cities)),
+         (render_world_statistics, (stats,))], workers)
+    return world_file, stats_file
+
+def render_world_map(aqi_grid, lats, lons, cities):
+    """Draw and save the world heatmap"""
+    with phase('import'):
+        import matplotlib.pyplot as plt
     
     # Create main world heatmap
     fig, ax = plt.subplots(1, 1, figsize=(20, 12))
@@ -254,18 +428,19 @@ def create_world_heatmap():
     cmap, norm, aqi_ranges = create_aqi_colormap()
     
     # Main world heatmap
-    im = ax.imshow(aqi_grid, extent=[lon_grid.min(), lon_grid.max(), 
-                                    lat_grid.min(), lat_grid.max()],
+    im = ax.imshow(aqi_grid, extent=[lons[0], lons[-1], lats[0], lats[-1]],
                   cmap=cmap, norm=norm, origin='lower', aspect='auto')
     
-    # Add major cities as points
-    for city_name, (city_lat, city_lon, _) in cities.items():
-        ax.plot(city_lon, city_lat, 'ko', markersize=3, alpha=0.7)
-        # Add city labels for major cities
-        if city_name in ['Beijing', 'Delhi', 'New York', 'London', 'São Paulo', 'Cairo', 'Sydney']:
-            ax.annotate(city_name, (city_lon, city_lat), xytext=(5, 5), 
-                       textcoords='offset points', fontsize=8, 
-                       bbox=dict(boxstyle='round,pad=0.2', facecolor='white', alpha=0.7))
+    # Add the sources in view as points, in one scatter call however many there are
+    shown = as_catalogue(cities).within((lats[0], lats[-1], lons[0], lons[-1]))
+    marker_size = 9 if len(shown) <= MARKER_DETAIL_LIMIT else 1
+    ax.scatter(shown.lons, shown.lats, s=marker_size, c='k', alpha=0.7, linewidths=0,
+               rasterized=len(shown) > MARKER_DETAIL_LIMIT)
+    # Add city labels for major cities
+    for k in np.flatnonzero(np.isin(shown.records['name'], LABELLED_CITIES)):
+        ax.annotate(shown.records['name'][k], (shown.lons[k], shown.lats[k]), xytext=(5, 5), 
+                   textcoords='offset points', fontsize=8, 
+                   bbox=dict(boxstyle='round,pad=0.2', facecolor='white', alpha=0.7))
     
     ax.set_title('Global Air Quality Index (AQI) Heatmap\nML Model Predictions', 
                  fontsize=18, fontweight='bold', pad=20)
@@ -274,8 +449,12 @@ def create_world_heatmap():
     
     # Add grid lines
     ax.grid(True, alpha=0.3, linestyle='--')
-    ax.set_xticks(np.arange(-180, 181, 60))
-    ax.set_yticks(np.arange(-90, 91, 30))
+    if (lats[0], lats[-1], lons[0], lons[-1]) == WORLD_BBOX:
+        ax.set_xticks(np.arange(-180, 181, 60))
+        ax.set_yticks(np.arange(-90, 91, 30))
+    # Keep cities outside a --bbox window from widening the view
+    ax.set_xlim(lons[0], lons[-1])
+    ax.set_ylim(lats[0], lats[-1])
     
     # Add colorbar
     cbar = plt.colorbar(im, ax=ax, shrink=0.6, aspect=30)
@@ -288,35 +467,38 @@ def create_world_heatmap():
     
     # Save world heatmap
     world_file = 'world_aqi_heatmap.png'
-    plt.savefig(world_file, dpi=300, bbox_inches='tight')
+    with phase('render-savefig'):
+        plt.savefig(world_file, dpi=300, bbox_inches='tight')
+    close_figure(fig)
     print(f"World heatmap saved as: {world_file}")
+    return world_file
+
+def render_world_statistics(stats):
+    """Draw and save the 2x2 statistics figure from a GridStats"""
+    with phase('import'):
+        import matplotlib.pyplot as plt
+    _, _, aqi_ranges = create_aqi_colormap()
     
     # Create detailed statistics plot
     fig2, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
     
     # 1. AQI distribution histogram
-    ax1.hist(aqi_grid.flatten(), bins=50, color='skyblue', alpha=0.7, edgecolor='black')
+    counts, edges = stats.histogram(bins=50)
+    ax1.bar(edges[:-1], counts, width=np.diff(edges), align='edge',
+            color='skyblue', alpha=0.7, edgecolor='black')
     ax1.set_title('Global AQI Distribution', fontsize=12, fontweight='bold')
     ax1.set_xlabel('AQI Value')
     ax1.set_ylabel('Frequency')
-    ax1.axvline(aqi_grid.mean(), color='red', linestyle='--', label=f'Mean: {aqi_grid.mean():.1f}')
+    ax1.axvline(stats.mean, color='red', linestyle='--', label=f'Mean: {stats.mean:.1f}')
     ax1.legend()
     
-    # 2. Regional averages
-    regions = {
-        'North America': (aqi_grid[60:75, 30:60].mean(), '#FF6B6B'),
-        'South America': (aqi_grid[30:60, 60:90].mean(), '#4ECDC4'),
-        'Europe': (aqi_grid[75:85, 90:110].mean(), '#45B7D1'),
-        'Africa': (aqi_grid[45:75, 110:130].mean(), '#96CEB4'),
-        'Asia': (aqi_grid[60:85, 130:170].mean(), '#FFEAA7'),
-        'Oceania': (aqi_grid[30:45, 170:180].mean(), '#DDA0DD')
-    }
-    
-    region_names = list(regions.keys())
-    region_values = [regions[r][0] for r in region_names]
-    region_colors = [regions[r][1] for r in region_names]
+    # 2. Regional averages (area-weighted over each continental outline)
+    region_colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD']
+    region_means = stats.region_means()
+    region_names = list(region_means.keys())
+    region_values = [region_means[r] for r in region_names]
     
-    bars = ax2.bar(region_names, region_values, color=region_colors, alpha=0.8)
+    bars = ax2.bar(region_names, region_values, color=region_colors[:len(region_names)], alpha=0.8)
     ax2.set_title('Average AQI by Region', fontsize=12, fontweight='bold')
     ax2.set_ylabel('Average AQI')
     ax2.tick_params(axis='x', rotation=45)
@@ -327,31 +509,18 @@ def create_world_heatmap():
                 f'{value:.1f}', ha='center', va='bottom', fontweight='bold')
     
     # 3. Latitude vs AQI
-    lat_means = []
-    lat_bands = np.arange(-90, 91, 10)
-    for i in range(len(lat_bands)-1):
-        lat_start, lat_end = lat_bands[i], lat_bands[i+1]
-        lat_idx_start = int((lat_start + 90) / 180 * aqi_grid.shape[0])
-        lat_idx_end = int((lat_end + 90) / 180 * aqi_grid.shape[0])
-        lat_means.append(aqi_grid[lat_idx_start:lat_idx_end, :].mean())
-    
-    ax3.plot(lat_bands[:-1], lat_means, 'o-', linewidth=2, markersize=6, color='darkgreen')
+    band_starts, lat_means = stats.band_means()
+    
+    ax3.plot(band_starts, lat_means, 'o-', linewidth=2, markersize=6, color='darkgreen')
     ax3.set_title('AQI vs Latitude', fontsize=12, fontweight='bold')
     ax3.set_xlabel('Latitude')
     ax3.set_ylabel('Average AQI')
     ax3.grid(True, alpha=0.3)
     
     # 4. AQI categories pie chart
-    good = np.sum(aqi_grid <= 50)
-    moderate = np.sum((aqi_grid > 50) & (aqi_grid <= 100))
-    unhealthy_sensitive = np.sum((aqi_grid > 100) & (aqi_grid <= 150))
-    unhealthy = np.sum((aqi_grid > 150) & (aqi_grid <= 200))
-    very_unhealthy = np.sum((aqi_grid > 200) & (aqi_grid <= 300))
-    hazardous = np.sum(aqi_grid > 300)
-    
     categories = ['Good', 'Moderate', 'Unhealthy\nfor Sensitive', 'Unhealthy', 'Very Unhealthy', 'Hazardous']
-    values = [good, moderate, unhealthy_sensitive, unhealthy, very_unhealthy, hazardous]
-    colors_pie = ['#00E400', '#FFFF00', '#FF7E00', '#FF0000', '#8F3F97', '#7E0023']
+    values = list(stats.categories)
+    colors_pie = [color for _, _, color, _ in aqi_ranges]
     
     # Only show non-zero categories
     non_zero_idx = [i for i, v in enumerate(values) if v > 0]
@@ -367,43 +536,128 @@ def create_world_heatmap():
     
     # Save statistics plot
     stats_file = 'world_aqi_statistics.png'
-    plt.savefig(stats_file, dpi=300, bbox_inches='tight')
+    with phase('render-savefig'):
+        plt.savefig(stats_file, dpi=300, bbox_inches='tight')
+    close_figure(fig2)
     print(f"Statistics plot saved as: {stats_file}")
-    
-    return aqi_grid, world_file, stats_file, cities
+    return stats_file
+
+def print_world_summary(aqi_data, cities, stats=None):
+    """Print the global AQI summary and category distribution"""
+    if stats is None:
+        lats = np.linspace(WORLD_BBOX[0], WORLD_BBOX[1], aqi_data.shape[0])
+        lons = np.linspace(WORLD_BBOX[2], WORLD_BBOX[3], aqi_data.shape[1])
+        with phase('stats'):
+            count_cells(aqi_data.size)
+            stats = grid_statistics(aqi_data, lats, lons, chunk_rows=256)
+    p50, p90, p99 = stats.percentiles([50, 90, 99])
+    
+    print(f"\n📈 Global AQI Summary:")
+    print(f"   🌡️  Range: {stats.min:.1f} - {stats.max:.1f}")
+    print(f"   📊 Average: {stats.mean:.1f} (area-weighted {stats.area_weighted_mean:.1f})")
+    print(f"   📐 Percentiles: p50 {p50:.1f}, p90 {p90:.1f}, p99 {p99:.1f}")
+    print(f"   📏 Grid Size: {aqi_data.shape[0]}×{aqi_data.shape[1]} ({aqi_data.size:,} points)")
+    
+    # Global distribution
+    total_points = stats.count
+    good, moderate, unhealthy_sensitive, unhealthy, very_unhealthy, hazardous = stats.categories
+    
+    print(f"\n🌍 Global AQI Distribution:")
+    print(f"   🟢 Good (0-50): {good:,} points ({good/total_points*100:.1f}%)")
+    print(f"   🟡 Moderate (51-100): {moderate:,} points ({moderate/total_points*100:.1f}%)")
+    print(f"   🟠 Unhealthy for Sensitive (101-150): {unhealthy_sensitive:,} points ({unhealthy_sensitive/total_points*100:.1f}%)")
+    print(f"   🔴 Unhealthy (151-200): {unhealthy:,} points ({unhealthy/total_points*100:.1f}%)")
+    print(f"   🟣 Very Unhealthy (201-300): {very_unhealthy:,} points ({very_unhealthy/total_points*100:.1f}%)")
+    print(f"   🟤 Hazardous (301+): {hazardous:,} points ({hazardous/total_points*100:.1f}%)")
+    
+    print(f"\n🏙️  Analyzed {len(cities)} major world cities")
+    print("   Including pollution hotspots in Asia, industrial regions, and clean oceanic areas")
+
+def add_arguments(parser):
+    """Register the world heatmap options on an argparse parser"""
+    parser.add_argument('--grid-size', type=int, default=180,
+                        help='Longitude cells (latitude uses half as many)')
+    parser.add_argument('--chunk-rows', type=int, default=None,
+                        help='Predict in latitude bands of this many rows to bound memory')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for reproducible noise')
+    parser.add_argument('--grid-file', default=None,
+                        help='Also write the AQI grid to this .npy file (memory-mapped when streaming)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Run model inference on this many worker processes')
+    parser.add_argument('--render-workers', type=int, default=1,
+                        help='Render the world map and statistics figure on separate processes')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='Directory of cached AQI grids (used when --seed is set)')
+    parser.add_argument('--cache-max-mb', type=int, default=2048,
+                        help='Evict least recently used grids beyond this size')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always recompute the grid')
+    parser.add_argument('--dtype', choices=sorted(DTYPES), default='float64',
+                        help='float32 builds float32 features and stores the AQI grid as uint16')
+    parser.add_argument('--knn', choices=BACKENDS, default='exact',
+                        help='Nearest-neighbour backend for the KNN model (grid is approximate and '
+                             'only serves haversine lat/lon models)')
+    parser.add_argument('--lookup', default=None,
+                        help='Interpolate from a `python -m heatmap compile` lookup instead of the model')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Predict an adaptive quadtree (refined where AQI varies) and '
+                             'rasterize it to the grid, with expected noise terms')
+    parser.add_argument('--adaptive-threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Split a quadtree cell when its AQI spread exceeds this')
+    parser.add_argument('--adaptive-base-deg', type=float, default=DEFAULT_BASE_DEG,
+                        help='Size of the coarsest quadtree cells in degrees')
+    parser.add_argument('--adaptive-levels', type=int, default=DEFAULT_MAX_LEVEL,
+                        help='Maximum number of times a quadtree cell is halved')
+    parser.add_argument('--wind', type=float, nargs=2, default=None,
+                        metavar=('FROM_DEG', 'SPEED_MS'),
+                        help='Spread the sources as plumes along this wind (direction it '
+                             'blows from, clockwise from north, and speed in m/s)')
+    parser.add_argument('--bbox', type=float, nargs=4, default=None,
+                        metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'),
+                        help='Only predict the part of the world grid inside this box')
+    parser.add_argument('--sources', default=None,
+                        help='CSV, GeoJSON or Overpass JSON source catalogue (default: major cities)')
+    parser.add_argument('--raster-dir', default=DEFAULT_RASTER_DIR,
+                        help='Directory of precomputed static-feature rasters')
+    parser.add_argument('--no-rasters', action='store_true',
+                        help='Compute the static layers instead of reading baked rasters')
+    return parser
+
+def grid_options(args):
+    """Keyword arguments for world_aqi_grid/create_world_heatmap from parsed options"""
+    return dict(
+        grid_size=args.grid_size, chunk_rows=args.chunk_rows,
+        seed=args.seed, grid_file=args.grid_file, workers=args.workers,
+        cache=None if args.no_cache else GridCache(args.cache_dir, args.cache_max_mb * 1024**2),
+        bbox=tuple(args.bbox) if args.bbox else None,
+        rasters=None if args.no_rasters else StaticRasterStore(args.raster_dir),
+        dtype=args.dtype,
+        knn=args.knn,
+        lookup=AQILookup.load(args.lookup) if args.lookup else None,
+        sources=load_sources(args.sources),
+        adaptive=dict(threshold=args.adaptive_threshold, base_deg=args.adaptive_base_deg,
+                      max_level=args.adaptive_levels) if args.adaptive else None,
+        dispersion=PlumeDispersion(*args.wind) if args.wind else None)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Generate the world AQI heatmap")
+    add_instrumentation_arguments(parser)
+    return add_arguments(parser).parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        aqi_data, world_file, stats_file, cities = create_world_heatmap()
-        
-        print(f"\n🌍 ✅ Success! Generated world-scale visualizations:")
-        print(f"   🗺️  World Heatmap: {world_file}")
-        print(f"   📊 Statistics: {stats_file}")
-        
-        print(f"\n📈 Global AQI Summary:")
-        print(f"   🌡️  Range: {aqi_data.min():.1f} - {aqi_data.max():.1f}")
-        print(f"   📊 Average: {aqi_data.mean():.1f}")
-        print(f"   📏 Grid Size: {aqi_data.shape[0]}×{aqi_data.shape[1]} ({aqi_data.size:,} points)")
-        
-        # Global distribution
-        total_points = aqi_data.size
-        good = np.sum(aqi_data <= 50)
-        moderate = np.sum((aqi_data > 50) & (aqi_data <= 100))
-        unhealthy_sensitive = np.sum((aqi_data > 100) & (aqi_data <= 150))
-        unhealthy = np.sum((aqi_data > 150) & (aqi_data <= 200))
-        very_unhealthy = np.sum((aqi_data > 200) & (aqi_data <= 300))
-        hazardous = np.sum(aqi_data > 300)
-        
-        print(f"\n🌍 Global AQI Distribution:")
-        print(f"   🟢 Good (0-50): {good:,} points ({good/total_points*100:.1f}%)")
-        print(f"   🟡 Moderate (51-100): {moderate:,} points ({moderate/total_points*100:.1f}%)")
-        print(f"   🟠 Unhealthy for Sensitive (101-150): {unhealthy_sensitive:,} points ({unhealthy_sensitive/total_points*100:.1f}%)")
-        print(f"   🔴 Unhealthy (151-200): {unhealthy:,} points ({unhealthy/total_points*100:.1f}%)")
-        print(f"   🟣 Very Unhealthy (201-300): {very_unhealthy:,} points ({very_unhealthy/total_points*100:.1f}%)")
-        print(f"   🟤 Hazardous (301+): {hazardous:,} points ({hazardous/total_points*100:.1f}%)")
-        
-        print(f"\n🏙️  Analyzed {len(cities)} major world cities")
-        print("   Including pollution hotspots in Asia, industrial regions, and clean oceanic areas")
+        with instrumented('world', args):
+            aqi_data, world_file, stats_file, cities, stats = create_world_heatmap(
+                **grid_options(args), render_workers=args.render_workers)
+            
+            print(f"\n🌍 ✅ Success! Generated world-scale visualizations:")
+            print(f"   🗺️  World Heatmap: {world_file}")
+            print(f"   📊 Statistics: {stats_file}")
+            
+            print_world_summary(aqi_data, cities, stats)
         
     except Exception as e:
         print(f"❌ Error generating world heatmap: {e}")
@@ -0,0 +1,3 @@
+"""
+Shared engines for the AQI heatmap scripts
+"""
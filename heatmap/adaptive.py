@@ -0,0 +1,259 @@
+"""
+Adaptive quadtree refinement of the world AQI field
+The bbox is covered by a coarse lattice of base cells. Each cell is probed at
+its centre, and split into four when the AQI spread over its corners and
+centre exceeds a threshold, down to max_level halvings. Every level's nodes lie
+on one dyadic lattice, so a node is predicted once whichever cells share it.
+Flat oceans and polar cells stay coarse while hotspots are resolved to the
+finest level, and the leaves rasterize to any output resolution by bilinear
+interpolation of their corners. Like the compiled lookup, the model is
+evaluated with the per-run noise terms at their expected values.
+"""
+
+import json
+
+import numpy as np
+
+from heatmap.features import FEATURE_SCALES, N_FEATURES, fill_static_features
+from heatmap.lookup import EXPECTED_POPULATION, EXPECTED_WEATHER
+from heatmap.sources import as_source_index
+from heatmap.timings import count_cells, phase
+
+DEFAULT_BASE_DEG = 4.0
+DEFAULT_MAX_LEVEL = 5
+DEFAULT_THRESHOLD = 10.0
+QUADTREE_VERSION = 1
+
+# Finest-lattice rows whose static features are built in one product grid
+FEATURE_BAND_ROWS = 64
+
+# Output rows rasterized at a time
+RASTER_BAND_ROWS = 128
+
+
+def expected_features(lats, lons, cities, rows, cols):
+    """
+    (N, 8) float64 features at the lattice nodes (lats[rows], lons[cols]).
+
+    Nodes are grouped into bands of rows; each band fills the static columns
+    on the product of its rows and the columns it uses. Population and weather
+    are held at their expected values, as in heatmap.lookup.evaluate_lattice.
+    """
+    features = np.empty((len(rows), N_FEATURES))
+    order = np.argsort(rows, kind='stable')
+    unique_rows = np.unique(rows)
+    for band in range(0, len(unique_rows), FEATURE_BAND_ROWS):
+        band_rows = unique_rows[band:band + FEATURE_BAND_ROWS]
+        nodes = order[np.searchsorted(rows[order], band_rows[0], side='left'):
+                      np.searchsorted(rows[order], band_rows[-1], side='right')]
+        band_cols = np.unique(cols[nodes])
+        grid = np.empty((len(band_rows), len(band_cols), N_FEATURES))
+        fill_static_features(lats[band_rows], lons[band_cols], cities, grid)
+        features[nodes] = grid[np.searchsorted(band_rows, rows[nodes]),
+                               np.searchsorted(band_cols, cols[nodes])]
+    features[:, 6] = EXPECTED_POPULATION / FEATURE_SCALES[6]
+    features[:, 7] = EXPECTED_WEATHER / FEATURE_SCALES[7]
+    return features
+
+
+class AdaptiveGrid:
+    """
+    Quadtree leaves and node values on a dyadic lattice over a bbox.
+
+    The finest lattice has base_shape * 2**max_level cells. Nodes are stored as
+    sorted row * n_node_cols + col codes of that lattice with their AQI; the
+    leaves of each level as sorted i * n_cols(level) + j cell codes.
+    """
+
+    def __init__(self, bbox, base_shape, max_level, node_codes, node_values, leaves,
+                 meta=None):
+        self.bbox = tuple(float(value) for value in bbox)
+        self.base_shape = tuple(int(n) for n in base_shape)
+        self.max_level = int(max_level)
+        self.node_codes = np.asarray(node_codes, dtype=np.int64)
+        self.node_values = np.asarray(node_values, dtype=np.float64)
+        self.leaves = [np.asarray(codes, dtype=np.int64) for codes in leaves]
+        self.meta = dict(meta or {})
+
+    @property
+    def node_shape(self):
+        """(rows, cols) of nodes of the finest lattice"""
+        scale = 2**self.max_level
+        return self.base_shape[0] * scale + 1, self.base_shape[1] * scale + 1
+
+    def lattice_axes(self):
+        """Latitude and longitude axes of the finest lattice's nodes"""
+        lat_min, lat_max, lon_min, lon_max = self.bbox
+        n_rows, n_cols = self.node_shape
+        return np.linspace(lat_min, lat_max, n_rows), np.linspace(lon_min, lon_max, n_cols)
+
+    @property
+    def evaluations(self):
+        return len(self.node_codes)
+
+    @property
+    def n_leaves(self):
+        return sum(len(codes) for codes in self.leaves)
+
+    def describe(self):
+        lat_step = (self.bbox[1] - self.bbox[0]) / (self.node_shape[0] - 1)
+        uniform = self.node_shape[0] * self.node_shape[1]
+        return (f"{self.n_leaves:,} leaves over {self.max_level + 1} levels down to "
+                f"{lat_step:g} deg, {self.evaluations:,} model evaluations "
+                f"({self.evaluations / uniform:.1%} of the {uniform:,}-node uniform lattice)")
+
+    def values(self, rows, cols):
+        """AQI of finest-lattice nodes; every node asked for must have been evaluated"""
+        codes = rows * self.node_shape[1] + cols
+        return self.node_values[np.searchsorted(self.node_codes, codes)]
+
+    def level_shape(self, level):
+        """(rows, cols) of nodes of a level's lattice"""
+        scale = 2**level
+        return self.base_shape[0] * scale + 1, self.base_shape[1] * scale + 1
+
+    def rasterize(self, lats, lons):
+        """
+        (len(lats), len(lons)) AQI grid, interpolated bilinearly in each point's leaf.
+
+        Points outside the bbox take the value at its nearest edge. Output rows
+        are filled in bands of RASTER_BAND_ROWS to bound the index temporaries.
+        """
+        lat_min, lat_max, lon_min, lon_max = self.bbox
+        n_rows, n_cols = self.node_shape
+        # Fractional positions on the finest lattice, one per axis
+        fr = np.clip((np.asarray(lats, dtype=np.float64) - lat_min) / (lat_max - lat_min)
+                     * (n_rows - 1), 0, n_rows - 1)
+        fc = np.clip((np.asarray(lons, dtype=np.float64) - lon_min) / (lon_max - lon_min)
+                     * (n_cols - 1), 0, n_cols - 1)
+        out = np.empty((len(fr), len(fc)))
+        for start in range(0, len(fr), RASTER_BAND_ROWS):
+            self._rasterize_band(fr[start:start + RASTER_BAND_ROWS], fc,
+                                 out[start:start + RASTER_BAND_ROWS])
+        return out
+
+    def _rasterize_band(self, fr, fc, out):
+        """Fill out (len(fr), len(fc)) from the leaves, coarsest level first"""
+        pending_r, pending_c = np.divmod(np.arange(out.size), len(fc))
+        for level, codes in enumerate(self.leaves):
+            if len(pending_r) == 0:
+                break
+            if len(codes) == 0:
+                continue
+            stride = 2**(self.max_level - level)
+            level_rows, level_cols = (n - 1 for n in self.level_shape(level))
+            i = np.minimum((fr[pending_r] // stride).astype(np.int64), level_rows - 1)
+            j = np.minimum((fc[pending_c] // stride).astype(np.int64), level_cols - 1)
+            cell = i * level_cols + j
+            position = np.minimum(np.searchsorted(codes, cell), len(codes) - 1)
+            found = codes[position] == cell
+            if not found.any():
+                continue
+            i, j = i[found], j[found]
+            u = fr[pending_r[found]] / stride - i
+            v = fc[pending_c[found]] / stride - j
+            r0, c0 = i * stride, j * stride
+            r1, c1 = r0 + stride, c0 + stride
+            out.flat[pending_r[found] * len(fc) + pending_c[found]] = (
+                (1 - u) * ((1 - v) * self.values(r0, c0) + v * self.values(r0, c1)) +
+                u * ((1 - v) * self.values(r1, c0) + v * self.values(r1, c1)))
+            pending_r, pending_c = pending_r[~found], pending_c[~found]
+
+    def save(self, path):
+        meta = dict(self.meta, version=QUADTREE_VERSION, bbox=self.bbox,
+                    base_shape=self.base_shape, max_level=self.max_level)
+        with open(path, 'wb') as f:
+            np.savez(f, node_codes=self.node_codes, node_values=self.node_values,
+                     meta=json.dumps(meta),
+                     **{f"leaves_{level}": codes for level, codes in enumerate(self.leaves)})
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != QUADTREE_VERSION:
+                raise ValueError(f"{path} is quadtree version {meta.get('version')}, "
+                                 f"expected {QUADTREE_VERSION}")
+            leaves = [data[f"leaves_{level}"] for level in range(meta['max_level'] + 1)]
+            return cls(meta['bbox'], meta['base_shape'], meta['max_level'], data['node_codes'],
+                       data['node_values'], leaves, meta)
+
+
+def base_shape_for(bbox, base_deg):
+    """Base cells along latitude and longitude, at most base_deg on a side"""
+    lat_min, lat_max, lon_min, lon_max = bbox
+    return (max(1, int(np.ceil((lat_max - lat_min) / base_deg - 1e-9))),
+            max(1, int(np.ceil((lon_max - lon_min) / base_deg - 1e-9))))
+
+
+def refine_quadtree(model, predict, cities, bbox, base_deg=DEFAULT_BASE_DEG,
+                    max_level=DEFAULT_MAX_LEVEL, threshold=DEFAULT_THRESHOLD, min_level=0):
+    """
+    Build an AdaptiveGrid of the model's AQI over a (lat_min, lat_max, lon_min, lon_max) bbox.
+
+    `predict` is called like predict_world_aqi. A cell at level < max_level is
+    split when the spread (max - min) of its four corners and its centre is
+    above `threshold` AQI, or while its level is below `min_level`; a split
+    cell's edge midpoints are then predicted too, so its children start with
+    all their corners known. Each level's new nodes are predicted in one batch.
+
+    Only a cell's corners and centre are probed, so a hotspot smaller than that
+    spacing can fall between them and the cell is left unsplit; min_level sets
+    the coarsest probe spacing used everywhere.
+    """
+    cities = as_source_index(cities)
+    base_shape = base_shape_for(bbox, base_deg)
+    grid = AdaptiveGrid(bbox, base_shape, max_level, [], [], [])
+    lats, lons = grid.lattice_axes()
+    n_node_cols = grid.node_shape[1]
+
+    def evaluate(rows, cols):
+        """Predict the nodes among (rows, cols) that have no value yet"""
+        codes = np.unique(rows * n_node_cols + cols)
+        codes = codes[~np.isin(codes, grid.node_codes, assume_unique=True)]
+        if len(codes) == 0:
+            return
+        new_rows, new_cols = np.divmod(codes, n_node_cols)
+        with phase('features'):
+            count_cells(len(codes))
+            features = expected_features(lats, lons, cities, new_rows, new_cols)
+        with phase('predict'):
+            count_cells(len(codes))
+            values = predict(model, features, None, None, noise=np.zeros(len(codes)))
+        order = np.argsort(np.concatenate([grid.node_codes, codes]), kind='stable')
+        grid.node_codes = np.concatenate([grid.node_codes, codes])[order]
+        grid.node_values = np.concatenate([grid.node_values,
+                                           np.asarray(values, dtype=np.float64)])[order]
+
+    # Level 0: every node of the base lattice
+    stride = 2**max_level
+    i, j = np.meshgrid(np.arange(base_shape[0]), np.arange(base_shape[1]), indexing='ij')
+    i, j = i.ravel(), j.ravel()
+    node_i, node_j = np.meshgrid(np.arange(base_shape[0] + 1), np.arange(base_shape[1] + 1),
+                                 indexing='ij')
+    evaluate(node_i.ravel() * stride, node_j.ravel() * stride)
+
+    for level in range(max_level + 1):
+        level_cols = base_shape[1] * 2**level
+        if level == max_level or len(i) == 0:
+            grid.leaves.append(np.sort(i * level_cols + j))
+            continue
+        stride = 2**(max_level - level)
+        half = stride // 2
+        r0, c0 = i * stride, j * stride
+        evaluate(r0 + half, c0 + half)
+        corners = np.stack([grid.values(r0 + dr, c0 + dc)
+                            for dr in (0, stride) for dc in (0, stride)] +
+                           [grid.values(r0 + half, c0 + half)])
+        split = (corners.max(axis=0) - corners.min(axis=0) > threshold) | (level < min_level)
+        grid.leaves.append(np.sort(i[~split] * level_cols + j[~split]))
+
+        r0, c0 = r0[split], c0[split]
+        evaluate(np.concatenate([r0 + half, r0 + half, r0, r0 + stride]),
+                 np.concatenate([c0, c0 + stride, c0 + half, c0 + half]))
+        i = np.concatenate([2 * i[split] + di for di in (0, 0, 1, 1)])
+        j = np.concatenate([2 * j[split] + dj for dj in (0, 1, 0, 1)])
+
+    grid.meta.update(threshold=threshold, base_deg=base_deg, min_level=min_level)
+    return grid
@@ -0,0 +1,122 @@
+"""
+Content-addressed on-disk cache of predicted AQI grids
+Grids are stored as .npy files named by a hash of everything that determines
+their values (model file, bounding box, resolution, seed and source table) and
+loaded back memory-mapped. The directory is kept under a byte budget by evicting
+the least recently used entries.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from heatmap.catalogue import source_key
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'aqi_grids')
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+# Bumped whenever feature generation or prediction changes the values a key maps to
+CACHE_VERSION = 6
+
+_file_hashes = {}
+
+
+def file_hash(path):
+    """SHA-256 of a file's contents, memoized on (path, size, mtime)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def predictor_name(model):
+    """'model' when the loaded model predicts, 'fallback' when the fallback formula does"""
+    return 'model' if model and hasattr(model, 'predict') else 'fallback'
+
+
+def grid_cache_key(kind, model_path, bbox, resolution, seed, cities, dtype='float64',
+                   knn='exact', dispersion=None, predictor='model'):
+    """
+    Hash the inputs that fully determine a predicted grid.
+
+    `predictor` is the predictor_name of what produced it, so a fallback grid
+    is not served once the model at model_path loads.
+    """
+    spec = {
+        'version': CACHE_VERSION,
+        'kind': kind,
+        'model': file_hash(model_path),
+        'predictor': predictor,
+        'bbox': [float(v) for v in bbox],
+        'resolution': [int(v) for v in resolution],
+        'seed': seed,
+        'cities': source_key(cities),
+        'dtype': dtype,
+        'knn': knn,
+    }
+    if dispersion is not None:
+        spec['dispersion'] = dispersion.key()
+    encoded = json.dumps(spec, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+class GridCache:
+    """Size-bounded LRU directory of .npy grids"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def load(self, key):
+        """Return the cached grid memory-mapped read-only, or None on a miss"""
+        path = self.path(key)
+        try:
+            grid = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        # Refresh the timestamp so eviction sees this entry as recently used
+        os.utime(path)
+        return grid
+
+    def store(self, key, grid):
+        """Write a grid atomically, then evict old entries beyond the byte budget"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.asarray(grid))
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+        return self.path(key)
+
+    def evict(self):
+        """Delete least recently used grids until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.unlink(path)
+            total -= size
@@ -0,0 +1,219 @@
+"""
+Emission source catalogues
+Point sources (cities, industry, fuel stations, ...) are read from CSV, GeoJSON
+or Overpass JSON into one structured NumPy array sorted by latitude. A
+SourceCatalogue is a SourceIndex, so the influence engine uses it directly, and
+bbox filters bisect the latitude order and mask longitudes, so a grid window
+only ever sees the sources that can reach it.
+"""
+
+import csv
+import hashlib
+import json
+
+import numpy as np
+
+from heatmap.sources import DEFAULT_RADIUS_KM, EARTH_RADIUS_KM, KM_PER_DEGREE, SourceIndex
+
+SOURCE_DTYPE = np.dtype([('name', 'U48'), ('kind', 'U16'), ('lat', 'f8'), ('lon', 'f8'),
+                         ('level', 'f8')])
+
+# Pollution level of sources whose catalogue row does not give one
+DEFAULT_LEVEL = 50.0
+
+# Accepted CSV columns / GeoJSON properties for each field, first match wins
+FIELD_ALIASES = {
+    'name': ('name', 'label', 'city'),
+    'kind': ('kind', 'type', 'category'),
+    'lat': ('lat', 'latitude', 'y'),
+    'lon': ('lon', 'lng', 'longitude', 'x'),
+    'level': ('level', 'pollution_level', 'intensity', 'aqi'),
+}
+
+# Overpass tags that name a source's kind, in the order overpassAPI.js checks them
+OVERPASS_KIND_TAGS = ('landuse', 'amenity', 'place', 'industrial')
+
+
+class SourceCatalogue(SourceIndex):
+    """Point sources as a SOURCE_DTYPE structured array, sorted by latitude"""
+
+    def __init__(self, records):
+        records = np.asarray(records, dtype=SOURCE_DTYPE)
+        valid = (np.isfinite(records['lat']) & np.isfinite(records['lon']) &
+                 (np.abs(records['lat']) <= 90) & np.isfinite(records['level']))
+        records = records[valid]
+        records['lon'] = (records['lon'] + 180) % 360 - 180
+        self._set_records(records[np.argsort(records['lat'], kind='stable')])
+
+    def _set_records(self, records):
+        self.records = records
+        self.order = np.arange(len(records))
+        self.lats = records['lat']
+        self.lons = records['lon']
+        self.intensities = records['level']
+
+    @classmethod
+    def _from_sorted(cls, records):
+        """Wrap records that are already valid and in latitude order"""
+        catalogue = cls.__new__(cls)
+        catalogue._set_records(records)
+        return catalogue
+
+    @classmethod
+    def from_cities(cls, cities):
+        """Catalogue of a get_major_cities-style {name: (lat, lon, pollution_level)} table"""
+        records = np.zeros(len(cities), dtype=SOURCE_DTYPE)
+        records['name'] = list(cities)
+        records['kind'] = 'city'
+        values = np.array(list(cities.values()), dtype=np.float64).reshape(-1, 3)
+        records['lat'], records['lon'], records['level'] = values.T
+        return cls(records)
+
+    @classmethod
+    def load(cls, path, default_level=DEFAULT_LEVEL):
+        """Read a .csv, .geojson or Overpass .json catalogue"""
+        if path.endswith('.csv'):
+            return cls(read_csv_sources(path, default_level))
+        with open(path) as f:
+            document = json.load(f)
+        if 'elements' in document:
+            return cls(overpass_sources(document, default_level))
+        return cls(geojson_sources(document, default_level))
+
+    def items(self):
+        """(name, (lat, lon, level)) pairs, like the get_major_cities dict"""
+        for name, lat, lon, level in zip(self.records['name'].tolist(), self.lats.tolist(),
+                                         self.lons.tolist(), self.intensities.tolist()):
+            yield name, (lat, lon, level)
+
+    def within(self, bbox, margin_km=0.0):
+        """
+        Sources inside a (lat_min, lat_max, lon_min, lon_max) bbox, or within margin_km of it.
+
+        The latitude band is found by bisection; only its sources are tested
+        against the longitude span, widened per source by the half-width of a
+        margin_km cap at its latitude. A box wider than 360 degrees keeps every
+        longitude.
+        """
+        lat_min, lat_max, lon_min, lon_max = map(float, bbox)
+        margin_deg = margin_km / KM_PER_DEGREE
+        rows = slice(np.searchsorted(self.lats, lat_min - margin_deg, side='left'),
+                     np.searchsorted(self.lats, lat_max + margin_deg, side='right'))
+        lats, lons = self.lats[rows], self.lons[rows]
+
+        lon_margin = 0.0
+        if margin_km > 0:
+            sin_margin = np.sin(min(margin_km / EARTH_RADIUS_KM, np.pi / 2))
+            cos_lat = np.cos(np.radians(lats))
+            ratio = np.divide(sin_margin, cos_lat, out=np.full(len(lats), np.inf),
+                              where=cos_lat > 0)
+            lon_margin = np.where(ratio < 1, np.degrees(np.arcsin(np.minimum(ratio, 1))), 180.0)
+        center, half = (lon_min + lon_max) / 2, (lon_max - lon_min) / 2
+        offset = np.abs((lons - center + 180) % 360 - 180)
+        keep = offset <= half + lon_margin
+        return self._from_sorted(self.records[rows][keep])
+
+    def fingerprint(self):
+        """Hash of the records, for cache and raster keys"""
+        return hashlib.sha256(np.ascontiguousarray(self.records).tobytes()).hexdigest()[:32]
+
+
+def as_catalogue(sources):
+    """Accept either a SourceCatalogue or a get_major_cities-style dict"""
+    if isinstance(sources, SourceCatalogue):
+        return sources
+    return SourceCatalogue.from_cities(sources)
+
+
+def source_key(sources):
+    """JSON-able identity of a source table for cache keys; dicts keep their original spec"""
+    if isinstance(sources, SourceCatalogue):
+        return {'catalogue': sources.fingerprint(), 'count': len(sources)}
+    return sorted([name, *map(float, values)] for name, values in sources.items())
+
+
+def _column(names, field):
+    for alias in FIELD_ALIASES[field]:
+        if alias in names:
+            return names.index(alias)
+    return None
+
+
+def read_csv_sources(path, default_level=DEFAULT_LEVEL):
+    """SOURCE_DTYPE records of a CSV with lat/lon columns and optional name, kind and level"""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        names = [name.strip().lower() for name in next(reader)]
+        columns = {field: _column(names, field) for field in FIELD_ALIASES}
+        if columns['lat'] is None or columns['lon'] is None:
+            raise ValueError(f"{path} needs latitude and longitude columns, found {names}")
+        rows = [row for row in reader if row]
+
+    records = np.zeros(len(rows), dtype=SOURCE_DTYPE)
+    for field, column in columns.items():
+        if column is None:
+            continue
+        values = [row[column] for row in rows]
+        if SOURCE_DTYPE[field].kind == 'f':
+            values = [value or 'nan' for value in values]
+        try:
+            records[field] = values
+        except ValueError as e:
+            raise ValueError(f"{path}: bad {names[column]!r} value ({e})") from None
+    if columns['level'] is None:
+        records['level'] = default_level
+    else:
+        records['level'][np.isnan(records['level'])] = default_level
+    return records
+
+
+def _representative_point(geometry):
+    """(lon, lat) of a Point, or the mean vertex of any other geometry"""
+    coords = geometry['coordinates']
+    if geometry['type'] == 'Point':
+        return coords[0], coords[1]
+    while isinstance(coords[0][0], list):
+        coords = [pair for part in coords for pair in part]
+    lon, lat = np.mean(np.asarray(coords, dtype=np.float64)[:, :2], axis=0)
+    return lon, lat
+
+
+def _properties_value(properties, field, default):
+    for alias in FIELD_ALIASES[field]:
+        if properties.get(alias) not in (None, ''):
+            return properties[alias]
+    return default
+
+
+def geojson_sources(document, default_level=DEFAULT_LEVEL):
+    """SOURCE_DTYPE records of a GeoJSON FeatureCollection (points, or vertex means of shapes)"""
+    features = [feature for feature in document.get('features', []) if feature.get('geometry')]
+    records = np.zeros(len(features), dtype=SOURCE_DTYPE)
+    for k, feature in enumerate(features):
+        properties = feature.get('properties') or {}
+        lon, lat = _representative_point(feature['geometry'])
+        records[k] = (_properties_value(properties, 'name', ''),
+                      _properties_value(properties, 'kind', ''), lat, lon,
+                      float(_properties_value(properties, 'level', default_level)))
+    return records
+
+
+def overpass_sources(document, default_level=DEFAULT_LEVEL):
+    """SOURCE_DTYPE records of an Overpass API JSON response, as queried by overpassAPI.js"""
+    elements = [element for element in document['elements']
+                if 'lat' in element or 'center' in element]
+    records = np.zeros(len(elements), dtype=SOURCE_DTYPE)
+    for k, element in enumerate(elements):
+        center = element.get('center', element)
+        tags = element.get('tags') or {}
+        kind = next((tags[tag] for tag in OVERPASS_KIND_TAGS if tag in tags), '')
+        records[k] = (tags.get('name', ''), kind, center['lat'], center['lon'],
+                      float(_properties_value(tags, 'level', default_level)))
+    return records
+
+
+def sources_in_reach(sources, bbox, radius_km=DEFAULT_RADIUS_KM):
+    """The sources of a catalogue that can influence a bbox; dict tables are returned as they are"""
+    if isinstance(sources, SourceCatalogue):
+        return sources.within(bbox, radius_km)
+    return sources
@@ -0,0 +1,345 @@
+"""
+Command line entry point for the heatmap scripts
+
+    python -m heatmap world     # world heatmap and statistics figures
+    python -m heatmap regional  # Dallas-Fort Worth heatmap and contour map
+    python -m heatmap stats     # world AQI summary only, no rendering
+    python -m heatmap tiles     # z/x/y PNG tile pyramid of the world grid
+    python -m heatmap rasters   # precompute static-feature rasters for world runs
+    python -m heatmap compile   # distil the model into a quantized AQI lookup raster
+    python -m heatmap serve     # local HTTP service for point and area AQI queries
+    python -m heatmap timeseries  # hourly (T, H, W) frames of the world grid
+    python -m heatmap history   # compare the last logged run with earlier ones
+
+matplotlib, sklearn and joblib are only imported by the stages that need them,
+so a `stats` run against a cached or saved grid never loads them.
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+import generate_heatmap_fixed as regional
+import generate_world_heatmap as world
+from heatmap.cache import DEFAULT_CACHE_DIR, GridCache
+from heatmap.lookup import DEFAULT_LOOKUP_PATH
+from heatmap.pipeline import DTYPES
+from heatmap.rasters import DEFAULT_RASTER_DIR, StaticRasterStore
+from heatmap.service import DEFAULT_CELL_DEG, DEFAULT_MAX_TILES, DEFAULT_PORT, DEFAULT_TILE_CELLS
+from heatmap.stats import grid_statistics
+from heatmap.timeseries import DEFAULT_TIMESERIES_DIR
+from heatmap.timings import (add_instrumentation_arguments, compare_runs, count_cells,
+                             instrumented, load_runs, phase)
+
+
+SOURCES_HELP = 'CSV, GeoJSON or Overpass JSON source catalogue (default: major cities)'
+
+
+def run_world(args):
+    aqi_data, world_file, stats_file, cities, stats = world.create_world_heatmap(
+        **world.grid_options(args), render_workers=args.render_workers)
+    print(f"\n🌍 ✅ Success! Generated world-scale visualizations:")
+    print(f"   🗺️  World Heatmap: {world_file}")
+    print(f"   📊 Statistics: {stats_file}")
+    world.print_world_summary(aqi_data, cities, stats)
+
+
+def run_regional(args):
+    print("=== AQI Heatmap Generator ===")
+    if args.manifest:
+        regional.print_batch_summary(*regional.create_region_batch(
+            **regional.batch_options(args)))
+        return
+    aqi_data, heatmap_file, contour_file = regional.create_heatmap(
+        **regional.grid_options(args), render_workers=args.render_workers)
+    print(f"\n✅ Success! Generated visualizations:")
+    print(f"   📊 Heatmap: {heatmap_file}")
+    print(f"   🗺️  Contour Map: {contour_file}")
+    regional.print_summary(aqi_data)
+
+
+def run_stats(args):
+    if args.input:
+        with phase('load'):
+            aqi_data = np.load(args.input, mmap_mode='r')
+        cities = world.load_sources(args.sources)
+        world.print_world_summary(aqi_data, cities)
+    else:
+        aqi_data, lats, lons, cities = world.world_aqi_grid(**world.grid_options(args))
+        with phase('stats'):
+            count_cells(aqi_data.size)
+            stats = grid_statistics(aqi_data, lats, lons, chunk_rows=256)
+        world.print_world_summary(aqi_data, cities, stats)
+
+
+def run_tiles(args):
+    from heatmap.tiles import render_tile_pyramid
+
+    aqi_data, lats, lons, _ = world.world_aqi_grid(**world.grid_options(args))
+    cmap, norm, _ = world.create_aqi_colormap()
+    print(f"Rendering zoom {args.min_zoom}-{args.max_zoom} tiles to {args.out_dir}...")
+    with phase('render'):
+        count_cells(aqi_data.size)
+        written, skipped = render_tile_pyramid(aqi_data, lats, lons, cmap, norm, args.out_dir,
+                                               args.min_zoom, args.max_zoom, args.tile_workers)
+    print(f"🗺️  {written} tiles written, {skipped} unchanged")
+
+
+def run_rasters(args):
+    store = StaticRasterStore(args.raster_dir)
+    cities = world.load_sources(args.sources)
+    for grid_size in args.grid_sizes:
+        lats, lons = world.world_axes(grid_size)
+        for dtype in args.dtypes:
+            with phase('features'):
+                path = store.bake(lats, lons, cities, dtype=DTYPES[dtype][0])
+            size_mb = os.path.getsize(path) / 1024**2
+            print(f"🧱 {len(lons)}x{len(lats)} {dtype} static rasters: {path} ({size_mb:.1f} MB)")
+
+
+def run_compile(args):
+    from heatmap.cache import file_hash
+    from heatmap.lookup import compile_lookup, lattice_axes
+
+    lats, lons = lattice_axes(args.resolution)
+    cities = world.load_sources(args.sources)
+    print("Loading ML model...")
+    model = world.load_model()
+    print(f"Evaluating the model over a {len(lons)}x{len(lats)} lattice at "
+          f"{len(args.weather_levels)} weather level(s)...")
+    lookup = compile_lookup(model, world.predict_world_aqi, lats, lons, cities,
+                            args.weather_levels, args.chunk_rows)
+    lookup.meta.update(model=world.MODEL_PATH, model_hash=file_hash(world.MODEL_PATH),
+                       fallback=model is None, resolution_deg=args.resolution)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    lookup.save(args.out)
+    size_mb = os.path.getsize(args.out) / 1024**2
+    print(f"🧮 {lookup.describe()}")
+    print(f"   Saved {args.out} ({size_mb:.1f} MB)")
+
+
+def run_serve(args):
+    import functools
+
+    from heatmap.lookup import AQILookup
+    from heatmap.service import AQIServer, AQIService
+
+    if args.lookup:
+        lookup = AQILookup.load(args.lookup)
+        lookup.check_sources(world.load_sources(args.sources))
+        service = AQIService(lookup=lookup, cell_deg=args.cell_deg,
+                             tile_cells=args.tile_cells, max_tiles=args.max_tiles)
+    else:
+        print("Loading ML model...")
+        service = AQIService(
+            world.load_model(), functools.partial(world.predict_world_aqi, predictor=None),
+            world.load_sources(args.sources), seed=args.seed, cell_deg=args.cell_deg,
+            tile_cells=args.tile_cells, max_tiles=args.max_tiles, model_path=world.MODEL_PATH,
+            cache=None if args.no_cache else GridCache(args.cache_dir))
+    server = AQIServer((args.host, args.port), service, verbose=args.verbose)
+    host, port = server.server_address[:2]
+    print(f"🛰️  Serving AQI from the {service.info()['source']} on http://{host}:{port} "
+          f"(/aqi, /aqi/bbox, /aqi/batch, /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def run_timeseries(args):
+    import functools
+
+    from heatmap.knn import knn_backend
+    from heatmap.parallel import ParallelPredictor
+    from heatmap.timeseries import TimeSeriesStore, keyframe_weights, predict_timeseries
+
+    lats, lons = world.world_axes(args.grid_size)
+    cities = world.load_sources(args.sources)
+    feature_dtype, grid_dtype = DTYPES[args.dtype]
+    static = None
+    if not args.no_rasters:
+        with phase('cache'):
+            static = StaticRasterStore(args.raster_dir).load(lats, lons, cities,
+                                                             dtype=feature_dtype)
+    hours = args.start_hour + args.step_hours * np.arange(args.frames)
+    keys = keyframe_weights(len(hours), args.keyframe_every)[0]
+
+    print("Loading ML model...")
+    model = knn_backend(world.load_model(), args.knn)
+    predictor = None
+    if args.workers > 1 and model and hasattr(model, 'predict'):
+        print(f"Starting {args.workers} inference workers...")
+        predictor = ParallelPredictor(world.MODEL_PATH, args.workers,
+                                      len(keys) * args.chunk_rows * len(lons), world.N_FEATURES,
+                                      dtype=feature_dtype, backend=args.knn)
+    store = TimeSeriesStore.create(args.out_dir, hours, lats, lons, grid_dtype,
+                                   meta={'seed': args.seed, 'dtype': args.dtype,
+                                         'keyframes': keys.tolist()})
+    print(f"Predicting {len(hours)} frames ({len(keys)} keyframes) of the "
+          f"{len(lons)}x{len(lats)} world grid in bands of {args.chunk_rows} rows...")
+    try:
+        predict_timeseries(model, functools.partial(world.predict_world_aqi, predictor=predictor),
+                           lats, lons, cities, hours, args.chunk_rows, args.seed,
+                           out=store.frames, static=static, dtype=args.dtype,
+                           keyframe_every=args.keyframe_every)
+    finally:
+        if predictor is not None:
+            predictor.close()
+    store.save_meta()
+    size_mb = store.frames.nbytes / 1024**2
+    print(f"🕒 {len(hours)} frames from hour {hours[0]:g} to {hours[-1]:g} UTC: "
+          f"{store.path} ({size_mb:.1f} MB)")
+
+
+def run_history(args):
+    runs = load_runs(args.log_path)
+    if not runs:
+        raise ValueError(f"No runs in {args.log_path}")
+    runs = [run for run in runs if run['command'] == (args.run_command or runs[-1]['command'])]
+    last = runs[-1]
+    print(f"Run {last['run']} ({last['command']}, {last['status']}) at {last['time']} "
+          f"against {min(args.window, len(runs) - 1)} earlier run(s), "
+          f"peak RSS {last['peak_rss_mb']:.0f} MB")
+    rows = compare_runs(runs, args.window, args.threshold)
+    width = max([len(row[0]) for row in rows] + [5])
+    regressions = 0
+    print(f"   {'phase':<{width}} {'last s':>9} {'baseline s':>11} {'change':>8}")
+    for name, seconds, baseline, change, regressed in rows:
+        regressions += regressed
+        print(f"   {name:<{width}} {seconds:>9.3f} "
+              f"{'-' if baseline is None else f'{baseline:.3f}':>11} "
+              f"{'-' if change is None else f'{change:+.0%}':>8}{'  ⚠️ slower' if regressed else ''}")
+    if regressions:
+        raise SystemExit(f"{regressions} phase(s) regressed by more than {args.threshold:.0%}")
+
+
+def build_parser():
+    common = add_instrumentation_arguments(argparse.ArgumentParser(add_help=False))
+
+    parser = argparse.ArgumentParser(prog='python -m heatmap',
+                                     description="Generate AQI heatmaps from the ML model")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    world_parser = commands.add_parser('world', parents=[common],
+                                       help='Render the world heatmap and statistics figures')
+    world.add_arguments(world_parser)
+    world_parser.set_defaults(run=run_world)
+
+    regional_parser = commands.add_parser('regional', parents=[common],
+                                          help='Render the regional heatmap and contour map')
+    regional.add_arguments(regional_parser)
+    regional_parser.set_defaults(run=run_regional)
+
+    stats_parser = commands.add_parser('stats', parents=[common],
+                                       help='Print the world AQI summary without rendering')
+    world.add_arguments(stats_parser)
+    stats_parser.add_argument('--input', default=None,
+                              help='Summarize an existing .npy grid instead of predicting one')
+    stats_parser.set_defaults(run=run_stats)
+
+    tiles_parser = commands.add_parser('tiles', parents=[common],
+                                       help='Write a z/x/y PNG tile pyramid for web maps')
+    world.add_arguments(tiles_parser)
+    tiles_parser.add_argument('--out-dir', default='tiles', help='Root of the tile pyramid')
+    tiles_parser.add_argument('--min-zoom', type=int, default=0)
+    tiles_parser.add_argument('--max-zoom', type=int, default=5)
+    tiles_parser.add_argument('--tile-workers', type=int, default=os.cpu_count() or 1,
+                              help='Render tiles on this many worker processes')
+    tiles_parser.set_defaults(run=run_tiles)
+
+    rasters_parser = commands.add_parser('rasters', parents=[common],
+                                         help='Precompute static-feature rasters for world runs')
+    rasters_parser.add_argument('--grid-sizes', type=int, nargs='+', default=[180, 720, 3600],
+                                help='World grid sizes (longitude cells) to bake')
+    rasters_parser.add_argument('--dtypes', choices=sorted(DTYPES), nargs='+',
+                                default=sorted(DTYPES), help='--dtype modes to bake rasters for')
+    rasters_parser.add_argument('--raster-dir', default=DEFAULT_RASTER_DIR)
+    rasters_parser.add_argument('--sources', default=None, help=SOURCES_HELP)
+    rasters_parser.set_defaults(run=run_rasters)
+
+    compile_parser = commands.add_parser('compile', parents=[common],
+                                         help='Distil the model into a quantized AQI lookup raster')
+    compile_parser.add_argument('--resolution', type=float, default=0.25,
+                                help='Lattice spacing in degrees')
+    compile_parser.add_argument('--weather-levels', type=float, nargs='+', default=[0.0],
+                                help='Distinct weather factor values to evaluate, in any order '
+                                     '(interpolated between)')
+    compile_parser.add_argument('--chunk-rows', type=int, default=256)
+    compile_parser.add_argument('--out', default=DEFAULT_LOOKUP_PATH)
+    compile_parser.add_argument('--sources', default=None, help=SOURCES_HELP)
+    compile_parser.set_defaults(run=run_compile)
+
+    serve_parser = commands.add_parser('serve', parents=[common],
+                                       help='Answer point and area AQI queries over HTTP')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--lookup', default=None,
+                              help='Answer from a compiled lookup instead of the model')
+    serve_parser.add_argument('--seed', type=int, default=0,
+                              help='Seed of the per-tile noise streams')
+    serve_parser.add_argument('--cell-deg', type=float, default=DEFAULT_CELL_DEG)
+    serve_parser.add_argument('--tile-cells', type=int, default=DEFAULT_TILE_CELLS)
+    serve_parser.add_argument('--max-tiles', type=int, default=DEFAULT_MAX_TILES,
+                              help='Tiles kept in memory')
+    serve_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                              help='Directory of cached grids that tiles persist to')
+    serve_parser.add_argument('--no-cache', action='store_true')
+    serve_parser.add_argument('--sources', default=None, help=SOURCES_HELP)
+    serve_parser.add_argument('--verbose', action='store_true', help='Log every request')
+    serve_parser.set_defaults(run=run_serve)
+
+    timeseries_parser = commands.add_parser('timeseries', parents=[common],
+                                            help='Predict hourly frames of the world grid')
+    timeseries_parser.add_argument('--grid-size', type=int, default=180,
+                                   help='Longitude cells (latitude uses half as many)')
+    timeseries_parser.add_argument('--frames', type=int, default=24)
+    timeseries_parser.add_argument('--step-hours', type=float, default=1,
+                                   help='Hours between frames')
+    timeseries_parser.add_argument('--start-hour', type=float, default=0,
+                                   help='UTC hour of the first frame')
+    timeseries_parser.add_argument('--keyframe-every', type=int, default=1,
+                                   help='Predict every k-th frame and interpolate the rest')
+    timeseries_parser.add_argument('--chunk-rows', type=int, default=16,
+                                   help='Latitude rows per batch (all keyframes at once)')
+    timeseries_parser.add_argument('--seed', type=int, default=None,
+                                   help='Seed for reproducible noise')
+    timeseries_parser.add_argument('--workers', type=int, default=1,
+                                   help='Run model inference on this many worker processes')
+    timeseries_parser.add_argument('--dtype', choices=sorted(DTYPES), default='float64')
+    timeseries_parser.add_argument('--knn', choices=world.BACKENDS, default='exact',
+                                   help='Nearest-neighbour backend (grid: haversine models only)')
+    timeseries_parser.add_argument('--raster-dir', default=DEFAULT_RASTER_DIR)
+    timeseries_parser.add_argument('--no-rasters', action='store_true')
+    timeseries_parser.add_argument('--sources', default=None, help=SOURCES_HELP)
+    timeseries_parser.add_argument('--out-dir', default=DEFAULT_TIMESERIES_DIR,
+                                   help='Directory of the aqi.npy frames and meta.json')
+    timeseries_parser.set_defaults(run=run_timeseries)
+
+    history_parser = commands.add_parser('history',
+                                         help='Compare the last --log run with earlier runs')
+    history_parser.add_argument('log_path', help='JSON-lines log written by --log')
+    history_parser.add_argument('--run-command', default=None,
+                                help='Only runs of this subcommand (default: that of the last run)')
+    history_parser.add_argument('--window', type=int, default=5,
+                                help='Earlier runs in the baseline median')
+    history_parser.add_argument('--threshold', type=float, default=0.2,
+                                help='Flag phases this much slower than the baseline')
+    history_parser.set_defaults(run=run_history, timings=False, log=None, profile=None)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        with instrumented(args.command, args):
+            args.run(args)
+    except Exception as e:
+        print(f"❌ Error running {args.command}: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+    return 0
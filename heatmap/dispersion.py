@@ -0,0 +1,212 @@
+"""
+Wind-driven plume dispersion of source pollution
+Sources are rasterized onto the grid and spread by an anisotropic Gaussian
+plume kernel: centred downwind by the distance the wind carries pollution in
+`residence_hours`, stretched along the wind and `sigma_km` wide across it. The
+spreading is one FFT convolution per latitude band (numpy.fft), so its cost
+depends on the grid size and not on the number of sources. Within a band the
+kernel takes the east-west cell size at the latitude halfway between the band
+and the sources the wind carries onto it. Each source is spread over the 4x4
+cells around it with cubic interpolation weights, so the sum of the sampled
+kernels follows the kernel at the source's own position rather than at the
+nearest cell centre, with copies 360 degrees east and west so plumes wrap
+across the antimeridian. A band of grid rows can be computed on its own from
+the sources within the kernel's reach of it, so streamed latitude bands need
+memory for the band and that halo only.
+
+Against the kernel evaluated cell by cell on each cell's own east/north plane
+from the exact source positions (benchmarks/check_dispersion), the mean
+relative error is about 1-2% on 1-degree grids and about 4% on a 5-degree
+world grid, where the default 5-degree plume width is a single cell.
+"""
+
+import numpy as np
+
+from heatmap.sources import DEFAULT_SCALE_KM, KM_PER_DEGREE, as_source_index
+
+DEFAULT_RESIDENCE_HOURS = 12.0
+DEFAULT_BAND_DEG = 5.0
+
+# Along-wind growth of the plume width per km of drift
+ALONG_SPREAD = 0.5
+
+# The kernel is cut off outside this many standard deviations
+TRUNCATE_SIGMAS = 4.0
+
+# Floor on cos(latitude) so bands at the poles keep a finite cell width
+MIN_COS_LAT = 1e-3
+
+# Cell offsets of the cubic interpolation weights around a source
+SPREAD_OFFSETS = np.arange(-1, 3)
+
+
+def fast_length(n):
+    """Smallest 2-3-5-smooth integer >= n, a fast numpy.fft size"""
+    length = n
+    while True:
+        m = length
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return length
+        length += 1
+
+
+def cubic_weights(t):
+    """Lagrange weights of the cells at offsets -1, 0, 1, 2 for fractional positions t"""
+    t = t[:, None]
+    return np.hstack([-t * (t - 1) * (t - 2) / 6, (t + 1) * (t - 1) * (t - 2) / 2,
+                      -(t + 1) * t * (t - 2) / 2, (t + 1) * t * (t - 1) / 6])
+
+
+def grid_step(axis, name):
+    """Spacing of an ascending, evenly spaced axis"""
+    axis = np.asarray(axis, dtype=np.float64)
+    if len(axis) < 2:
+        raise ValueError(f"Plume dispersion needs at least two {name}")
+    step = (axis[-1] - axis[0]) / (len(axis) - 1)
+    if step <= 0 or not np.allclose(np.diff(axis), step, rtol=1e-6, atol=1e-9):
+        raise ValueError(f"Plume dispersion needs ascending, evenly spaced {name}")
+    return step
+
+
+class PlumeDispersion:
+    """A uniform wind (direction it blows from, speed) and the plume kernel it gives"""
+
+    def __init__(self, wind_from_deg, wind_speed_ms, sigma_km=DEFAULT_SCALE_KM,
+                 residence_hours=DEFAULT_RESIDENCE_HOURS, band_deg=DEFAULT_BAND_DEG):
+        self.wind_from_deg = float(wind_from_deg) % 360
+        self.wind_speed_ms = float(wind_speed_ms)
+        self.sigma_km = float(sigma_km)
+        self.residence_hours = float(residence_hours)
+        self.band_deg = float(band_deg)
+        if self.wind_speed_ms < 0 or self.sigma_km <= 0:
+            raise ValueError("Wind speed must be >= 0 and sigma_km > 0")
+
+        self.drift_km = self.wind_speed_ms * 3.6 * self.residence_hours
+        self.sigma_along_km = np.hypot(self.sigma_km, ALONG_SPREAD * self.drift_km)
+        self.reach_km = self.drift_km + TRUNCATE_SIGMAS * self.sigma_along_km
+
+    def key(self):
+        """JSON-able settings, for cache keys"""
+        return {'wind_from_deg': self.wind_from_deg, 'wind_speed_ms': self.wind_speed_ms,
+                'sigma_km': self.sigma_km, 'residence_hours': self.residence_hours,
+                'band_deg': self.band_deg}
+
+    def describe(self):
+        return (f"wind from {self.wind_from_deg:g} deg at {self.wind_speed_ms:g} m/s, "
+                f"plume drift {self.drift_km:.0f} km, {self.sigma_along_km:.0f} x "
+                f"{self.sigma_km:.0f} km")
+
+    def kernel(self, dx_km, dy_km):
+        """
+        Plume weight at east/north offsets (km) from a source.
+
+        Normalised so a calm wind peaks at 1 and the integral does not change
+        with the wind, only where it lands.
+        """
+        bearing = np.radians(self.wind_from_deg + 180)
+        along = dx_km * np.sin(bearing) + dy_km * np.cos(bearing)
+        cross = dx_km * np.cos(bearing) - dy_km * np.sin(bearing)
+        z2 = ((along - self.drift_km) / self.sigma_along_km)**2 + (cross / self.sigma_km)**2
+        weights = (self.sigma_km / self.sigma_along_km) * np.exp(-0.5 * z2)
+        weights[z2 > TRUNCATE_SIGMAS**2] = 0
+        return weights
+
+    def bands(self, lats, lons):
+        """
+        (rows, dx_km, dy_km, reach_rows, reach_cols) per latitude band of the grid.
+
+        reach_cols is capped at half the globe, past which a source's other
+        360-degree copy is the nearer one. dx_km is taken halfway along the
+        north-south drift, between the band and the sources it mostly receives.
+        """
+        lat_step, lon_step = grid_step(lats, 'latitudes'), grid_step(lons, 'longitudes')
+        dy_km = lat_step * KM_PER_DEGREE
+        reach_rows = int(np.ceil(self.reach_km / dy_km))
+        band_rows = max(1, int(round(self.band_deg / lat_step)))
+        max_cols = int(np.ceil(180 / lon_step))
+        drift_north_deg = (self.drift_km * np.cos(np.radians(self.wind_from_deg + 180)) /
+                           KM_PER_DEGREE)
+        for start in range(0, len(lats), band_rows):
+            rows = slice(start, min(start + band_rows, len(lats)))
+            mid_lat = np.mean(lats[rows]) - drift_north_deg / 2
+            cos_lat = max(np.cos(np.radians(mid_lat)), MIN_COS_LAT)
+            dx_km = lon_step * KM_PER_DEGREE * cos_lat
+            reach_cols = min(int(np.ceil(self.reach_km / dx_km)), max_cols)
+            yield rows, dx_km, dy_km, reach_rows, reach_cols
+
+    def spread_sources(self, lats, lons, sources):
+        """
+        (row, col, intensity) on the grid lattice of the sources and their
+        +-360 degree copies, each spread over 4x4 cells by cubic_weights.
+
+        The weights sum to one, so no source mass is lost; some are negative.
+        """
+        index = as_source_index(sources)
+        lat_step, lon_step = grid_step(lats, 'latitudes'), grid_step(lons, 'longitudes')
+        position = (index.lats - lats[0]) / lat_step
+        first = np.floor(position).astype(np.int64)
+        rows = first[:, None] + SPREAD_OFFSETS
+        row_weights = cubic_weights(position - first)
+
+        all_rows, all_cols, all_weights = [], [], []
+        for shift in (-360, 0, 360):
+            position = (index.lons + shift - lons[0]) / lon_step
+            first = np.floor(position).astype(np.int64)
+            cols = first[:, None] + SPREAD_OFFSETS
+            weights = (index.intensities[:, None, None] * row_weights[:, :, None] *
+                       cubic_weights(position - first)[:, None, :])
+            all_rows.append(np.broadcast_to(rows[:, :, None], weights.shape).ravel())
+            all_cols.append(np.broadcast_to(cols[:, None, :], weights.shape).ravel())
+            all_weights.append(weights.ravel())
+        return np.concatenate(all_rows), np.concatenate(all_cols), np.concatenate(all_weights)
+
+    def influence(self, lats, lons, sources, rows=None):
+        """
+        Plume pollution of `sources` over the lats x lons grid, by FFT convolution.
+
+        `rows` (a slice of lats) limits the output to those rows. The kernel
+        bands are still laid out over the whole axis, and each band is convolved
+        on a canvas of its rows in `rows` plus a halo of the kernel reach, so the
+        rows match the same rows of the whole grid to round-off.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if rows is None:
+            rows = slice(None)
+        row_start, row_stop, _ = rows.indices(len(lats))
+        src_rows, src_cols, intensities = self.spread_sources(lats, lons, sources)
+        n_cols = len(lons)
+
+        out = np.zeros((max(row_stop - row_start, 0), n_cols))
+        for band, dx_km, dy_km, reach_rows, reach_cols in self.bands(lats, lons):
+            start, stop = max(band.start, row_start), min(band.stop, row_stop)
+            if start >= stop:
+                continue
+            # Canvas of the band's rows grown by the kernel reach on every side
+            band_rows = stop - start
+            canvas_shape = (band_rows + 2 * reach_rows, n_cols + 2 * reach_cols)
+            r = src_rows - (start - reach_rows)
+            c = src_cols + reach_cols
+            inside = (r >= 0) & (r < canvas_shape[0]) & (c >= 0) & (c < canvas_shape[1])
+            if not inside.any():
+                continue
+            canvas = np.zeros(canvas_shape)
+            np.add.at(canvas, (r[inside], c[inside]), intensities[inside])
+
+            offsets_y = np.arange(-reach_rows, reach_rows + 1) * dy_km
+            offsets_x = np.arange(-reach_cols, reach_cols + 1) * dx_km
+            kernel = self.kernel(offsets_x[None, :], offsets_y[:, None])
+
+            # Linear (not circular) convolution: pad to the full output size
+            shape = (fast_length(canvas_shape[0] + 2 * reach_rows),
+                     fast_length(canvas_shape[1] + 2 * reach_cols))
+            spread = np.fft.irfft2(np.fft.rfft2(canvas, shape) * np.fft.rfft2(kernel, shape),
+                                   shape)
+            out[start - row_start:stop - row_start] = spread[
+                2 * reach_rows:2 * reach_rows + band_rows, 2 * reach_cols:2 * reach_cols + n_cols]
+        # Negative cubic weights and round-off leave small negative values in the tails
+        np.maximum(out, 0, out=out)
+        return out
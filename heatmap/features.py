@@ -0,0 +1,244 @@
+"""
+Vectorized feature builder for the world AQI grid
+Region rectangles are evaluated as boolean masks over the whole grid and all
+noise is drawn row by row from seeded, independent np.random.Generator streams
+"""
+
+import numpy as np
+
+from heatmap.sources import DEFAULT_RADIUS_KM, as_source_index, source_influence
+
+N_FEATURES = 8
+
+# Leading feature columns that depend only on geography and the source table
+# (city influence, industrial, desert, ocean, polar, forest), as opposed to the
+# per-run population and weather noise
+N_STATIC_FEATURES = 6
+
+# Regional rectangles as (lat_min, lat_max, lon_min, lon_max, value).
+# Within a layer the first matching rectangle wins, like the original if/elif chains.
+INDUSTRIAL_REGIONS = [
+    (20, 60, 100, 140, 40),     # East Asia industrial belt
+    (40, 60, -10, 40, 25),      # European industrial
+    (25, 50, -125, -70, 20),    # North American industrial
+]
+
+DESERT_REGIONS = [
+    (15, 35, -20, 60, 30),      # Sahara/Middle East
+    (20, 40, 70, 120, 25),      # Central Asia deserts
+]
+
+# Simplified ocean detection (areas far from major landmasses), only below 60 degrees
+OCEAN_REGIONS = [
+    (0, 60, -180, -120, -20),
+    (-60, 0, -60, 20, -20),
+    (-40, 40, 120, 180, -20),
+]
+
+FOREST_REGIONS = [
+    (-10, 10, -80, -40, -10),   # Amazon
+    (-10, 10, 10, 40, -8),      # Central Africa
+    (-10, 10, 95, 140, -5),     # Southeast Asia
+]
+
+POLAR_LATITUDE = 60
+POLAR_VALUE = -15
+
+# Standard deviation of the noise predict_world_aqi's fallback adds per cell
+FALLBACK_NOISE_STD = 8
+
+# Divisors used to normalize each feature column
+FEATURE_SCALES = (100, 50, 40, 30, 20, 15, 20, 10)
+
+
+def region_layer(lat_col, lon_row, regions, dtype=np.float32):
+    """Rasterize a list of region rectangles onto the lat x lon grid"""
+    layer = np.zeros((lat_col.shape[0], lon_row.shape[1]), dtype=dtype)
+    # Paint in reverse so the first matching rectangle ends up on top
+    for lat_min, lat_max, lon_min, lon_max, value in reversed(regions):
+        mask = ((lat_col >= lat_min) & (lat_col <= lat_max) &
+                (lon_row >= lon_min) & (lon_row <= lon_max))
+        layer[mask] = value
+    return layer
+
+
+def static_layers(lats, lons, dtype=np.float32):
+    """Compute the fixed geographic layers (industrial, desert, ocean, polar, forest)"""
+    lat_col = np.asarray(lats)[:, None]
+    lon_row = np.asarray(lons)[None, :]
+
+    industrial = region_layer(lat_col, lon_row, INDUSTRIAL_REGIONS, dtype)
+    desert = region_layer(lat_col, lon_row, DESERT_REGIONS, dtype)
+
+    ocean = region_layer(lat_col, lon_row, OCEAN_REGIONS, dtype)
+    ocean[np.broadcast_to(np.abs(lat_col) >= POLAR_LATITUDE, ocean.shape)] = 0
+
+    polar = np.zeros_like(industrial)
+    polar[np.broadcast_to(np.abs(lat_col) > POLAR_LATITUDE, polar.shape)] = POLAR_VALUE
+
+    forest = region_layer(lat_col, lon_row, FOREST_REGIONS, dtype)
+
+    return industrial, desert, ocean, polar, forest
+
+
+def city_influence(lats, lons, cities, radius_km=DEFAULT_RADIUS_KM):
+    """
+    Sum the distance-decay influence of every city over the grid.
+
+    `cities` is a get_major_cities-style dict or a prebuilt SourceIndex; only
+    cells within radius_km (great-circle) of a city are touched.
+    """
+    return source_influence(lats, lons, cities, radius_km)
+
+
+def fill_static_features(lats, lons, cities, out, radius_km=DEFAULT_RADIUS_KM, dispersion=None,
+                         rows=None):
+    """
+    Write the scaled static feature columns into out[:, :, :N_STATIC_FEATURES].
+
+    `out` is an (n_lats, n_lons, >= N_STATIC_FEATURES) array, or has len(rows)
+    rows when `rows` (a slice of lats) fills only a band of the grid. A
+    heatmap.dispersion.PlumeDispersion replaces the isotropic city influence
+    with its wind-driven plumes. Returns the unscaled city pollution grid.
+    """
+    if rows is None:
+        rows = slice(None)
+    if dispersion is None:
+        base_pollution = city_influence(lats[rows], lons, cities, radius_km)
+    else:
+        # The plume bands and cell sizes come from the whole latitude axis
+        base_pollution = dispersion.influence(lats, lons, cities, rows)
+    industrial, desert, ocean, polar, forest = static_layers(lats[rows], lons, out.dtype)
+    layers = (base_pollution, industrial, desert, np.abs(ocean), np.abs(polar), np.abs(forest))
+    for k, (layer, scale) in enumerate(zip(layers, FEATURE_SCALES)):
+        np.divide(layer, scale, out=out[:, :, k], casting='unsafe')
+    return base_pollution
+
+
+class NoiseStreams:
+    """
+    Independent random streams per noise term and grid row.
+
+    Row r of term t is drawn from its own Generator, seeded by the root
+    SeedSequence's entropy with spawn key (t, r), so any band of rows can be
+    regenerated alone. The whole grid, chunked bands, worker shards and cached
+    tiles therefore all see the same values for the same seed. `seed` may be
+    an int, None (fresh entropy, fixed for this object) or a SeedSequence.
+
+    `window` is (row_offset, col_offset, row_width) when the grid is a window
+    of a larger one, e.g. a bbox of the world grid: rows are keyed by their row
+    in the larger grid and draw its full row_width, sliced at col_offset, so
+    the window sees the larger grid's values for the same cells.
+    """
+
+    TERMS = ('pop', 'weather', 'predict')
+
+    def __init__(self, seed=None, terms=TERMS, window=None):
+        if isinstance(seed, np.random.SeedSequence):
+            self.root = seed
+        else:
+            self.root = np.random.SeedSequence(seed)
+        self.terms = {term: k for k, term in enumerate(terms)}
+        self.window = window
+
+    def row_rng(self, term, row):
+        """Generator for one row of a noise term"""
+        stream = np.random.SeedSequence(self.root.entropy,
+                                        spawn_key=self.root.spawn_key + (self.terms[term], row))
+        return np.random.default_rng(stream)
+
+    def draw(self, term, row_start, row_stop, n_cols, method, *args):
+        """(rows, n_cols) draws of Generator.<method>(*args) for rows row_start..row_stop"""
+        row_offset, col_offset, row_width = self.window or (0, 0, n_cols)
+        if col_offset + n_cols > row_width:
+            raise ValueError(f"Columns {col_offset}-{col_offset + n_cols} are outside "
+                             f"rows {row_width} wide")
+        out = np.empty((row_stop - row_start, n_cols))
+        for i, row in enumerate(range(row_start + row_offset, row_stop + row_offset)):
+            values = getattr(self.row_rng(term, row), method)(*args, size=row_width)
+            out[i] = values[col_offset:col_offset + n_cols]
+        return out
+
+    def predict_noise(self, row_start, row_stop, n_cols):
+        """Flattened per-cell noise of predict_world_aqi's fallback for a band of rows"""
+        return self.draw('predict', row_start, row_stop, n_cols, 'normal',
+                         0, FALLBACK_NOISE_STD).ravel()
+
+
+def build_world_features(lats, lons, cities, noise=None, out=None, dtype=np.float32,
+                         radius_km=DEFAULT_RADIUS_KM, static=None, row_offset=0,
+                         dispersion=None):
+    """
+    Fill an (N, 8) feature matrix for the lats x lons grid in row-major order.
+
+    `out` may be a preallocated (N, 8) array to write into; otherwise one is
+    allocated with `dtype`. `static` may be a precomputed (n_lats, n_lons, 6)
+    raster window (see heatmap.rasters) to copy the static columns from instead
+    of computing them, and `dispersion` a PlumeDispersion for the city column.
+    `row_offset` is the index of lats[0] in the noise's grid (see
+    NoiseStreams.window), which selects the rows' noise streams. Returns the feature matrix and the city pollution grid.
+    """
+    if noise is None:
+        noise = NoiseStreams()
+
+    n_rows, n_cols = len(lats), len(lons)
+    if out is None:
+        out = np.empty((n_rows * n_cols, N_FEATURES), dtype=dtype)
+    elif out.shape != (n_rows * n_cols, N_FEATURES):
+        raise ValueError(f"Feature buffer has shape {out.shape}, "
+                         f"expected {(n_rows * n_cols, N_FEATURES)}")
+
+    grid = out.reshape(n_rows, n_cols, N_FEATURES)
+    if static is None:
+        base_pollution = fill_static_features(lats, lons, cities, grid, radius_km, dispersion)
+    else:
+        if static.shape != (n_rows, n_cols, N_STATIC_FEATURES):
+            raise ValueError(f"Static raster window has shape {static.shape}, "
+                             f"expected {(n_rows, n_cols, N_STATIC_FEATURES)}")
+        np.copyto(grid[:, :, :N_STATIC_FEATURES], static, casting='unsafe')
+        base_pollution = static[:, :, 0] * np.float64(FEATURE_SCALES[0])
+
+    # One draw per row and noise term instead of two scalar draws per cell
+    rows = (row_offset, row_offset + n_rows, n_cols)
+    pop_factor = noise.draw('pop', *rows, 'exponential', 0.2) * 10
+    weather_factor = noise.draw('weather', *rows, 'normal', 0, 5)
+    for k, layer in ((6, pop_factor), (7, weather_factor)):
+        np.divide(layer, FEATURE_SCALES[k], out=grid[:, :, k], casting='unsafe')
+
+    return out, base_pollution
+
+
+def iter_feature_tiles(lats, lons, cities, chunk_rows, noise=None, dtype=np.float32,
+                       radius_km=DEFAULT_RADIUS_KM, static=None, dispersion=None):
+    """
+    Yield (row_start, row_stop, features) for consecutive latitude bands.
+
+    The feature buffer is reused between bands, so consumers must finish with a
+    tile before advancing the generator. With a memory-mapped `static` raster
+    only the rows of the current band are read. With a PlumeDispersion each
+    band's plumes are convolved from the sources within reach of the band.
+    """
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows must be at least 1")
+    if static is not None and dispersion is not None:
+        raise ValueError("A static raster and a plume dispersion cannot be combined")
+    if noise is None:
+        noise = NoiseStreams()
+    # Index the sources once rather than once per band
+    cities = as_source_index(cities)
+
+    n_cols = len(lons)
+    buffer = np.empty((chunk_rows * n_cols, N_FEATURES), dtype=dtype)
+    if dispersion is not None:
+        static_buffer = np.empty((chunk_rows, n_cols, N_STATIC_FEATURES), dtype=dtype)
+    for row_start in range(0, len(lats), chunk_rows):
+        row_stop = min(row_start + chunk_rows, len(lats))
+        tile = buffer[:(row_stop - row_start) * n_cols]
+        band_static = None if static is None else static[row_start:row_stop]
+        if dispersion is not None:
+            band_static = static_buffer[:row_stop - row_start]
+            fill_static_features(lats, lons, cities, band_static, radius_km, dispersion,
+                                 rows=slice(row_start, row_stop))
+        build_world_features(lats[row_start:row_stop], lons, cities, noise=noise, out=tile,
+                             radius_km=radius_km, static=band_static, row_offset=row_start)
+        yield row_start, row_stop, tile
@@ -0,0 +1,84 @@
+"""
+Incremental world-grid updates for single-source edits
+A WorldGridState keeps the features, city influence and per-cell prediction noise
+of a built grid. When one source is added, moved, re-weighted or removed, only the
+cells inside the old and new influence radius are recomputed and re-predicted,
+and the result is bit-identical to rebuilding the whole grid.
+"""
+
+import numpy as np
+
+from heatmap.features import FEATURE_SCALES, N_FEATURES, NoiseStreams, build_world_features
+from heatmap.sources import (DEFAULT_RADIUS_KM, KM_PER_DEGREE, SourceIndex, accumulate_influence,
+                             longitude_windows)
+
+
+class WorldGridState:
+    """A predicted world grid plus the intermediate arrays needed to patch it"""
+
+    def __init__(self, model, predict, lats, lons, sources, seed=None,
+                 radius_km=DEFAULT_RADIUS_KM):
+        self.model = model
+        self.predict = predict
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.sources = dict(sources)
+        self.radius_km = radius_km
+        self.index = SourceIndex.from_cities(self.sources)
+
+        noise = NoiseStreams(seed)
+        shape = (len(self.lats), len(self.lons))
+        self.features, self.base_pollution = build_world_features(
+            self.lats, self.lons, self.index, noise=noise, radius_km=radius_km)
+        self.predict_noise = noise.predict_noise(0, shape[0], shape[1])
+        self.aqi = self.predict(self.model, self.features, None, None,
+                                noise=self.predict_noise).reshape(shape)
+
+    def windows(self, source):
+        """(rows, cols) rectangles of the grid within reach of a (lat, lon, level) source"""
+        source_lat, source_lon, _ = source
+        radius_deg = self.radius_km / KM_PER_DEGREE
+        rows = slice(np.searchsorted(self.lats, source_lat - radius_deg, side='left'),
+                     np.searchsorted(self.lats, source_lat + radius_deg, side='right'))
+        return [(rows, cols) for cols in longitude_windows(self.lons, source_lat, source_lon,
+                                                           self.radius_km)
+                if rows.start < rows.stop and cols.start < cols.stop]
+
+    def update_source(self, name, source=None):
+        """
+        Add or change source `name` to (lat, lon, level), or remove it when source is None.
+
+        Returns the list of (rows, cols) windows that were recomputed.
+        """
+        windows = []
+        if name in self.sources:
+            windows += self.windows(self.sources[name])
+        if source is None:
+            self.sources.pop(name, None)
+        else:
+            self.sources[name] = tuple(source)
+            windows += self.windows(source)
+
+        # Rebuild the index from the table so sources are summed in the same
+        # order a full rebuild would use
+        self.index = SourceIndex.from_cities(self.sources)
+        for rows, cols in windows:
+            self._recompute(rows, cols)
+        return windows
+
+    def _recompute(self, rows, cols):
+        """Recompute influence, features and predictions inside one window"""
+        base = self.base_pollution[rows, cols]
+        base[...] = 0
+        accumulate_influence(base, self.lats[rows], self.lons[cols], self.index, self.radius_km)
+
+        n_cols = len(self.lons)
+        grid_features = self.features.reshape(len(self.lats), n_cols, N_FEATURES)
+        np.divide(base, FEATURE_SCALES[0], out=grid_features[rows, cols, 0], casting='unsafe')
+
+        # Flat indices of the window cells, in the row-major order of the full grid
+        cells = (np.arange(rows.start, rows.stop)[:, None] * n_cols +
+                 np.arange(cols.start, cols.stop)[None, :]).ravel()
+        predictions = self.predict(self.model, self.features[cells], None, None,
+                                   noise=self.predict_noise[cells])
+        self.aqi[rows, cols] = predictions.reshape(base.shape)
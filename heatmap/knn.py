@@ -0,0 +1,272 @@
+"""
+Pluggable nearest-neighbour backends for fitted KNN regressors
+The training points and targets are pulled out of a fitted KNeighborsRegressor
+(`_fit_X`, `_y`) and served through a different index, with the regressor's
+k and weighting applied to the neighbours found:
+
+    exact     the model's own predict
+    balltree  a sklearn BallTree on the model's metric (haversine for lat/lon
+              models fitted in radians); exact, without brute-force fallbacks
+    grid      a pure-NumPy lat/lon bucket index for haversine (lat, lon) models
+              that searches a bounded ring of buckets around the query's;
+              approximate. Feature-space models are refused: bucketing a few of
+              their columns finds too few of the true neighbours
+
+Backends are duck-typed: each takes the fitted model, keeps its training_data
+and provides kneighbors(features) -> (distances, indices) of the model's k
+nearest training points per row, sorted nearest first; predict_neighbours
+turns those into predictions.
+
+`python -m benchmarks.bench_knn_backends` reports recall and AQI error against
+the exact model versus speed.
+"""
+
+import itertools
+
+import numpy as np
+
+BACKENDS = ('exact', 'balltree', 'grid')
+
+# Query rows per predict batch, which bounds the (rows, k) neighbour arrays
+QUERY_TILE_ROWS = 65536
+
+# GridBucketBackend scores at most this many queries against this many
+# candidates at a time, which bounds its distance matrices
+QUERY_BLOCK_ROWS = 1024
+CANDIDATE_BLOCK_COLS = 2048
+
+
+def training_data(model):
+    """(points, targets, k, weights, metric, metric_params) of a fitted KNeighborsRegressor"""
+    try:
+        points, targets = model._fit_X, model._y
+    except AttributeError:
+        raise ValueError(f"{type(model).__name__} is not a fitted KNeighborsRegressor")
+    weights = model.weights
+    if weights not in ('uniform', 'distance'):
+        raise ValueError(f"Unsupported KNN weights {weights!r}")
+    metric_params = dict(model.effective_metric_params_ or {})
+    return (np.asarray(points), np.asarray(targets), model.n_neighbors, weights,
+            model.effective_metric_, metric_params)
+
+
+def neighbour_mean(distances, targets, weights):
+    """KNeighborsRegressor's average of (n, k) neighbour targets"""
+    if weights == 'uniform':
+        return targets.mean(axis=1)
+    # Like sklearn, exact matches take all the weight in their row
+    with np.errstate(divide='ignore'):
+        inverse = 1.0 / distances
+    exact = np.isinf(inverse)
+    rows = exact.any(axis=1)
+    inverse[rows] = exact[rows]
+    if targets.ndim == 3:
+        inverse = inverse[:, :, None]
+    return (inverse * targets).sum(axis=1) / inverse.sum(axis=1)
+
+
+def predict_neighbours(backend, features):
+    """Predictions of a backend, from its kneighbors in batches of QUERY_TILE_ROWS rows"""
+    features = np.asarray(features)
+    out = np.empty((len(features),) + backend.targets.shape[1:])
+    for start in range(0, len(features), QUERY_TILE_ROWS):
+        stop = min(start + QUERY_TILE_ROWS, len(features))
+        distances, indices = backend.kneighbors(features[start:stop])
+        out[start:stop] = neighbour_mean(distances, backend.targets[indices], backend.weights)
+    return out
+
+
+class BallTreeBackend:
+    """Exact neighbours from a BallTree built on the model's metric"""
+
+    def __init__(self, model, leaf_size=30):
+        from sklearn.neighbors import BallTree
+
+        (self.points, self.targets, self.k, self.weights,
+         self.metric, self.metric_params) = training_data(model)
+        self.tree = BallTree(self.points, leaf_size=leaf_size, metric=self.metric,
+                             **self.metric_params)
+
+    def kneighbors(self, features):
+        return self.tree.query(features, k=self.k)
+
+    def predict(self, features):
+        return predict_neighbours(self, features)
+
+
+class GridBucketBackend:
+    """
+    Approximate neighbours of a haversine (lat, lon) model from a bucket grid.
+
+    The training points are bucketed by latitude over their own range and by
+    longitude around the whole circle, with about `points_per_bucket` points per
+    bucket. Queries are compared against the buckets within a ring around their
+    own (wrapping across the antimeridian), widening the ring until it holds k
+    candidates and the great-circle distance it is guaranteed to cover, which
+    shrinks with cos(latitude) along longitude, reaches the k-th distance found
+    so far, or until `max_ring` is reached. Neighbours beyond the last ring are
+    missed, so `max_ring` trades recall for speed.
+    """
+
+    def __init__(self, model, points_per_bucket=32, max_ring=2):
+        (self.points, self.targets, self.k, self.weights,
+         self.metric, self.metric_params) = training_data(model)
+        if self.metric != 'haversine' or self.points.shape[1] != 2:
+            raise ValueError(f"grid backend only serves haversine (lat, lon) models, not "
+                             f"{self.metric!r} on {self.points.shape[1]} features; use "
+                             f"'balltree' for an exact index")
+        self.max_ring = max_ring
+        self.ring_offsets = {0: np.zeros((1, 2), dtype=np.int64)}
+
+        keys = self.points.astype(np.float64)
+        self.n_cells = max(1, int(np.ceil(np.sqrt(len(keys) / points_per_bucket))))
+        lat_min, lat_max = keys[:, 0].min(), keys[:, 0].max()
+        self.lo = np.array([lat_min, -np.pi])
+        self.cell_size = np.array([max(lat_max - lat_min, np.finfo(np.float64).tiny),
+                                   2 * np.pi]) / self.n_cells
+        self.shape = (self.n_cells, self.n_cells)
+
+        flat = np.ravel_multi_index(tuple(self.cell_coords(keys).T), self.shape)
+        self.order = np.argsort(flat, kind='stable')
+        self.search_points = self.search_space(self.points[self.order].astype(np.float64))
+        self.search_norms = np.einsum('ij,ij->i', self.search_points, self.search_points)
+        counts = np.bincount(flat, minlength=self.n_cells**2)
+        self.starts = np.concatenate([[0], np.cumsum(counts)])
+
+    def cell_coords(self, keys):
+        """(lat, lon) bucket of each point; latitudes clip to the end rows, longitudes wrap"""
+        lats = np.floor((keys[:, 0] - self.lo[0]) / self.cell_size[0]).astype(np.int64)
+        lons = np.floor(((keys[:, 1] - self.lo[1]) % (2 * np.pi)) /
+                        self.cell_size[1]).astype(np.int64)
+        return np.column_stack([np.clip(lats, 0, self.n_cells - 1),
+                                np.minimum(lons, self.n_cells - 1)])
+
+    def ring(self, cell, radius):
+        """Sorted-point positions of the buckets exactly `radius` cells from `cell`"""
+        if radius not in self.ring_offsets:
+            offsets = np.array(list(itertools.product(range(-radius, radius + 1), repeat=2)))
+            self.ring_offsets[radius] = offsets[np.abs(offsets).max(axis=1) == radius]
+        neighbours = cell + self.ring_offsets[radius]
+        neighbours = neighbours[(neighbours[:, 0] >= 0) & (neighbours[:, 0] < self.n_cells)]
+        neighbours[:, 1] %= self.n_cells
+        flat = np.ravel_multi_index(tuple(neighbours.T), self.shape)
+        if 2 * radius + 1 > self.n_cells:
+            # The ring is wider than the circle: drop buckets inner rings searched
+            inner = np.abs((neighbours[:, 1] - cell[1] + self.n_cells // 2) % self.n_cells
+                           - self.n_cells // 2)
+            flat = np.unique(flat[(np.abs(neighbours[:, 0] - cell[0]) == radius) |
+                                  (inner == radius)])
+        starts, stops = self.starts[flat], self.starts[flat + 1]
+        # Concatenate the bucket ranges without a Python loop
+        lengths = stops - starts
+        shift = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return shift + np.arange(lengths.sum())
+
+    def covered(self, queries, cell, radius):
+        """
+        Great-circle distance within which every training point of the queries
+        lies in rings 0..radius around `cell`: the margin to the searched
+        latitude band, and the distance to the nearest unsearched meridian,
+        asin(cos(lat) sin(dlon)), which shrinks towards the poles.
+        """
+        lat, lon = queries[:, 0], queries[:, 1]
+        reach = np.full(len(queries), np.inf)
+        # Beyond the end rows there are no points: they are clipped into them
+        if cell[0] - radius > 0:
+            reach = np.minimum(reach, lat - (self.lo[0] + (cell[0] - radius) * self.cell_size[0]))
+        if cell[0] + radius < self.n_cells - 1:
+            reach = np.minimum(reach, self.lo[0] + (cell[0] + radius + 1) * self.cell_size[0]
+                               - lat)
+        if 2 * radius + 1 < self.n_cells:
+            offset = (lon - self.lo[1]) % (2 * np.pi) - cell[1] * self.cell_size[1]
+            dlon = np.minimum(offset + radius * self.cell_size[1],
+                              (radius + 1) * self.cell_size[1] - offset)
+            meridian = np.arcsin(np.cos(lat) * np.sin(np.clip(dlon, 0, np.pi / 2)))
+            reach = np.minimum(reach, meridian)
+        return np.maximum(reach, 0).min()
+
+    def search_space(self, points):
+        """(lat, lon) radians as unit vectors, where the chord length orders distances"""
+        lat, lon = points[:, 0], points[:, 1]
+        return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon),
+                                np.sin(lat)])
+
+    def to_distance(self, squared):
+        """Great-circle distance of squared chord lengths"""
+        return 2 * np.arcsin(np.minimum(np.sqrt(np.maximum(squared, 0)) / 2, 1))
+
+    def nearest_in(self, queries, positions, best_sq, best_pos):
+        """
+        Merge candidate `positions` into the running (rows, k) top-k of `queries`.
+
+        Candidates are scored CANDIDATE_BLOCK_COLS at a time and each block is
+        folded into the top-k with argpartition, so memory does not grow with
+        the number of candidates.
+        """
+        k = best_sq.shape[1]
+        query_norms = np.einsum('ij,ij->i', queries, queries)[:, None]
+        for start in range(0, len(positions), CANDIDATE_BLOCK_COLS):
+            block = positions[start:start + CANDIDATE_BLOCK_COLS]
+            # |q - x|^2 = |q|^2 - 2 q.x + |x|^2 over the block
+            squared = (query_norms - 2 * queries @ self.search_points[block].T
+                       + self.search_norms[block])
+            merged_sq = np.hstack([best_sq, squared])
+            merged_pos = np.hstack([best_pos, np.broadcast_to(block, squared.shape)])
+            keep = np.argpartition(merged_sq, k - 1, axis=1)[:, :k]
+            best_sq = np.take_along_axis(merged_sq, keep, axis=1)
+            best_pos = np.take_along_axis(merged_pos, keep, axis=1)
+        return best_sq, best_pos
+
+    def kneighbors(self, features):
+        features = np.asarray(features, dtype=np.float64)
+        cells = self.cell_coords(features)
+        unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        query_order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[query_order], np.arange(len(unique_cells) + 1))
+
+        k = min(self.k, len(self.search_points))
+        distances = np.empty((len(features), k))
+        indices = np.empty((len(features), k), dtype=np.int64)
+        for u, cell in enumerate(unique_cells):
+            in_cell = query_order[bounds[u]:bounds[u + 1]]
+            for start in range(0, len(in_cell), QUERY_BLOCK_ROWS):
+                rows = in_cell[start:start + QUERY_BLOCK_ROWS]
+                queries = self.search_space(features[rows])
+                lat_lon = features[rows]
+                best_sq = np.full((len(rows), k), np.inf)
+                best_pos = np.zeros((len(rows), k), dtype=np.int64)
+
+                for radius in range(self.n_cells):
+                    best_sq, best_pos = self.nearest_in(queries, self.ring(cell, radius),
+                                                        best_sq, best_pos)
+                    if np.isfinite(best_sq).all() and (radius >= self.max_ring or self.to_distance(
+                            best_sq.max()) <= self.covered(lat_lon, cell, radius)):
+                        break
+
+                ranked = np.argsort(best_sq, axis=1)
+                distances[rows] = self.to_distance(np.take_along_axis(best_sq, ranked, axis=1))
+                indices[rows] = self.order[np.take_along_axis(best_pos, ranked, axis=1)]
+        return distances, indices
+
+    def predict(self, features):
+        return predict_neighbours(self, features)
+
+
+def knn_backend(model, kind='exact', **options):
+    """
+    Wrap a fitted KNeighborsRegressor in the `kind` backend.
+
+    Anything else (the fallback's None, a custom model) is returned unchanged,
+    so callers can wrap whatever load_model produced.
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown KNN backend {kind!r}, expected one of {BACKENDS}")
+    if kind == 'exact' or model is None:
+        return model
+    if not (hasattr(model, '_fit_X') and hasattr(model, '_y')):
+        print(f"KNN backend {kind!r} needs a fitted KNeighborsRegressor; using the model as is")
+        return model
+    if kind == 'balltree':
+        return BallTreeBackend(model, **options)
+    return GridBucketBackend(model, **options)
@@ -0,0 +1,231 @@
+"""
+Compiled AQI lookup rasters
+`python -m heatmap compile` evaluates the model once over a regular lat/lon
+lattice, optionally at several weather levels, with the per-run noise terms
+held at their expected values. The predictions are quantized to uint16 with a
+scale and offset and saved as one .npz file. An AQILookup answers point, batch
+and area queries from it by bilinear interpolation (linear across weather
+levels) with NumPy only; neither sklearn nor joblib is imported. A lookup
+records the sources it was compiled with and refuses runs with other sources.
+"""
+
+import json
+
+import numpy as np
+
+from heatmap.catalogue import source_key
+from heatmap.features import FEATURE_SCALES, NoiseStreams, iter_feature_tiles
+from heatmap.timings import count_cells, phase
+
+DEFAULT_LOOKUP_PATH = '.cache/aqi_lookup.npz'
+LOOKUP_VERSION = 2
+
+# Expected values of the population (exponential(0.2) * 10) and weather
+# (normal(0, 5)) noise terms of build_world_features
+EXPECTED_POPULATION = 0.2 * 10
+EXPECTED_WEATHER = 0.0
+
+
+def lattice_axes(resolution_deg):
+    """Latitude and longitude axes of a world lattice with the given spacing, poles and antimeridian included"""
+    n_lats = int(round(180 / resolution_deg)) + 1
+    n_lons = int(round(360 / resolution_deg)) + 1
+    return np.linspace(-90, 90, n_lats), np.linspace(-180, 180, n_lons)
+
+
+def quantize(values):
+    """uint16 codes plus the (scale, offset) that map them back to values"""
+    offset = float(values.min())
+    span = float(values.max()) - offset
+    scale = span / np.iinfo(np.uint16).max if span > 0 else 1.0
+    codes = np.rint((values - offset) / scale).astype(np.uint16)
+    return codes, scale, offset
+
+
+def evaluate_lattice(model, predict, lats, lons, cities, weather_levels=(EXPECTED_WEATHER,),
+                     chunk_rows=256, static=None):
+    """
+    Predict the lats x lons lattice once per weather level, as a float64 array.
+
+    `predict` is called like predict_world_aqi. Population noise is held at its
+    expectation, the weather column at each level and the prediction noise at
+    zero.
+    """
+    values = np.empty((len(weather_levels), len(lats), len(lons)))
+    for level, weather in enumerate(weather_levels):
+        tiles = iter_feature_tiles(lats, lons, cities, chunk_rows, NoiseStreams(0),
+                                   dtype=np.float64, static=static)
+        for row_start, row_stop, features in tiles:
+            features[:, 6] = EXPECTED_POPULATION / FEATURE_SCALES[6]
+            features[:, 7] = weather / FEATURE_SCALES[7]
+            lon_band, lat_band = np.broadcast_arrays(lons[None, :], lats[row_start:row_stop, None])
+            with phase('predict'):
+                count_cells(len(features))
+                predictions = predict(model, features, lat_band, lon_band,
+                                      noise=np.zeros(len(features)))
+            values[level, row_start:row_stop] = predictions.reshape(lat_band.shape)
+    return values
+
+
+def weather_order(weather_levels):
+    """Indices that sort the weather levels ascending; the levels must be distinct"""
+    weather_levels = np.asarray(weather_levels, dtype=np.float64)
+    if len(np.unique(weather_levels)) != len(weather_levels):
+        raise ValueError(f"Weather levels must be distinct, got {weather_levels.tolist()}")
+    return np.argsort(weather_levels)
+
+
+def compile_lookup(model, predict, lats, lons, cities, weather_levels=(EXPECTED_WEATHER,),
+                   chunk_rows=256, static=None):
+    """
+    Evaluate the lattice (see evaluate_lattice) and quantize it into an
+    AQILookup whose meta records the source_key of `cities`
+    """
+    weather_levels = np.asarray(weather_levels, dtype=np.float64)
+    weather_levels = weather_levels[weather_order(weather_levels)]
+    values = evaluate_lattice(model, predict, lats, lons, cities, weather_levels, chunk_rows,
+                              static)
+    codes, scale, offset = quantize(values)
+    return AQILookup(codes, scale, offset, lats, lons, weather_levels,
+                     meta={'sources': source_key(cities)})
+
+
+class AQILookup:
+    """
+    A quantized (weather level, lat, lon) AQI lattice with interpolated queries.
+
+    The weather levels are sorted ascending, with the planes of `codes` in the
+    same order; bilinear queries need at least two nodes along each axis.
+    """
+
+    def __init__(self, codes, scale, offset, lats, lons, weather_levels=(EXPECTED_WEATHER,),
+                 meta=None):
+        weather_levels = np.asarray(weather_levels, dtype=np.float64)
+        if codes.ndim != 3 or codes.shape[0] != len(weather_levels):
+            raise ValueError(f"Lookup codes have shape {codes.shape}, expected one "
+                             f"(lat, lon) plane per weather level ({len(weather_levels)})")
+        if len(lats) < 2 or len(lons) < 2:
+            raise ValueError(f"A lookup lattice needs at least two latitudes and two "
+                             f"longitudes, got {len(lats)}x{len(lons)}")
+        order = weather_order(weather_levels)
+        self.codes = codes if np.all(order == np.arange(len(order))) else codes[order]
+        self.scale = float(scale)
+        self.offset = float(offset)
+        self.lat0, self.lat_step = float(lats[0]), float(lats[1] - lats[0])
+        self.lon0, self.lon_step = float(lons[0]), float(lons[1] - lons[0])
+        self.weather_levels = weather_levels[order]
+        self.meta = dict(meta or {})
+        self.n_levels, self.n_lats, self.n_lons = self.codes.shape
+
+    @property
+    def lats(self):
+        return self.lat0 + self.lat_step * np.arange(self.n_lats)
+
+    @property
+    def lons(self):
+        return self.lon0 + self.lon_step * np.arange(self.n_lons)
+
+    def save(self, path):
+        meta = dict(self.meta, version=LOOKUP_VERSION)
+        with open(path, 'wb') as f:
+            np.savez(f, codes=self.codes, scale=self.scale, offset=self.offset,
+                     lats=self.lats, lons=self.lons, weather_levels=self.weather_levels,
+                     meta=json.dumps(meta))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != LOOKUP_VERSION:
+                raise ValueError(f"{path} is lookup version {meta.get('version')}, "
+                                 f"expected {LOOKUP_VERSION}")
+            return cls(data['codes'], data['scale'], data['offset'], data['lats'],
+                       data['lons'], data['weather_levels'], meta)
+
+    @property
+    def max_error(self):
+        """Largest quantization error of a lattice value"""
+        return self.scale / 2
+
+    def check_sources(self, sources):
+        """Raise ValueError unless `sources` are the ones the lookup was compiled with"""
+        if self.meta.get('sources') != json.loads(json.dumps(source_key(sources))):
+            raise ValueError("The lookup was compiled with different sources; recompile it "
+                             "with `python -m heatmap compile` and the same --sources")
+
+    def describe(self):
+        return (f"{self.n_lons}x{self.n_lats} lattice at {self.lat_step:g} deg, "
+                f"{self.n_levels} weather level(s), quantization step {self.scale:.4f} AQI")
+
+    def _weather_position(self, weather):
+        if weather is None or self.n_levels == 1:
+            return 0, 0.0
+        position = float(np.interp(weather, self.weather_levels, np.arange(self.n_levels)))
+        level = min(int(position), self.n_levels - 2)
+        return level, position - level
+
+    def point(self, lat, lon, weather=None):
+        """AQI at one (lat, lon), bilinear between the four surrounding lattice nodes"""
+        if not self.lon0 <= lon <= self.lon0 + 360:
+            lon = (lon - self.lon0) % 360 + self.lon0
+        fi = min(max((lat - self.lat0) / self.lat_step, 0.0), self.n_lats - 1.0)
+        fj = min(max((lon - self.lon0) / self.lon_step, 0.0), self.n_lons - 1.0)
+        i, j = min(int(fi), self.n_lats - 2), min(int(fj), self.n_lons - 2)
+        u, v = fi - i, fj - j
+
+        level, w = self._weather_position(weather)
+        # Scalar .item() reads keep this path free of array temporaries
+        item = self.codes.item
+        code = 0.0
+        for k, level_weight in ((level, 1 - w), (level + 1, w)):
+            if level_weight == 0:
+                continue
+            code += level_weight * ((1 - u) * ((1 - v) * item(k, i, j) + v * item(k, i, j + 1)) +
+                                    u * ((1 - v) * item(k, i + 1, j) + v * item(k, i + 1, j + 1)))
+        return self.offset + self.scale * code
+
+    def query(self, lats, lons, weather=None):
+        """Vectorized point() over broadcastable lat and lon arrays"""
+        lats, lons = np.broadcast_arrays(np.asarray(lats, dtype=np.float64),
+                                         np.asarray(lons, dtype=np.float64))
+        lons = np.where((lons < self.lon0) | (lons > self.lon0 + 360),
+                        (lons - self.lon0) % 360 + self.lon0, lons)
+        fi = np.clip((lats - self.lat0) / self.lat_step, 0, self.n_lats - 1)
+        fj = np.clip((lons - self.lon0) / self.lon_step, 0, self.n_lons - 1)
+        i = np.minimum(fi.astype(np.int64), self.n_lats - 2)
+        j = np.minimum(fj.astype(np.int64), self.n_lons - 2)
+        u, v = fi - i, fj - j
+
+        level, w = self._weather_position(weather)
+        code = np.zeros(lats.shape)
+        for k, level_weight in ((level, 1 - w), (level + 1, w)):
+            if level_weight == 0:
+                continue
+            grid = self.codes[k]
+            code += level_weight * ((1 - u) * ((1 - v) * grid[i, j] + v * grid[i, j + 1]) +
+                                    u * ((1 - v) * grid[i + 1, j] + v * grid[i + 1, j + 1]))
+        return self.offset + self.scale * code
+
+    def grid(self, lats, lons, weather=None):
+        """(len(lats), len(lons)) AQI grid on the given axes"""
+        return self.query(np.asarray(lats)[:, None], np.asarray(lons)[None, :], weather)
+
+    def area(self, bbox, weather=None):
+        """Min, area-weighted mean and max AQI of the lattice nodes inside a (lat_min, lat_max, lon_min, lon_max) bbox"""
+        lat_min, lat_max, lon_min, lon_max = bbox
+        lats, lons = self.lats, self.lons
+        rows = slice(np.searchsorted(lats, lat_min, side='left'),
+                     np.searchsorted(lats, lat_max, side='right'))
+        cols = slice(np.searchsorted(lons, lon_min, side='left'),
+                     np.searchsorted(lons, lon_max, side='right'))
+        if rows.start >= rows.stop or cols.start >= cols.stop:
+            # Smaller than a lattice cell: answer from its centre
+            value = self.point((lat_min + lat_max) / 2, (lon_min + lon_max) / 2, weather)
+            return {'min': value, 'mean': value, 'max': value, 'cells': 0}
+        values = self.grid(lats[rows], lons[cols], weather)
+        weights = np.broadcast_to(np.cos(np.radians(lats[rows]))[:, None], values.shape)
+        mean = (float(np.average(values, weights=weights)) if weights.sum() > 0
+                else float(values.mean()))
+        return {'min': float(values.min()), 'mean': mean, 'max': float(values.max()),
+                'cells': int(values.size)}
@@ -0,0 +1,96 @@
+"""
+Process-pool KNN inference over grid tiles
+Workers load the joblib model once in their initializer and attach to shared
+memory blocks holding the feature matrix and the output predictions, so a task
+is just a (start, stop) row range
+"""
+
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Per-worker state set up by _init_worker
+_worker = {}
+
+
+def _attach(name, shape, dtype):
+    """Attach to an existing shared memory block as an ndarray"""
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _init_worker(model_path, features_spec, output_spec, backend='exact'):
+    """Load the model and attach the shared buffers once per worker process"""
+    import joblib
+
+    from heatmap.knn import knn_backend
+
+    _worker['model'] = knn_backend(joblib.load(model_path), backend)
+    _worker['features_shm'], _worker['features'] = _attach(*features_spec)
+    _worker['output_shm'], _worker['output'] = _attach(*output_spec)
+
+
+def _predict_rows(start, stop):
+    """Predict one tile of rows in place in the shared output"""
+    _worker['output'][start:stop] = _worker['model'].predict(_worker['features'][start:stop])
+    return stop - start
+
+
+class ParallelPredictor:
+    """
+    Shard prediction over a pool of worker processes.
+
+    Buffers are sized for `max_rows` feature rows, so one predictor can serve
+    every band of a streamed grid without restarting the pool. Workers serve
+    the model through the heatmap.knn `backend`.
+    """
+
+    def __init__(self, model_path, workers, max_rows, n_features, tile_rows=4096,
+                 dtype=np.float32, backend='exact'):
+        self.workers = workers
+        self.tile_rows = tile_rows
+        self._features_shm = shared_memory.SharedMemory(
+            create=True, size=max(1, max_rows * n_features * np.dtype(dtype).itemsize))
+        self._output_shm = shared_memory.SharedMemory(
+            create=True, size=max(1, max_rows * np.dtype(np.float64).itemsize))
+        self._features = np.ndarray((max_rows, n_features), dtype=dtype,
+                                    buffer=self._features_shm.buf)
+        self._output = np.ndarray((max_rows,), dtype=np.float64, buffer=self._output_shm.buf)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(model_path,
+                      (self._features_shm.name, self._features.shape, self._features.dtype),
+                      (self._output_shm.name, self._output.shape, self._output.dtype),
+                      backend))
+
+    def predict(self, features):
+        """Predict every row of features, returning a new float64 array"""
+        n_rows = len(features)
+        if n_rows > len(self._features):
+            raise ValueError(f"{n_rows} rows exceed the predictor capacity of {len(self._features)}")
+
+        self._features[:n_rows] = features
+        # Keep every worker busy even when the batch is smaller than workers * tile_rows
+        tile_rows = max(1, min(self.tile_rows, -(-n_rows // self.workers)))
+        futures = [self._pool.submit(_predict_rows, start, min(start + tile_rows, n_rows))
+                   for start in range(0, n_rows, tile_rows)]
+        done, _ = wait(futures)
+        for future in done:
+            future.result()
+        return self._output[:n_rows].copy()
+
+    def close(self):
+        """Shut the pool down and release the shared memory"""
+        self._pool.shutdown()
+        # Drop our views before closing the blocks they point into
+        self._features = self._output = None
+        for shm in (self._features_shm, self._output_shm):
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,79 @@
+"""
+Streaming world-grid prediction
+Features are produced one latitude band at a time and each band's predictions are
+written straight into a preallocated (or memory-mapped) AQI grid, so peak memory
+is set by the band height rather than by the grid size
+"""
+
+import numpy as np
+
+from heatmap.features import NoiseStreams, iter_feature_tiles
+from heatmap.timings import count_cells, phase
+
+# --dtype modes as (feature dtype, stored AQI grid dtype). The compact mode builds
+# float32 features and stores whole AQI values as uint16.
+DTYPES = {
+    'float64': (np.float64, np.float64),
+    'float32': (np.float32, np.uint16),
+}
+
+
+def store_aqi(predictions, out):
+    """Write predictions into out, rounding and clipping them when out is an integer grid"""
+    if np.issubdtype(out.dtype, np.integer):
+        info = np.iinfo(out.dtype)
+        out[...] = np.clip(np.rint(predictions), info.min, info.max)
+    else:
+        out[...] = predictions
+    return out
+
+
+def allocate_grid(shape, out_path=None, dtype=np.float64):
+    """Allocate the output AQI grid in memory, or as a .npy memmap when out_path is given"""
+    if out_path:
+        return np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=shape)
+    return np.empty(shape, dtype=dtype)
+
+
+def predict_grid_streaming(model, predict, lats, lons, cities, chunk_rows,
+                           seed=None, out=None, static=None, dtype='float64',
+                           dispersion=None, window=None):
+    """
+    Predict AQI over the lats x lons grid band by band.
+
+    `predict` is called as predict(model, features, lat_band, lon_band, noise=...)
+    for each band, with the band's rows of the per-row noise streams, so for a
+    fixed seed the result is bit-identical to building and predicting the whole
+    grid at once. `static` is an optional precomputed static-feature raster window.
+    `dtype` is a DTYPES mode selecting the feature and output grid dtypes. A
+    PlumeDispersion is convolved band by band, matching the whole grid to round-off.
+    `window` places the grid in a larger one for the noise (see NoiseStreams).
+    """
+    feature_dtype, grid_dtype = DTYPES[dtype]
+    shape = (len(lats), len(lons))
+    if out is None:
+        out = allocate_grid(shape, dtype=grid_dtype)
+    elif out.shape != shape:
+        raise ValueError(f"Output grid has shape {out.shape}, expected {shape}")
+
+    noise = NoiseStreams(seed, window=window)
+    tiles = iter_feature_tiles(lats, lons, cities, chunk_rows, noise, dtype=feature_dtype,
+                               static=static, dispersion=dispersion)
+    while True:
+        with phase('features'):
+            tile = next(tiles, None)
+            if tile is not None:
+                count_cells(len(tile[2]))
+        if tile is None:
+            break
+        row_start, row_stop, features = tile
+        with phase('predict'):
+            count_cells(len(features))
+            lon_band, lat_band = np.broadcast_arrays(lons[None, :], lats[row_start:row_stop, None])
+            predictions = predict(model, features, lat_band, lon_band,
+                                  noise=noise.predict_noise(row_start, row_stop, len(lons)))
+            store_aqi(predictions.reshape(lat_band.shape), out[row_start:row_stop])
+
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
@@ -0,0 +1,105 @@
+"""
+Precomputed static-feature rasters
+The city influence and the industrial, desert, ocean, polar and forest layers do
+not change between runs, so `python -m heatmap rasters` bakes them once per
+resolution and feature dtype into an (n_lats, n_lons, 6) .npy file of already
+scaled feature columns. Later runs memory-map the file and copy the window they need;
+only the per-run population and weather noise is generated.
+
+Files are named by a hash of the raster version, the grid axes, the dtype, the
+source table and the region tables, so any change to those simply misses and the
+layers are computed as before.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from heatmap.catalogue import source_key
+from heatmap.features import (DESERT_REGIONS, FEATURE_SCALES, FOREST_REGIONS,
+                              INDUSTRIAL_REGIONS, N_STATIC_FEATURES, OCEAN_REGIONS,
+                              POLAR_LATITUDE, POLAR_VALUE, fill_static_features)
+from heatmap.sources import DEFAULT_RADIUS_KM, DEFAULT_SCALE_KM, as_source_index
+
+DEFAULT_RASTER_DIR = os.path.join('.cache', 'static_rasters')
+
+# Bumped whenever the meaning or layout of the baked columns changes
+RASTER_VERSION = 1
+
+
+def raster_key(lats, lons, cities, radius_km=DEFAULT_RADIUS_KM, dtype=np.float32):
+    """Hash everything that determines the static feature raster of a grid"""
+    spec = {
+        'version': RASTER_VERSION,
+        'lats': [float(lats[0]), float(lats[-1]), len(lats)],
+        'lons': [float(lons[0]), float(lons[-1]), len(lons)],
+        'cities': source_key(cities),
+        'radius_km': float(radius_km),
+        'scale_km': float(DEFAULT_SCALE_KM),
+        'regions': [INDUSTRIAL_REGIONS, DESERT_REGIONS, OCEAN_REGIONS, FOREST_REGIONS,
+                    POLAR_LATITUDE, POLAR_VALUE],
+        'scales': FEATURE_SCALES[:N_STATIC_FEATURES],
+        'dtype': np.dtype(dtype).name,
+    }
+    encoded = json.dumps(spec, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def bbox_window(lats, lons, bbox):
+    """(rows, cols) slices of ascending lats/lons axes inside a (lat_min, lat_max, lon_min, lon_max) bbox"""
+    lat_min, lat_max, lon_min, lon_max = bbox
+    rows = slice(np.searchsorted(lats, lat_min, side='left'),
+                 np.searchsorted(lats, lat_max, side='right'))
+    cols = slice(np.searchsorted(lons, lon_min, side='left'),
+                 np.searchsorted(lons, lon_max, side='right'))
+    if rows.start >= rows.stop or cols.start >= cols.stop:
+        raise ValueError(f"Bounding box {bbox} contains no grid cells")
+    return rows, cols
+
+
+class StaticRasterStore:
+    """Directory of baked static-feature rasters, one .npy per grid and source table"""
+
+    def __init__(self, raster_dir=DEFAULT_RASTER_DIR):
+        self.raster_dir = raster_dir
+
+    def path(self, key):
+        return os.path.join(self.raster_dir, f"v{RASTER_VERSION}", f"{key}.npy")
+
+    def load(self, lats, lons, cities, radius_km=DEFAULT_RADIUS_KM, dtype=np.float32):
+        """Memory-map the raster for this grid read-only, or return None if none is baked"""
+        path = self.path(raster_key(lats, lons, cities, radius_km, dtype))
+        try:
+            raster = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if raster.shape != (len(lats), len(lons), N_STATIC_FEATURES):
+            return None
+        return raster
+
+    def bake(self, lats, lons, cities, radius_km=DEFAULT_RADIUS_KM, dtype=np.float32,
+             chunk_rows=256):
+        """Compute and atomically write the raster for this grid, band by band; returns its path"""
+        path = self.path(raster_key(lats, lons, cities, radius_km, dtype))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sources = as_source_index(cities)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            raster = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=dtype,
+                shape=(len(lats), len(lons), N_STATIC_FEATURES))
+            for row_start in range(0, len(lats), chunk_rows):
+                rows = slice(row_start, min(row_start + chunk_rows, len(lats)))
+                fill_static_features(lats[rows], lons, sources, raster[rows], radius_km)
+            raster.flush()
+            del raster
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return path
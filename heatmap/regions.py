@@ -0,0 +1,142 @@
+"""
+Region manifests and vectorized regional features for batch runs
+A manifest lists the metro areas to map, one region per entry, as JSON
+
+    [{"label": "Dallas-Fort Worth", "bbox": [32.5, 33.0, -97.2, -96.5],
+      "resolution": 50, "center": [32.7767, -96.7970]}, ...]
+
+or as CSV with label,lat_min,lat_max,lon_min,lon_max[,resolution,center_lat,center_lon]
+columns. The centre defaults to the middle of the bounding box and the
+resolution to 50 cells per side.
+"""
+
+import csv
+import json
+import re
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from heatmap.features import NoiseStreams
+
+DEFAULT_RESOLUTION = 50
+N_REGIONAL_FEATURES = 5
+
+# Noise terms of a region's per-row streams, and the standard deviation of the
+# noise predict_aqi_with_fallback adds per cell
+REGIONAL_TERMS = ('industrial', 'traffic', 'weather', 'predict')
+FALLBACK_NOISE_STD = 10
+
+Region = namedtuple('Region', ['label', 'bbox', 'resolution', 'center'])
+
+
+def make_region(label, bbox, resolution=DEFAULT_RESOLUTION, center=None):
+    """Validate one manifest entry"""
+    lat_min, lat_max, lon_min, lon_max = map(float, bbox)
+    if not (lat_min < lat_max and lon_min < lon_max):
+        raise ValueError(f"Region {label!r} has an empty bounding box {bbox}")
+    resolution = int(resolution)
+    if resolution < 2:
+        raise ValueError(f"Region {label!r} needs a resolution of at least 2, got {resolution}")
+    if center is None:
+        center = ((lat_min + lat_max) / 2, (lon_min + lon_max) / 2)
+    return Region(str(label), (lat_min, lat_max, lon_min, lon_max), resolution,
+                  tuple(map(float, center)))
+
+
+def load_region_manifest(path):
+    """Read a JSON or CSV region manifest into a list of Regions"""
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        entries = []
+        for row in rows:
+            center = None
+            if row.get('center_lat') and row.get('center_lon'):
+                center = (row['center_lat'], row['center_lon'])
+            entries.append(dict(
+                label=row['label'],
+                bbox=(row['lat_min'], row['lat_max'], row['lon_min'], row['lon_max']),
+                resolution=row.get('resolution') or DEFAULT_RESOLUTION, center=center))
+    else:
+        with open(path) as f:
+            entries = json.load(f)
+        if isinstance(entries, dict):
+            entries = entries['regions']
+
+    regions = [make_region(**entry) for entry in entries]
+    labels = [region.label for region in regions]
+    if len(set(labels)) != len(labels):
+        raise ValueError(f"Duplicate region labels in {path}")
+    return regions
+
+
+def region_slug(label):
+    """File-name-safe version of a region label"""
+    return re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_').lower() or 'region'
+
+
+def region_axes(region):
+    """Latitude and longitude axes of a region's grid"""
+    lat_min, lat_max, lon_min, lon_max = region.bbox
+    return (np.linspace(lat_min, lat_max, region.resolution),
+            np.linspace(lon_min, lon_max, region.resolution))
+
+
+def region_noise(region, seed=None):
+    """
+    Per-row noise streams of a region, keyed by its label.
+
+    A region's features for a given seed therefore do not depend on the rest
+    of a manifest, and any band of its rows can be regenerated alone.
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    stream = np.random.SeedSequence(entropy, spawn_key=(zlib.crc32(region.label.encode()),))
+    return NoiseStreams(stream, REGIONAL_TERMS)
+
+
+def regional_features(region, noise, out=None, dtype=np.float64):
+    """
+    Feature matrix of generate_sample_data for one region, built with array operations.
+
+    Columns are urban, industrial, traffic, weather and topography factors; the
+    random columns are drawn row by row from the `noise` streams (see region_noise).
+    """
+    lats, lons = region_axes(region)
+    lon_grid, lat_grid = np.broadcast_arrays(lons[None, :], lats[:, None])
+    n_rows, n_cols = lat_grid.shape
+    if out is None:
+        out = np.empty((n_rows * n_cols, N_REGIONAL_FEATURES), dtype=dtype)
+
+    center_lat, center_lon = region.center
+    dist_from_center = np.sqrt((lat_grid - center_lat)**2 + (lon_grid - center_lon)**2)
+    out[:, 0] = (1 / (1 + dist_from_center * 100)).ravel()
+    out[:, 1] = noise.draw('industrial', 0, n_rows, n_cols, 'exponential', 0.3).ravel()
+    out[:, 2] = noise.draw('traffic', 0, n_rows, n_cols, 'gamma', 2, 0.5).ravel()
+    out[:, 3] = noise.draw('weather', 0, n_rows, n_cols, 'normal', 0.5, 0.2).ravel()
+    out[:, 4] = (np.sin(lat_grid * 10) * np.cos(lon_grid * 10) * 0.1 + 0.5).ravel()
+    return out
+
+
+def regional_predict_noise(region, noise):
+    """Flattened per-cell noise of predict_aqi_with_fallback for a region"""
+    return noise.draw('predict', 0, region.resolution, region.resolution, 'normal',
+                      0, FALLBACK_NOISE_STD).ravel()
+
+
+def batch_features(regions, seed=None, dtype=np.float64):
+    """
+    Features of every region stacked into one matrix, plus row offsets per region
+    and the fallback's prediction noise for the same rows.
+
+    Each region draws from streams keyed by its label (see region_noise).
+    """
+    offsets = np.cumsum([0] + [region.resolution**2 for region in regions])
+    features = np.empty((offsets[-1], N_REGIONAL_FEATURES), dtype=dtype)
+    predict_noise = np.empty(offsets[-1])
+    for region, start, stop in zip(regions, offsets[:-1], offsets[1:]):
+        noise = region_noise(region, seed)
+        regional_features(region, noise, out=features[start:stop])
+        predict_noise[start:stop] = regional_predict_noise(region, noise)
+    return features, offsets, predict_noise
@@ -0,0 +1,219 @@
+"""
+Headless figure rendering for batches of regional maps
+Figures are built on the Agg canvas without pyplot, so nothing is registered in
+pyplot's global figure list and memory stays flat however many maps are drawn.
+A figure template creates its axes, colorbar and legend once; each region only
+swaps in new image data, extent and text before saving. Independent outputs are
+spread over worker processes that each hold their own templates.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from heatmap.stats import AQI_BOUNDS
+from heatmap.timings import phase
+
+# Per-worker templates set up by _init_worker, keyed by figure kind
+_worker = {}
+
+
+def use_agg():
+    """Force the non-interactive Agg backend before pyplot is imported"""
+    import matplotlib
+
+    matplotlib.use('Agg', force=True)
+
+
+def close_figure(fig):
+    """Close a pyplot figure so it is released from pyplot's figure registry"""
+    import matplotlib.pyplot as plt
+
+    plt.close(fig)
+
+
+def summary_text(aqi_grid, area):
+    """Statistics block shown beside the regional heatmap"""
+    return f"""Statistics:
+Min AQI: {aqi_grid.min():.1f}
+Max AQI: {aqi_grid.max():.1f}
+Mean AQI: {aqi_grid.mean():.1f}
+Std Dev: {aqi_grid.std():.1f}
+
+Grid Size: {aqi_grid.shape[0]}×{aqi_grid.shape[1]}
+Total Points: {aqi_grid.size}
+
+Model: KNN Geographic Air Quality
+Area: {area}"""
+
+
+def _agg_figure(figsize):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+class HeatmapTemplate:
+    """Heatmap with colorbar next to the AQI category legend and a statistics box"""
+
+    def __init__(self, cmap, norm, aqi_ranges, dpi=300):
+        from matplotlib.patches import Rectangle
+
+        self.dpi = dpi
+        self.figure = _agg_figure((16, 8))
+        self.axes, legend_ax = self.figure.subplots(1, 2)
+
+        self.image = self.axes.imshow(np.zeros((2, 2)), extent=(0, 1, 0, 1), cmap=cmap,
+                                      norm=norm, origin='lower', aspect='auto')
+        self.title = self.axes.set_title('Air Quality Index (AQI) Heatmap\n', fontsize=14,
+                                          fontweight='bold')
+        self.axes.set_xlabel('Longitude', fontsize=12)
+        self.axes.set_ylabel('Latitude', fontsize=12)
+
+        cbar = self.figure.colorbar(self.image, ax=self.axes, shrink=0.8)
+        cbar.set_label('AQI Value', fontsize=12)
+        cbar.set_ticks([25, 75, 125, 175, 250, 400])
+        cbar.set_ticklabels(['25', '75', '125', '175', '250', '400'])
+
+        legend_ax.axis('off')
+        legend_ax.set_title('AQI Categories', fontsize=14, fontweight='bold')
+        y_pos = 0.9
+        for start, end, color, label in aqi_ranges:
+            legend_ax.add_patch(Rectangle((0.1, y_pos - 0.05), 0.1, 0.08,
+                                          facecolor=color, edgecolor='black', linewidth=1))
+            legend_ax.text(0.25, y_pos, f"{label}", fontsize=11, va='center')
+            legend_ax.text(0.25, y_pos - 0.03, f"AQI: {start}-{end}", fontsize=9, va='center',
+                           style='italic', color='gray')
+            y_pos -= 0.15
+        legend_ax.set_xlim(0, 1)
+        legend_ax.set_ylim(0, 1)
+        self.stats = legend_ax.text(0.1, 0.35, summary_text(np.zeros((2, 2)), ''), fontsize=10,
+                                    va='top', bbox=dict(boxstyle="round,pad=0.3",
+                                                        facecolor="lightgray", alpha=0.7))
+        self.figure.tight_layout()
+
+    def render(self, aqi_grid, bbox, area, out_path):
+        lat_min, lat_max, lon_min, lon_max = bbox
+        self.image.set_data(aqi_grid)
+        self.image.set_extent((lon_min, lon_max, lat_min, lat_max))
+        self.axes.set_xlim(lon_min, lon_max)
+        self.axes.set_ylim(lat_min, lat_max)
+        self.title.set_text(f"Air Quality Index (AQI) Heatmap\n{area}")
+        self.stats.set_text(summary_text(aqi_grid, area))
+        with phase('render-savefig'):
+            self.figure.savefig(out_path, dpi=self.dpi)
+        return out_path
+
+
+class ContourTemplate:
+    """Filled contour map with contour lines; only the contour sets are redrawn"""
+
+    def __init__(self, cmap, norm, aqi_ranges=None, dpi=300):
+        from matplotlib.cm import ScalarMappable
+
+        self.dpi = dpi
+        self.cmap, self.norm = cmap, norm
+        self.figure = _agg_figure((12, 8))
+        self.axes = self.figure.subplots(1, 1)
+        self.title = self.axes.set_title('Air Quality Index (AQI) Contour Map\n', fontsize=14,
+                                          fontweight='bold')
+        self.axes.set_xlabel('Longitude', fontsize=12)
+        self.axes.set_ylabel('Latitude', fontsize=12)
+        cbar = self.figure.colorbar(ScalarMappable(norm=norm, cmap=cmap), ax=self.axes,
+                                    shrink=0.8)
+        cbar.set_label('AQI Value', fontsize=12)
+        # Label the AQI bounds, not the norm's nudged boundaries
+        cbar.set_ticks(AQI_BOUNDS)
+        cbar.set_ticklabels([str(bound) for bound in AQI_BOUNDS])
+        self.contours = []
+        self.figure.tight_layout()
+
+    def render(self, aqi_grid, bbox, area, out_path):
+        lat_min, lat_max, lon_min, lon_max = bbox
+        for contour_set in self.contours:
+            contour_set.remove()
+
+        lons = np.linspace(lon_min, lon_max, aqi_grid.shape[1])
+        lats = np.linspace(lat_min, lat_max, aqi_grid.shape[0])
+        levels = np.linspace(aqi_grid.min(), aqi_grid.max(), 20)
+        if levels[0] == levels[-1]:
+            levels = levels[0] + np.arange(2)
+        filled = self.axes.contourf(lons, lats, aqi_grid, levels=levels, cmap=self.cmap,
+                                    norm=self.norm, alpha=0.8)
+        lines = self.axes.contour(lons, lats, aqi_grid, levels=8, colors='black', alpha=0.4,
+                                  linewidths=0.5)
+        self.axes.clabel(lines, inline=True, fontsize=8, fmt='%1.0f')
+        self.contours = [filled, lines]
+
+        self.axes.set_xlim(lon_min, lon_max)
+        self.axes.set_ylim(lat_min, lat_max)
+        self.title.set_text(f"Air Quality Index (AQI) Contour Map\n{area}")
+        with phase('render-savefig'):
+            self.figure.savefig(out_path, dpi=self.dpi)
+        return out_path
+
+
+TEMPLATES = {'heatmap': HeatmapTemplate, 'contour': ContourTemplate}
+
+
+def _init_worker(cmap, norm, aqi_ranges, dpi):
+    use_agg()
+    _worker.clear()
+    _worker['args'] = (cmap, norm, aqi_ranges, dpi)
+
+
+def _render_job(job):
+    """Render one (kind, aqi_grid, bbox, area, out_path) job with this process's template"""
+    kind, aqi_grid, bbox, area, out_path = job
+    start = time.perf_counter()
+    if kind not in _worker:
+        cmap, norm, aqi_ranges, dpi = _worker['args']
+        _worker[kind] = TEMPLATES[kind](cmap, norm, aqi_ranges, dpi=dpi)
+    _worker[kind].render(np.asarray(aqi_grid), bbox, area, out_path)
+    return out_path, time.perf_counter() - start
+
+
+def render_regions(jobs, cmap, norm, aqi_ranges, dpi=300, workers=1):
+    """
+    Render (kind, aqi_grid, bbox, area, out_path) jobs, kind being 'heatmap' or 'contour'.
+
+    Each process builds one template per kind and reuses it for every job it is
+    given. Returns (out_path, seconds) for each job, in job order.
+    """
+    jobs = list(jobs)
+    for _, _, _, _, out_path in jobs:
+        os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+
+    initargs = (cmap, norm, aqi_ranges, dpi)
+    if workers > 1 and len(jobs) > 1:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker,
+                                 initargs=initargs) as pool:
+            return list(pool.map(_render_job, jobs, chunksize=chunksize))
+
+    _init_worker(*initargs)
+    try:
+        return [_render_job(job) for job in jobs]
+    finally:
+        _worker.clear()
+
+
+def _run_task(task):
+    function, args = task
+    return function(*args)
+
+
+def render_concurrently(tasks, workers=1):
+    """Run independent (function, args) figure tasks, on worker processes when workers > 1"""
+    tasks = list(tasks)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                 initializer=use_agg) as pool:
+            return list(pool.map(_run_task, tasks))
+    use_agg()
+    return [_run_task(task) for task in tasks]
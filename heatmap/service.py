@@ -0,0 +1,336 @@
+"""
+Local HTTP service for point and area AQI queries
+`python -m heatmap serve` loads the model (or a compiled lookup) once and
+answers from memory:
+
+    GET  /aqi?lat=32.78&lon=-96.80
+    GET  /aqi/bbox?lat_min=32.5&lat_max=33&lon_min=-97.2&lon_max=-96.5
+    POST /aqi/batch   {"points": [[lat, lon], ...]}
+    GET  /health
+
+The world is split into fixed tiles of tile_cells x tile_cells grid cells.
+Tiles are predicted on demand and kept in an LRU; with a GridCache they also
+persist across restarts. Concurrent requests for a tile that is being computed
+wait for that one computation instead of starting their own.
+"""
+
+import functools
+import json
+import math
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from heatmap.pipeline import predict_grid_streaming
+from heatmap.stats import AQI_CATEGORIES, category_counts, category_index
+
+DEFAULT_PORT = 8765
+DEFAULT_CELL_DEG = 0.1
+DEFAULT_TILE_CELLS = 64
+DEFAULT_MAX_TILES = 512
+
+# Largest /aqi/bbox area and /aqi/batch size served, to bound request cost
+MAX_BBOX_CELLS = 4_000_000
+MAX_BATCH_POINTS = 100_000
+
+
+class TileLRU:
+    """
+    Least recently used tiles with request coalescing.
+
+    get() returns a cached tile, waits for a computation of the same key that
+    is already in flight, or computes the tile itself. Computations run one at
+    a time, which also keeps the shared phase timer consistent.
+    """
+
+    def __init__(self, compute, max_tiles=DEFAULT_MAX_TILES):
+        self.compute = compute
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.compute_lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.tiles:
+                self.tiles.move_to_end(key)
+                self.hits += 1
+                return self.tiles[key]
+            pending = self.in_flight.get(key)
+            if pending is None:
+                pending = self.in_flight[key] = {'done': threading.Event()}
+                owner = True
+                self.misses += 1
+            else:
+                owner = False
+                self.coalesced += 1
+
+        if not owner:
+            pending['done'].wait()
+            if 'error' in pending:
+                raise pending['error']
+            return pending['tile']
+
+        try:
+            with self.compute_lock:
+                tile = self.compute(key)
+        except Exception as e:
+            pending['error'] = e
+            raise
+        else:
+            pending['tile'] = tile
+            with self.lock:
+                self.tiles[key] = tile
+                while len(self.tiles) > self.max_tiles:
+                    self.tiles.popitem(last=False)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            pending['done'].set()
+        return tile
+
+    def stats(self):
+        with self.lock:
+            return {'tiles': len(self.tiles), 'max_tiles': self.max_tiles, 'hits': self.hits,
+                    'misses': self.misses, 'coalesced': self.coalesced}
+
+
+class AQIService:
+    """
+    AQI at arbitrary points and boxes from tiles of a global cell grid.
+
+    Cell (r, c) covers latitudes -90 + r * cell_deg upward and longitudes
+    -180 + c * cell_deg eastward and is predicted at its centre. Tiles come from
+    a compiled AQILookup when one is given, otherwise from `model` through
+    `predict` (predict_world_aqi) with the features of heatmap.features.
+    """
+
+    def __init__(self, model=None, predict=None, cities=None, lookup=None, seed=0,
+                 cell_deg=DEFAULT_CELL_DEG, tile_cells=DEFAULT_TILE_CELLS,
+                 max_tiles=DEFAULT_MAX_TILES, cache=None, model_path=None):
+        self.model = model
+        self.predict = predict
+        self.cities = cities or {}
+        self.lookup = lookup
+        self.seed = seed
+        self.cell_deg = cell_deg
+        self.tile_cells = tile_cells
+        self.n_rows = int(round(180 / cell_deg))
+        self.n_cols = int(round(360 / cell_deg))
+        self.cache = cache
+        self.model_path = model_path
+        self.tiles = TileLRU(self.compute_tile, max_tiles)
+
+    def tile_axes(self, key):
+        """Cell-centre latitude and longitude axes of tile (tile_row, tile_col)"""
+        tile_row, tile_col = key
+        rows = np.arange(tile_row * self.tile_cells,
+                         min((tile_row + 1) * self.tile_cells, self.n_rows))
+        cols = np.arange(tile_col * self.tile_cells,
+                         min((tile_col + 1) * self.tile_cells, self.n_cols))
+        return -90 + (rows + 0.5) * self.cell_deg, -180 + (cols + 0.5) * self.cell_deg
+
+    def compute_tile(self, key):
+        lats, lons = self.tile_axes(key)
+        if self.lookup is not None:
+            return self.lookup.grid(lats, lons)
+
+        cache_key = None
+        if self.cache is not None:
+            from heatmap.cache import grid_cache_key, predictor_name
+
+            bbox = (float(lats[0]), float(lats[-1]), float(lons[0]), float(lons[-1]))
+            cache_key = grid_cache_key('service-tile', self.model_path, bbox,
+                                       (len(lats), len(lons)), self.seed, self.cities,
+                                       predictor=predictor_name(self.model))
+            tile = self.cache.load(cache_key)
+            if tile is not None:
+                return np.asarray(tile)
+
+        # Noise is keyed by the tile's place in the service grid, so a cell's value
+        # does not depend on request order or on which tile holds it
+        tile_row, tile_col = key
+        window = (tile_row * self.tile_cells, tile_col * self.tile_cells, self.n_cols)
+        tile = predict_grid_streaming(self.model, self.predict, lats, lons, self.cities,
+                                      len(lats), seed=self.seed, window=window)
+        if cache_key is not None:
+            self.cache.store(cache_key, tile)
+        return tile
+
+    def cell_index(self, lats, lons):
+        """(row, col) grid cells containing the points; longitudes wrap"""
+        rows = np.floor((np.asarray(lats, dtype=np.float64) + 90) / self.cell_deg)
+        cols = np.floor(((np.asarray(lons, dtype=np.float64) + 180) % 360) / self.cell_deg)
+        return (np.clip(rows, 0, self.n_rows - 1).astype(np.int64),
+                np.clip(cols, 0, self.n_cols - 1).astype(np.int64))
+
+    def points(self, lats, lons):
+        """AQI at each point, fetching every tile touched once"""
+        rows, cols = (index.ravel() for index in self.cell_index(lats, lons))
+        values = np.empty(rows.shape)
+        if rows.size == 0:
+            return values
+        # Group the points by tile so each tile is looked up once
+        tile_ids = (rows // self.tile_cells) * self.n_cols + cols // self.tile_cells
+        order = np.argsort(tile_ids, kind='stable')
+        starts = np.flatnonzero(np.diff(tile_ids[order], prepend=-1))
+        for members in np.split(order, starts[1:]):
+            tile_row = int(rows[members[0]]) // self.tile_cells
+            tile_col = int(cols[members[0]]) // self.tile_cells
+            tile = self.tiles.get((tile_row, tile_col))
+            values[members] = tile[rows[members] - tile_row * self.tile_cells,
+                                   cols[members] - tile_col * self.tile_cells]
+        return values.reshape(np.shape(lats))
+
+    def point(self, lat, lon):
+        return float(self.points([lat], [lon])[0])
+
+    def bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """Summary of the grid cells the box overlaps"""
+        if not (lat_min <= lat_max and lon_min <= lon_max):
+            raise ValueError("Bounding box minimums must not exceed its maximums")
+        first_row, last_row = np.clip(np.floor((np.array([lat_min, lat_max]) + 90)
+                                               / self.cell_deg), 0, self.n_rows - 1).astype(int)
+        first_col, last_col = np.clip(np.floor((np.array([lon_min, lon_max]) + 180)
+                                               / self.cell_deg), 0, self.n_cols - 1).astype(int)
+        row_ids = np.arange(first_row, last_row + 1)
+        col_ids = np.arange(first_col, last_col + 1)
+        if len(row_ids) * len(col_ids) > MAX_BBOX_CELLS:
+            raise ValueError(f"Bounding box covers more than {MAX_BBOX_CELLS:,} cells")
+
+        values = np.empty((len(row_ids), len(col_ids)))
+        for tile_row in np.unique(row_ids // self.tile_cells).tolist():
+            in_rows = np.flatnonzero(row_ids // self.tile_cells == tile_row)
+            for tile_col in np.unique(col_ids // self.tile_cells).tolist():
+                in_cols = np.flatnonzero(col_ids // self.tile_cells == tile_col)
+                tile = self.tiles.get((tile_row, tile_col))
+                values[np.ix_(in_rows, in_cols)] = tile[
+                    np.ix_(row_ids[in_rows] - tile_row * self.tile_cells,
+                           col_ids[in_cols] - tile_col * self.tile_cells)]
+
+        weights = np.broadcast_to(
+            np.cos(np.radians(-90 + (row_ids + 0.5) * self.cell_deg))[:, None], values.shape)
+        counts = category_counts(values)
+        return {
+            'cells': int(values.size),
+            'min': float(values.min()),
+            'mean': float(np.average(values, weights=weights)),
+            'max': float(values.max()),
+            'categories': dict(zip(AQI_CATEGORIES, counts.tolist())),
+        }
+
+    def info(self):
+        return {'source': 'lookup' if self.lookup is not None else 'model',
+                'cell_deg': self.cell_deg, 'tile_cells': self.tile_cells,
+                'seed': self.seed, 'lru': self.tiles.stats()}
+
+
+def point_response(lat, lon, aqi):
+    return {'lat': lat, 'lon': lon, 'aqi': round(aqi, 2),
+            'category': AQI_CATEGORIES[int(category_index(np.array([aqi]))[0])]}
+
+
+def parse_coordinate(value, name, low, high):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not (math.isfinite(number) and low <= number <= high):
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return number
+
+
+def json_endpoint(handler):
+    """Send a handler's (status, payload) as JSON; ValueErrors become 400s"""
+    @functools.wraps(handler)
+    def wrapper(self):
+        try:
+            status, payload = handler(self)
+        except ValueError as e:
+            status, payload = 400, {'error': str(e)}
+        except Exception as e:
+            status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+        self.send_json(status, payload)
+    return wrapper
+
+
+class AQIRequestHandler(BaseHTTPRequestHandler):
+    """JSON endpoints over the server's AQIService"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without TCP_NODELAY keep-alive
+    # clients stall ~40 ms per request on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def query(self):
+        params = parse_qs(urlparse(self.path).query)
+        return {name: values[-1] for name, values in params.items()}
+
+    @json_endpoint
+    def do_GET(self):
+        service = self.server.service
+        route = urlparse(self.path).path.rstrip('/')
+        params = self.query()
+        if route == '/aqi':
+            lat = parse_coordinate(params.get('lat'), 'lat', -90, 90)
+            lon = parse_coordinate(params.get('lon'), 'lon', -180, 180)
+            return 200, point_response(lat, lon, service.point(lat, lon))
+        if route == '/aqi/bbox':
+            bbox = [parse_coordinate(params.get(name), name, low, high)
+                    for name, low, high in (('lat_min', -90, 90), ('lat_max', -90, 90),
+                                            ('lon_min', -180, 180), ('lon_max', -180, 180))]
+            return 200, dict(service.bbox(*bbox), bbox=bbox)
+        if route == '/health':
+            return 200, service.info()
+        return 404, {'error': f"Unknown path {route or '/'}"}
+
+    @json_endpoint
+    def do_POST(self):
+        service = self.server.service
+        route = urlparse(self.path).path.rstrip('/')
+        if route != '/aqi/batch':
+            return 404, {'error': f"Unknown path {route or '/'}"}
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+            points = np.asarray(body['points'], dtype=np.float64).reshape(-1, 2)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Body must be {"points": [[lat, lon], ...]}')
+        if len(points) > MAX_BATCH_POINTS:
+            raise ValueError(f"At most {MAX_BATCH_POINTS:,} points per batch")
+        if not (np.isfinite(points).all() and (np.abs(points[:, 0]) <= 90).all()
+                and (np.abs(points[:, 1]) <= 180).all()):
+            raise ValueError('Points must be finite (lat, lon) pairs within range')
+        values = service.points(points[:, 0], points[:, 1])
+        return 200, {'count': len(values), 'aqi': np.round(values, 2).tolist()}
+
+
+class AQIServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding one AQIService"""
+
+    daemon_threads = True
+    # socketserver's default backlog of 5 drops bursts of new connections into
+    # a one-second SYN retry
+    request_queue_size = 128
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, AQIRequestHandler)
+        self.service = service
+        self.verbose = verbose
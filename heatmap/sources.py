@@ -0,0 +1,126 @@
+"""
+Source-influence engine
+Each emission source adds intensity * exp(-d / scale) to the grid, where d is the
+great-circle distance, cut off at a fixed radius. Sources are indexed by latitude
+and each one only touches the rows and columns of the grid that fall inside its
+radius, so cost scales with the number of affected cells rather than with
+sources x grid size.
+"""
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+# The original model decayed influence over 5 degrees and it is negligible past ~30
+DEFAULT_SCALE_KM = 5 * KM_PER_DEGREE
+DEFAULT_RADIUS_KM = 30 * KM_PER_DEGREE
+
+
+class SourceIndex:
+    """Point sources sorted by latitude so a band of rows can find its candidates by bisection"""
+
+    def __init__(self, lats, lons, intensities):
+        lats = np.asarray(lats, dtype=np.float64)
+        order = np.argsort(lats, kind='stable')
+        self.order = order
+        self.lats = lats[order]
+        self.lons = np.asarray(lons, dtype=np.float64)[order]
+        self.intensities = np.asarray(intensities, dtype=np.float64)[order]
+
+    @classmethod
+    def from_cities(cls, cities):
+        """Build an index from a {name: (lat, lon, pollution_level)} table"""
+        values = np.array(list(cities.values()), dtype=np.float64).reshape(-1, 3)
+        return cls(values[:, 0], values[:, 1], values[:, 2])
+
+    def __len__(self):
+        return len(self.lats)
+
+    def candidates(self, lat_min, lat_max, radius_km):
+        """Positions of the sources that can reach any latitude in [lat_min, lat_max]"""
+        radius_deg = radius_km / KM_PER_DEGREE
+        start = np.searchsorted(self.lats, lat_min - radius_deg, side='left')
+        stop = np.searchsorted(self.lats, lat_max + radius_deg, side='right')
+        return range(start, stop)
+
+
+def as_source_index(sources):
+    """Accept either a SourceIndex or a get_major_cities-style dict"""
+    if isinstance(sources, SourceIndex):
+        return sources
+    return SourceIndex.from_cities(sources)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between broadcastable arrays of degrees"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2)**2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def longitude_windows(lons, source_lat, source_lon, radius_km):
+    """
+    Column slices of an ascending lons axis within reach of a source.
+
+    The half-width is the widest longitude span of the spherical cap around the
+    source; windows that cross the antimeridian are split in two.
+    """
+    radius = radius_km / EARTH_RADIUS_KM
+    cos_lat = np.cos(np.radians(source_lat))
+    if radius >= np.pi / 2 or np.sin(radius) >= cos_lat:
+        return [slice(0, len(lons))]  # the cap covers a pole: every longitude is in reach
+
+    half_width = np.degrees(np.arcsin(np.sin(radius) / cos_lat))
+    low, high = source_lon - half_width, source_lon + half_width
+    spans = [(max(low, -180.0), min(high, 180.0))]
+    if low < -180:
+        spans.append((low + 360, 180.0))
+    if high > 180:
+        spans.append((-180.0, high - 360))
+    return [slice(np.searchsorted(lons, a, side='left'), np.searchsorted(lons, b, side='right'))
+            for a, b in spans]
+
+
+def accumulate_influence(out, lats, lons, sources, radius_km=DEFAULT_RADIUS_KM,
+                         scale_km=DEFAULT_SCALE_KM, positions=None):
+    """
+    Add the cut-off exponential influence of each source onto out (len(lats) x len(lons)).
+
+    `positions` restricts the sum to those positions in the index; by default
+    every source that can reach the rows is used. Returns the number of grid
+    cells evaluated.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if len(lats) == 0 or len(lons) == 0:
+        return 0
+
+    radius_deg = radius_km / KM_PER_DEGREE
+    if positions is None:
+        positions = sources.candidates(lats.min(), lats.max(), radius_km)
+
+    touched = 0
+    for k in positions:
+        source_lat, source_lon = sources.lats[k], sources.lons[k]
+        rows = slice(np.searchsorted(lats, source_lat - radius_deg, side='left'),
+                     np.searchsorted(lats, source_lat + radius_deg, side='right'))
+        if rows.start >= rows.stop:
+            continue
+        for cols in longitude_windows(lons, source_lat, source_lon, radius_km):
+            if cols.start >= cols.stop:
+                continue
+            dist = haversine_km(lats[rows, None], lons[None, cols], source_lat, source_lon)
+            kernel = sources.intensities[k] * np.exp(-dist / scale_km)
+            kernel[dist > radius_km] = 0
+            out[rows, cols] += kernel
+            touched += kernel.size
+    return touched
+
+
+def source_influence(lats, lons, sources, radius_km=DEFAULT_RADIUS_KM, scale_km=DEFAULT_SCALE_KM):
+    """Influence grid of all sources over the lats x lons grid"""
+    out = np.zeros((len(lats), len(lons)))
+    accumulate_influence(out, lats, lons, as_source_index(sources), radius_km, scale_km)
+    return out
@@ -0,0 +1,214 @@
+"""
+Single-pass summary statistics for AQI grids
+A GridStats accumulator is fed latitude bands of the grid (or the whole grid at
+once) and keeps running totals: the AQI category histogram, latitude-band means,
+cos-latitude area-weighted regional means from lat/lon polygons, and a fine
+value histogram from which percentiles are read. Each band is scanned a fixed
+small number of times however many statistics are reported, so the figure and
+the text summaries no longer re-scan the grid per category or per region.
+"""
+
+import numpy as np
+
+# The one AQI category table, used by the statistics, the tile palette and the
+# create_aqi_colormap norms; a value on a boundary belongs to the lower category
+# (Good is 0-50 inclusive, Moderate 51-100, ...)
+AQI_BOUNDS = (0, 50, 100, 150, 200, 300, 500)
+AQI_CATEGORIES = ('Good', 'Moderate', 'Unhealthy for Sensitive Groups', 'Unhealthy',
+                  'Very Unhealthy', 'Hazardous')
+
+# Fine histogram used for percentiles; values outside the range land in the end bins
+VALUE_RANGE = (0.0, 1000.0)
+VALUE_BIN_WIDTH = 0.1
+
+LATITUDE_BAND_DEG = 10
+
+# Rough continental outlines as (lon, lat) vertices
+REGIONS = {
+    'North America': [(-168, 66), (-140, 70), (-95, 72), (-60, 60), (-52, 47), (-80, 25),
+                      (-82, 8), (-97, 16), (-110, 23), (-125, 40), (-140, 58), (-168, 54)],
+    'South America': [(-81, 12), (-60, 11), (-35, -5), (-40, -22), (-58, -38), (-68, -56),
+                      (-75, -50), (-72, -18), (-81, -5)],
+    'Europe': [(-10, 36), (-10, 58), (5, 62), (10, 71), (30, 71), (40, 67), (60, 68),
+               (60, 50), (40, 45), (28, 41), (20, 36), (5, 38)],
+    'Africa': [(-17, 21), (-6, 36), (10, 37), (32, 32), (35, 28), (43, 12), (52, 12),
+               (40, -5), (40, -15), (33, -27), (20, -35), (12, -18), (9, -1), (-10, 5),
+               (-17, 14)],
+    'Asia': [(28, 41), (40, 45), (60, 50), (60, 68), (75, 73), (105, 78), (140, 73),
+             (180, 70), (180, 62), (160, 55), (142, 45), (130, 35), (122, 30), (121, 20),
+             (110, 10), (104, 1), (95, 5), (92, 20), (80, 8), (73, 20), (60, 25), (56, 26),
+             (45, 13), (35, 30), (35, 36)],
+    'Oceania': [(112, -10), (155, -10), (180, -33), (180, -48), (165, -48), (145, -44),
+                (113, -36)],
+}
+
+
+def category_index(values, bounds=AQI_BOUNDS):
+    """AQI category (0 = Good ... 5 = Hazardous) of each value"""
+    return np.digitize(values, bounds[1:-1], right=True)
+
+
+def norm_bounds(bounds=AQI_BOUNDS):
+    """
+    BoundaryNorm boundaries that bin like category_index. BoundaryNorm bins are
+    [b_i, b_i+1), so each inner bound moves up by one float step to keep a value
+    on it in the lower category.
+    """
+    inner = np.nextafter(np.asarray(bounds[1:-1], dtype=np.float64), np.inf)
+    return [bounds[0], *inner.tolist(), bounds[-1]]
+
+
+def category_counts(values, bounds=AQI_BOUNDS):
+    """Number of values in each AQI category"""
+    return np.bincount(category_index(np.ravel(values), bounds), minlength=len(bounds) - 1)
+
+
+def points_in_polygon(lats, lons, polygon):
+    """Even-odd rule test of the lats x lons grid points against a (lon, lat) polygon"""
+    vertices = np.asarray(polygon, dtype=np.float64)
+    inside = np.zeros((len(lats), len(lons)), dtype=bool)
+    lat_in = (lats >= vertices[:, 1].min()) & (lats <= vertices[:, 1].max())
+    lon_in = (lons >= vertices[:, 0].min()) & (lons <= vertices[:, 0].max())
+    if not lat_in.any() or not lon_in.any():
+        return inside
+
+    # Only test points inside the polygon's bounding box
+    y = lats[lat_in][:, None]
+    x = lons[lon_in][None, :]
+    hits = np.zeros((len(y), x.shape[1]), dtype=bool)
+    for (x0, y0), (x1, y1) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        if y0 == y1:
+            continue
+        crosses = (y0 > y) != (y1 > y)
+        hits ^= crosses & (x < x0 + (y - y0) * (x1 - x0) / (y1 - y0))
+    inside[np.ix_(lat_in, lon_in)] = hits
+    return inside
+
+
+def region_labels(lats, lons, regions=REGIONS):
+    """Index into `regions` of each grid point, len(regions) where none contains it"""
+    labels = np.full((len(lats), len(lons)), len(regions), dtype=np.intp)
+    # Earlier regions win where outlines overlap
+    for i, polygon in reversed(list(enumerate(regions.values()))):
+        labels[points_in_polygon(lats, lons, polygon)] = i
+    return labels
+
+
+class GridStats:
+    """Running statistics of an AQI grid over the lats x lons axes"""
+
+    def __init__(self, lats, lons, regions=REGIONS, bounds=AQI_BOUNDS,
+                 band_deg=LATITUDE_BAND_DEG):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.regions = dict(regions)
+        self.bounds = tuple(bounds)
+        self.band_edges = np.arange(-90, 90 + band_deg, band_deg)
+
+        n_regions = len(self.regions) + 1
+        self.categories = np.zeros(len(self.bounds) - 1, dtype=np.int64)
+        self.band_sums = np.zeros(len(self.band_edges) - 1)
+        self.band_counts = np.zeros(len(self.band_edges) - 1, dtype=np.int64)
+        self.region_sums = np.zeros(n_regions)
+        self.region_weights = np.zeros(n_regions)
+        n_bins = int(round((VALUE_RANGE[1] - VALUE_RANGE[0]) / VALUE_BIN_WIDTH))
+        self.value_counts = np.zeros(n_bins, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.weighted_total = 0.0
+        self.weight = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def shape(self):
+        return len(self.lats), len(self.lons)
+
+    def update(self, block, row_start=0):
+        """Add rows row_start:row_start + len(block) of the grid"""
+        block = np.asarray(block, dtype=np.float64)
+        rows = slice(row_start, row_start + block.shape[0])
+        lats = self.lats[rows]
+        if block.shape != (len(lats), len(self.lons)):
+            raise ValueError(f"Block of shape {block.shape} does not fit rows {rows.start}:{rows.stop}")
+        flat = block.ravel()
+
+        self.categories += np.bincount(category_index(flat, self.bounds),
+                                       minlength=len(self.categories))
+        bins = ((flat - VALUE_RANGE[0]) / VALUE_BIN_WIDTH).astype(np.intp)
+        np.clip(bins, 0, len(self.value_counts) - 1, out=bins)
+        self.value_counts += np.bincount(bins, minlength=len(self.value_counts))
+
+        # Row sums feed the overall, latitude-band and area-weighted totals
+        row_sums = block.sum(axis=1)
+        bands = np.clip(np.digitize(lats, self.band_edges) - 1, 0, len(self.band_sums) - 1)
+        self.band_sums += np.bincount(bands, weights=row_sums, minlength=len(self.band_sums))
+        self.band_counts += np.bincount(bands, minlength=len(self.band_sums)) * block.shape[1]
+
+        row_weights = np.cos(np.radians(lats))
+        labels = region_labels(lats, self.lons, self.regions).ravel()
+        cell_weights = np.repeat(row_weights, block.shape[1])
+        self.region_sums += np.bincount(labels, weights=flat * cell_weights,
+                                        minlength=len(self.region_sums))
+        self.region_weights += np.bincount(labels, weights=cell_weights,
+                                           minlength=len(self.region_sums))
+
+        self.count += flat.size
+        self.total += row_sums.sum()
+        self.weighted_total += row_sums @ row_weights
+        self.weight += row_weights.sum() * block.shape[1]
+        if flat.size:
+            self.min = min(self.min, flat.min())
+            self.max = max(self.max, flat.max())
+        return self
+
+    def update_chunked(self, grid, chunk_rows=None):
+        """Add a whole grid, reading it chunk_rows rows at a time (e.g. from a memmap)"""
+        chunk_rows = chunk_rows or len(grid)
+        for row_start in range(0, len(grid), chunk_rows):
+            self.update(grid[row_start:row_start + chunk_rows], row_start)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+    @property
+    def area_weighted_mean(self):
+        return self.weighted_total / self.weight if self.weight else np.nan
+
+    def band_means(self):
+        """(band lower edges, mean AQI per latitude band), NaN for empty bands"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.band_edges[:-1], self.band_sums / self.band_counts
+
+    def region_means(self):
+        """Area-weighted mean AQI of each region"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = self.region_sums[:-1] / self.region_weights[:-1]
+        return dict(zip(self.regions, means))
+
+    def percentiles(self, q):
+        """Percentiles read from the fine histogram, accurate to VALUE_BIN_WIDTH"""
+        q = np.asarray(q, dtype=np.float64)
+        cumulative = np.cumsum(self.value_counts)
+        targets = q / 100 * self.count
+        bins = np.searchsorted(cumulative, targets, side='right')
+        bins = np.clip(bins, 0, len(cumulative) - 1)
+        before = np.where(bins > 0, cumulative[bins - 1], 0)
+        in_bin = np.maximum(self.value_counts[bins], 1)
+        values = VALUE_RANGE[0] + (bins + (targets - before) / in_bin) * VALUE_BIN_WIDTH
+        return np.clip(values, self.min, self.max)
+
+    def histogram(self, bins=50):
+        """Counts and edges of `bins` equal bins between the min and max value"""
+        edges = np.linspace(self.min, self.max, bins + 1)
+        centers = VALUE_RANGE[0] + (np.arange(len(self.value_counts)) + 0.5) * VALUE_BIN_WIDTH
+        index = np.clip(np.searchsorted(edges, centers, side='right') - 1, 0, bins - 1)
+        counts = np.bincount(index, weights=self.value_counts, minlength=bins)
+        return counts, edges
+
+
+def grid_statistics(aqi_grid, lats, lons, chunk_rows=None, **kwargs):
+    """GridStats of a complete grid"""
+    return GridStats(lats, lons, **kwargs).update_chunked(aqi_grid, chunk_rows)
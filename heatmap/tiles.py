@@ -0,0 +1,200 @@
+"""
+XYZ slippy-map tile renderer for AQI grids
+The AQI BoundaryNorm is applied once to the whole grid as a NumPy category raster,
+each 256px Web Mercator tile is a fancy-indexed lookup into that raster, and tiles
+are written as palette PNGs with zlib. No matplotlib figure is involved.
+"""
+
+import hashlib
+import json
+import math
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+TILE_SIZE = 256
+MANIFEST_NAME = 'tiles.json'
+
+# Mercator cannot represent the poles; tiles stop at this latitude
+MAX_MERCATOR_LAT = 85.0511287798066
+
+# Per-worker state set up by _init_worker
+_worker = {}
+
+
+def color_lookup(cmap, norm):
+    """RGBA palette for the BoundaryNorm bins of create_aqi_colormap, plus transparent"""
+    import matplotlib.colors as colors
+
+    palette = np.round(colors.to_rgba_array(cmap.colors) * 255).astype(np.uint8)
+    boundaries = np.asarray(norm.boundaries, dtype=np.float64)
+    if len(palette) != len(boundaries) - 1:
+        raise ValueError(f"Colormap has {len(palette)} colors for "
+                         f"{len(boundaries) - 1} norm bins")
+    transparent = np.zeros((1, 4), dtype=np.uint8)
+    return boundaries, np.vstack([palette, transparent])
+
+
+def categorize(aqi_grid, boundaries, n_colors):
+    """
+    Map AQI values to palette indices the way BoundaryNorm does.
+
+    With the heatmap.stats.norm_bounds boundaries of create_aqi_colormap this
+    is heatmap.stats.category_index: a value on an AQI bound takes the lower
+    category. Values outside the boundaries take the end colors, as the
+    ListedColormap under/over defaults do; NaN maps to the transparent entry.
+    """
+    categories = np.clip(np.digitize(aqi_grid, boundaries) - 1, 0, n_colors - 1).astype(np.uint8)
+    categories[np.isnan(aqi_grid)] = n_colors
+    return categories
+
+
+def tile_lonlat(z, x, y):
+    """Longitudes and latitudes of the pixel centres along a tile's columns and rows"""
+    n_pixels = TILE_SIZE * 2**z
+    offsets = np.arange(TILE_SIZE) + 0.5
+    lons = (x * TILE_SIZE + offsets) / n_pixels * 360.0 - 180.0
+    mercator_y = math.pi * (1 - 2 * (y * TILE_SIZE + offsets) / n_pixels)
+    lats = np.degrees(np.arctan(np.sinh(mercator_y)))
+    return lons, lats
+
+
+def tile_range(z, bbox):
+    """Inclusive x and y tile ranges covering a (lat_min, lat_max, lon_min, lon_max) bbox"""
+    lat_min, lat_max, lon_min, lon_max = bbox
+    n_tiles = 2**z
+
+    def tile_x(lon):
+        return min(n_tiles - 1, max(0, int((lon + 180.0) / 360.0 * n_tiles)))
+
+    def tile_y(lat):
+        lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+        mercator_y = math.asinh(math.tan(math.radians(lat)))
+        return min(n_tiles - 1, max(0, int((1 - mercator_y / math.pi) / 2 * n_tiles)))
+
+    return (tile_x(lon_min), tile_x(lon_max)), (tile_y(lat_max), tile_y(lat_min))
+
+
+def grid_indices(coords, axis):
+    """Nearest grid index along an evenly spaced axis, -1 where outside it"""
+    step = (axis[-1] - axis[0]) / (len(axis) - 1)
+    index = np.rint((coords - axis[0]) / step).astype(np.int64)
+    index[(index < 0) | (index >= len(axis))] = -1
+    return index
+
+
+def render_tile(categories, lats, lons, z, x, y, transparent):
+    """Palette-index image for one tile, or None when it does not touch the grid"""
+    tile_lons, tile_lats = tile_lonlat(z, x, y)
+    rows = grid_indices(tile_lats, lats)
+    cols = grid_indices(tile_lons, lons)
+    if (rows < 0).all() or (cols < 0).all():
+        return None
+
+    image = categories[rows[:, None], cols[None, :]]
+    image[(rows < 0)[:, None] | (cols < 0)[None, :]] = transparent
+    return image
+
+
+def _png_chunk(tag, data):
+    return (struct.pack('>I', len(data)) + tag + data +
+            struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+
+def encode_palette_png(image, palette):
+    """Encode a 2-D uint8 index image as an 8-bit palette PNG"""
+    height, width = image.shape
+    # Filter type 0 (none) at the start of every scanline
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), image]).tobytes()
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+        _png_chunk(b'PLTE', palette[:, :3].tobytes()),
+        _png_chunk(b'tRNS', palette[:, 3].tobytes()),
+        _png_chunk(b'IDAT', zlib.compress(raw, 6)),
+        _png_chunk(b'IEND', b''),
+    ])
+
+
+def _init_worker(categories, lats, lons, palette, out_dir, previous_hashes):
+    _worker.update(categories=categories, lats=lats, lons=lons, palette=palette,
+                   out_dir=out_dir, previous_hashes=previous_hashes)
+
+
+def _render_tiles(tiles):
+    """Render a batch of tiles, writing only those whose content hash changed"""
+    previous_hashes = _worker['previous_hashes']
+    results = []
+    transparent = len(_worker['palette']) - 1
+    for z, x, y in tiles:
+        key = f"{z}/{x}/{y}"
+        image = render_tile(_worker['categories'], _worker['lats'], _worker['lons'],
+                            z, x, y, transparent)
+        if image is None or (image == transparent).all():
+            continue
+
+        digest = hashlib.sha1(image.tobytes()).hexdigest()
+        path = os.path.join(_worker['out_dir'], str(z), str(x), f"{y}.png")
+        written = False
+        if previous_hashes.get(key) != digest or not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(encode_palette_png(image, _worker['palette']))
+            written = True
+        results.append((key, digest, written))
+    return results
+
+
+def render_tile_pyramid(aqi_grid, lats, lons, cmap, norm, out_dir, min_zoom=0, max_zoom=5,
+                        workers=1):
+    """
+    Write a z/x/y pyramid of 256px PNG tiles for the grid under out_dir.
+
+    A manifest of per-tile content hashes is kept next to the tiles; tiles whose
+    hash matches the previous run are not re-encoded. Returns (written, skipped).
+    """
+    boundaries, palette = color_lookup(cmap, norm)
+    categories = categorize(np.asarray(aqi_grid), boundaries, len(palette) - 1)
+    lats, lons = np.asarray(lats), np.asarray(lons)
+
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            previous_hashes = json.load(f)
+    except (OSError, ValueError):
+        previous_hashes = {}
+
+    bbox = (lats.min(), lats.max(), lons.min(), lons.max())
+    batches = []
+    for z in range(min_zoom, max_zoom + 1):
+        (x_min, x_max), (y_min, y_max) = tile_range(z, bbox)
+        # One task per tile column keeps tasks coarse enough to amortize IPC
+        for x in range(x_min, x_max + 1):
+            batches.append([(z, x, y) for y in range(y_min, y_max + 1)])
+
+    os.makedirs(out_dir, exist_ok=True)
+    initargs = (categories, lats, lons, palette, out_dir, previous_hashes)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=initargs) as pool:
+            results = [item for batch in pool.map(_render_tiles, batches) for item in batch]
+    else:
+        _init_worker(*initargs)
+        results = [item for batch in batches for item in _render_tiles(batch)]
+
+    hashes = {key: digest for key, digest, _ in results}
+    # Tiles from the previous run that are now empty or out of range
+    for key in previous_hashes.keys() - hashes.keys():
+        try:
+            os.unlink(os.path.join(out_dir, f"{key}.png"))
+        except OSError:
+            pass
+
+    with open(manifest_path, 'w') as f:
+        json.dump(hashes, f, sort_keys=True)
+
+    written = sum(1 for _, _, was_written in results if was_written)
+    return written, len(results) - written
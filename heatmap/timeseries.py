@@ -0,0 +1,188 @@
+"""
+Time-series world grids
+`python -m heatmap timeseries` predicts hourly frames of the world grid into one
+(T, H, W) array store. Each latitude band's static feature columns and population
+noise are built once. Per frame only the weather column and a diurnal factor on
+the city influence change, and all frames of a band are predicted in one batched
+call. With --keyframe-every k only every k-th frame (and the last) is predicted
+and the frames in between are interpolated linearly.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from heatmap.features import FEATURE_SCALES, N_FEATURES, NoiseStreams, iter_feature_tiles
+from heatmap.pipeline import DTYPES, store_aqi
+from heatmap.timings import count_cells, phase
+
+DEFAULT_TIMESERIES_DIR = 'timeseries'
+STORE_VERSION = 1
+
+# Weather fields are drawn every WEATHER_STEP_HOURS and interpolated in between,
+# so neighbouring hours see a slowly changing field instead of fresh noise
+WEATHER_STEP_HOURS = 6
+WEATHER_STD = 5
+# Spawn-key prefix of the weather steps, clear of the NoiseStreams term indices
+WEATHER_STEP_KEY = len(NoiseStreams.TERMS)
+
+# City emissions follow local solar time, peaking with the morning traffic
+DIURNAL_AMPLITUDE = 0.3
+DIURNAL_PEAK_HOUR = 8
+
+
+def diurnal_factor(hours, lons):
+    """(T, n_lons) multiplier of the city influence at UTC `hours` and longitudes `lons`"""
+    local = (np.asarray(hours, dtype=np.float64)[:, None] + np.asarray(lons)[None, :] / 15) % 24
+    return 1 + DIURNAL_AMPLITUDE * np.cos(2 * np.pi * (local - DIURNAL_PEAK_HOUR) / 24)
+
+
+def weather_fields(noise, hours, row_start, row_stop, n_cols):
+    """
+    (T, rows, n_cols) weather factor for a band of rows at each hour.
+
+    Step k of the weather field is drawn row by row like the snapshot noise, from
+    streams under spawn key (WEATHER_STEP_KEY, k) of the run's SeedSequence, so
+    any frame and band can be regenerated alone.
+    """
+    steps = np.asarray(hours, dtype=np.float64) / WEATHER_STEP_HOURS
+    lower = np.floor(steps).astype(np.int64)
+    weight = (steps - lower)[:, None, None]
+    root = noise.root
+    fields = {}
+    for step in np.unique(np.concatenate([lower, lower + 1])).tolist():
+        stream = np.random.SeedSequence(root.entropy,
+                                        spawn_key=root.spawn_key + (WEATHER_STEP_KEY, step))
+        fields[step] = NoiseStreams(stream, ('weather',), noise.window).draw(
+            'weather', row_start, row_stop, n_cols, 'normal', 0, WEATHER_STD)
+    before = np.stack([fields[step] for step in lower.tolist()])
+    after = np.stack([fields[step + 1] for step in lower.tolist()])
+    return (1 - weight) * before + weight * after
+
+
+def keyframe_weights(n_frames, keyframe_every=1):
+    """
+    Keyframe indices plus, per frame, the (lower, upper) keyframe positions and upper weight.
+
+    Keyframes are every keyframe_every-th frame and the last one.
+    """
+    if keyframe_every < 1:
+        raise ValueError("keyframe_every must be at least 1")
+    keys = np.unique(np.append(np.arange(0, n_frames, keyframe_every), n_frames - 1))
+    frames = np.arange(n_frames)
+    upper = np.minimum(np.searchsorted(keys, frames, side='left'), len(keys) - 1)
+    lower = np.where(keys[upper] == frames, upper, upper - 1)
+    span = keys[upper] - keys[lower]
+    weight = np.divide(frames - keys[lower], span, out=np.zeros(n_frames), where=span > 0)
+    return keys, lower, upper, weight
+
+
+class TimeSeriesStore:
+    """
+    A (T, H, W) AQI array on disk with its hours and axes.
+
+    Frames are stored in one C-ordered .npy file, so a frame is a contiguous
+    slice that the timeline can memory-map and read alone. meta.json records
+    the UTC hours of the frames, the grid axes and which frames were keyframes.
+    """
+
+    def __init__(self, path, frames, meta):
+        self.path = path
+        self.frames = frames
+        self.meta = meta
+
+    @classmethod
+    def create(cls, path, hours, lats, lons, dtype=np.float64, meta=None):
+        os.makedirs(path, exist_ok=True)
+        shape = (len(hours), len(lats), len(lons))
+        frames = np.lib.format.open_memmap(os.path.join(path, 'aqi.npy'), mode='w+',
+                                           dtype=dtype, shape=shape)
+        meta = dict(meta or {}, version=STORE_VERSION, hours=[float(h) for h in hours],
+                    lats=[float(lats[0]), float(lats[-1]), len(lats)],
+                    lons=[float(lons[0]), float(lons[-1]), len(lons)])
+        return cls(path, frames, meta)
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map an existing store read-only"""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"{path} is time-series store version {meta.get('version')}, "
+                             f"expected {STORE_VERSION}")
+        return cls(path, np.load(os.path.join(path, 'aqi.npy'), mmap_mode='r'), meta)
+
+    def save_meta(self):
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f)
+
+    @property
+    def hours(self):
+        return np.array(self.meta['hours'])
+
+    @property
+    def lats(self):
+        return np.linspace(*self.meta['lats'])
+
+    @property
+    def lons(self):
+        return np.linspace(*self.meta['lons'])
+
+    def frame(self, hour):
+        """The stored frame closest to `hour`"""
+        return self.frames[int(np.argmin(np.abs(self.hours - hour)))]
+
+
+def predict_timeseries(model, predict, lats, lons, cities, hours, chunk_rows=16, seed=None,
+                       out=None, static=None, dtype='float64', keyframe_every=1):
+    """
+    Predict AQI frames at UTC `hours` over the lats x lons grid into a (T, H, W) array.
+
+    `predict` is called like predict_world_aqi, once per latitude band with the
+    features of every keyframe stacked. Population noise and the per-cell
+    prediction noise are the snapshot's (see NoiseStreams), so they stay put
+    between frames; the weather column and the city diurnal cycle vary.
+    """
+    feature_dtype, grid_dtype = DTYPES[dtype]
+    shape = (len(hours), len(lats), len(lons))
+    if out is None:
+        out = np.empty(shape, dtype=grid_dtype)
+    elif out.shape != shape:
+        raise ValueError(f"Output frames have shape {out.shape}, expected {shape}")
+
+    keys, lower, upper, weight = keyframe_weights(len(hours), keyframe_every)
+    key_hours = np.asarray(hours, dtype=np.float64)[keys]
+    diurnal = diurnal_factor(key_hours, lons)[:, None, :]
+    weight = weight[:, None, None]
+
+    n_cols = len(lons)
+    noise = NoiseStreams(seed)
+    buffer = np.empty((len(keys), chunk_rows, n_cols, N_FEATURES), dtype=feature_dtype)
+    tiles = iter_feature_tiles(lats, lons, cities, chunk_rows, noise, dtype=feature_dtype,
+                               static=static)
+    while True:
+        with phase('features'):
+            tile = next(tiles, None)
+            if tile is None:
+                break
+            row_start, row_stop, features = tile
+            n_rows = row_stop - row_start
+            batch = buffer[:, :n_rows]
+            count_cells(batch.shape[0] * n_rows * n_cols)
+            batch[...] = features.reshape(n_rows, n_cols, N_FEATURES)
+            np.multiply(batch[..., 0], diurnal, out=batch[..., 0], casting='unsafe')
+            np.divide(weather_fields(noise, key_hours, row_start, row_stop, n_cols),
+                      FEATURE_SCALES[7], out=batch[..., 7], casting='unsafe')
+        with phase('predict'):
+            count_cells(len(keys) * n_rows * n_cols)
+            cell_noise = noise.predict_noise(row_start, row_stop, n_cols)
+            predictions = predict(model, batch.reshape(-1, N_FEATURES), None, None,
+                                  noise=np.tile(cell_noise, len(keys)))
+            key_frames = predictions.reshape(batch.shape[:3])
+            frames = key_frames[lower] * (1 - weight) + key_frames[upper] * weight
+            store_aqi(frames, out[:, row_start:row_stop])
+
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
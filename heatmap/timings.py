@@ -0,0 +1,293 @@
+"""
+Phase timings and run instrumentation for the heatmap pipeline
+Code wraps its stages in `phase(name)` and reports the grid cells a stage
+handled with `count_cells(n)`; wall time, CPU time, peak-RSS growth and cells
+accumulate per name on the module-level TIMER so nested helpers do not need a
+timer passed in. `instrumented()` wraps a whole run: it can append the phase
+totals to a JSON-lines log and run the pipeline under cProfile.
+"""
+
+import cProfile
+import datetime
+import json
+import os
+import platform
+import pstats
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Frames below this share of the profile are left out of the folded stacks
+MIN_FOLDED_SECONDS = 1e-5
+MAX_FOLDED_DEPTH = 128
+
+# Phases faster than this are too noisy to call regressed
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def _cpu_seconds():
+    """CPU time of this process plus its reaped children (e.g. finished worker pools)"""
+    seconds = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        seconds += children.ru_utime + children.ru_stime
+    return seconds
+
+
+def peak_rss_mb():
+    """High-water resident set size of this process in MB (0 where unavailable)"""
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _sample():
+    return [time.perf_counter(), _cpu_seconds(), peak_rss_mb()]
+
+
+class PhaseTimer:
+    """
+    Accumulate wall seconds, CPU seconds, peak-RSS growth and cells per named phase.
+
+    Phases may nest; a nested phase's costs are charged to it alone and not to
+    the enclosing phase, so the phase totals add up to the run's. Phases are
+    kept in first-seen order.
+    """
+
+    METRICS = ('wall_s', 'cpu_s', 'rss_delta_mb')
+
+    def __init__(self):
+        self.phases = {}
+        self._stack = []
+
+    @contextmanager
+    def phase(self, name):
+        start = _sample()
+        frame = {'name': name, 'child': [0.0, 0.0, 0.0], 'cells': 0}
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            elapsed = [b - a for a, b in zip(start, _sample())]
+            self._stack.pop()
+            totals = self.phases.setdefault(name, dict.fromkeys(self.METRICS, 0.0))
+            for metric, total, child in zip(self.METRICS, elapsed, frame['child']):
+                totals[metric] += total - child
+            totals['calls'] = totals.get('calls', 0) + 1
+            totals['cells'] = totals.get('cells', 0) + frame['cells']
+            if self._stack:
+                parent = self._stack[-1]['child']
+                for k, total in enumerate(elapsed):
+                    parent[k] += total
+
+    def count_cells(self, n):
+        """Credit n grid cells to the innermost open phase"""
+        if self._stack:
+            self._stack[-1]['cells'] += int(n)
+
+    def reset(self):
+        self.phases.clear()
+        self._stack.clear()
+
+    def records(self):
+        """One dict per phase with its totals and cells per second"""
+        records = []
+        for name, totals in self.phases.items():
+            record = dict(phase=name, **totals)
+            record['cells_per_s'] = (totals['cells'] / totals['wall_s']
+                                     if totals['cells'] and totals['wall_s'] > 0 else None)
+            records.append(record)
+        return records
+
+    def report(self):
+        """Format the phases as an aligned table with a total line"""
+        width = max([len(name) for name in self.phases] + [5])
+        lines = [f"   {'phase':<{width}}  {'wall':>9} {'cpu':>9} {'+rss MB':>8} {'cells/s':>12}"]
+        for record in self.records():
+            rate = f"{record['cells_per_s']:,.0f}" if record['cells_per_s'] else '-'
+            lines.append(f"   {record['phase']:<{width}}  {record['wall_s']:8.3f}s "
+                         f"{record['cpu_s']:8.3f}s {record['rss_delta_mb']:8.1f} {rate:>12}")
+        totals = [sum(totals[metric] for totals in self.phases.values())
+                  for metric in self.METRICS]
+        lines.append(f"   {'total':<{width}}  {totals[0]:8.3f}s {totals[1]:8.3f}s "
+                     f"{totals[2]:8.1f}")
+        return "\n".join(lines)
+
+    def write_log(self, path, command, status='ok', options=None):
+        """
+        Append this run's phases to a JSON-lines log, one line per phase.
+
+        Every line carries the run id, start time, command, status, host and
+        the JSON-able command line options, so runs can be grouped and compared.
+        """
+        run = {
+            'run': uuid.uuid4().hex[:12],
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'command': command,
+            'status': status,
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'options': {key: value for key, value in (options or {}).items()
+                        if isinstance(value, (str, int, float, bool, list, type(None)))},
+        }
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a') as f:
+            for record in self.records():
+                f.write(json.dumps(dict(run, **record)) + '\n')
+        return run['run']
+
+
+TIMER = PhaseTimer()
+
+
+def phase(name):
+    """Time a block under `name` on the shared timer"""
+    return TIMER.phase(name)
+
+
+def count_cells(n):
+    """Credit n grid cells to the innermost open phase of the shared timer"""
+    TIMER.count_cells(n)
+
+
+def _frame_label(func):
+    filename, line, name = func
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(';', ',')
+
+
+def folded_stacks(stats):
+    """
+    Collapsed "caller;callee;... microseconds" lines from a pstats.Stats.
+
+    cProfile records caller/callee edges rather than whole stacks, so each
+    function's time is split between its callers in proportion to the edge
+    times, as flameprof does. The lines load into flamegraph.pl and speedscope.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in stats.stats.items()
+             if not any(caller in stats.stats for caller in entry[4])]
+
+    lines = {}
+
+    def walk(func, stack, seconds):
+        _, _, own, total, _ = stats.stats[func]
+        scale = seconds / total if total > 0 else 0.0
+        stack = stack + [_frame_label(func)]
+        key = ';'.join(stack)
+        lines[key] = lines.get(key, 0.0) + own * scale
+        if len(stack) >= MAX_FOLDED_DEPTH:
+            return
+        for callee, edge_total in callees.get(func, []):
+            share = edge_total * scale
+            if share >= MIN_FOLDED_SECONDS and _frame_label(callee) not in stack:
+                walk(callee, stack, share)
+
+    for root in roots:
+        total = stats.stats[root][3]
+        if total >= MIN_FOLDED_SECONDS:
+            walk(root, [], total)
+    return [f"{key} {int(round(seconds * 1e6))}" for key, seconds in lines.items()
+            if seconds * 1e6 >= 1]
+
+
+def dump_profile(profiler, path):
+    """Write `path` (pstats, for snakeviz/pstats) and `path`.folded (collapsed stacks)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    profiler.dump_stats(path)
+    with open(path + '.folded', 'w') as f:
+        f.write('\n'.join(folded_stacks(pstats.Stats(path))) + '\n')
+    return path, path + '.folded'
+
+
+def add_instrumentation_arguments(parser):
+    """Register --timings, --log and --profile on an argparse parser"""
+    parser.add_argument('--timings', action='store_true',
+                        help='Report time, CPU, memory and throughput of each pipeline phase')
+    parser.add_argument('--log', default=None, metavar='PATH',
+                        help='Append per-phase metrics of this run to a JSON-lines log')
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help='Run under cProfile; write PATH (pstats) and PATH.folded (flame graph)')
+    return parser
+
+
+@contextmanager
+def instrumented(command, args):
+    """
+    Run a block with fresh phase timers, as requested by the parsed `args`.
+
+    --profile wraps the block in cProfile, --log appends the phases to the
+    JSON-lines log and --timings prints them, also when the block fails.
+    """
+    TIMER.reset()
+    profiler = cProfile.Profile() if args.profile else None
+    status = 'ok'
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            stats_path, folded_path = dump_profile(profiler, args.profile)
+            print(f"\n🔬 Profile: {stats_path} (pstats), {folded_path} (flame graph stacks)")
+        if args.log:
+            run = TIMER.write_log(args.log, command, status, vars(args))
+            print(f"📝 Logged run {run} to {args.log}")
+        if args.timings:
+            print("\n⏱️  Timings:")
+            print(TIMER.report())
+
+
+def load_runs(path, command=None):
+    """Runs of a JSON-lines log in file order, as {'run', 'time', 'command', ..., 'phases': {name: record}}"""
+    runs = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if command is not None and record['command'] != command:
+                continue
+            run = runs.setdefault(record['run'], {key: record[key] for key in
+                                                  ('run', 'time', 'command', 'status', 'host',
+                                                   'peak_rss_mb', 'options')})
+            run.setdefault('phases', {})[record['phase']] = record
+    return list(runs.values())
+
+
+def compare_runs(runs, window=5, threshold=0.2, min_seconds=MIN_REGRESSION_SECONDS):
+    """
+    Per-phase wall time of the last run against the median of up to `window` earlier ok runs.
+
+    Returns (phase, last seconds, baseline seconds or None, relative change or
+    None, regressed) tuples; a phase regresses when it is more than
+    `threshold` slower than its baseline and takes at least `min_seconds`.
+    """
+    import numpy as np
+
+    last = runs[-1]
+    earlier = [run for run in runs[:-1] if run['status'] == 'ok'][-window:]
+    rows = []
+    for name, record in last['phases'].items():
+        history = [run['phases'][name]['wall_s'] for run in earlier if name in run['phases']]
+        if not history:
+            rows.append((name, record['wall_s'], None, None, False))
+            continue
+        baseline = float(np.median(history))
+        change = record['wall_s'] / baseline - 1 if baseline > 0 else None
+        rows.append((name, record['wall_s'], baseline, change,
+                     change is not None and change > threshold and
+                     record['wall_s'] >= min_seconds))
+    return rows